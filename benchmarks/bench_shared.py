@@ -0,0 +1,126 @@
+"""Benchmarks of the coordinated link sharing detection pipeline on synthetic shares.
+
+The suites follow the asv conventions (setup, time_*, peakmem_* and track_* methods) and can also be run as a script,
+which prints the time and the peak memory allocated by every stage and the recovery of the planted rings. The shares
+are made by pycoornet._synthetic, so pycoornet must be installed (pip install -e .) or its sources in the path. From
+the root of the repository:
+
+    PYTHONPATH=src python -m benchmarks.bench_shared --sizes 10000 100000 1000000
+"""
+import argparse
+import timeit
+import tracemalloc
+from pycoornet._synthetic import make_shares, ring_recovery
+from pycoornet.shared import Shared
+from pycoornet.statistics import Statistics
+
+
+# above the ring_jitter of make_shares. The organic delays are of days, so the estimated interval would mark most of
+# the synthetic shares as coordinated.
+COORDINATION_INTERVAL = 60
+
+
+class SharedSuite:
+    params = [10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]
+    param_names = ['n_shares']
+    timeout = 3600
+
+    def setup(self, n_shares):
+        self.shares_df, self.rings = make_shares(n_shares)
+        self.coordination_interval = COORDINATION_INTERVAL
+
+    def time_estimate_coord_interval(self, n_shares):
+        Shared(self.shares_df).estimate_coord_interval()
+
+    def time_estimate_coord_interval_sketch(self, n_shares):
+        Shared(self.shares_df).estimate_coord_interval(method='sketch')
+
+    def time_coord_shares(self, n_shares):
+        Shared(self.shares_df).coord_shares(self.coordination_interval, engine='vectorized')
+
+    def time_coord_shares_sparse(self, n_shares):
+        Shared(self.shares_df).coord_shares(self.coordination_interval, engine='vectorized', graph_backend='sparse')
+
+    def time_coord_shares_differential(self, n_shares):
+        Shared(self.shares_df).coord_shares_differential(self.coordination_interval, graph_backend='sparse')
+
+    def peakmem_coord_shares(self, n_shares):
+        Shared(self.shares_df).coord_shares(self.coordination_interval, engine='vectorized', graph_backend='sparse')
+
+    def peakmem_coord_shares_differential(self, n_shares):
+        Shared(self.shares_df).coord_shares_differential(self.coordination_interval, graph_backend='sparse')
+
+    def track_ring_recall(self, n_shares):
+        _, graph, _ = Shared(self.shares_df).coord_shares(self.coordination_interval, engine='vectorized', graph_backend='sparse')
+        return ring_recovery(graph, self.rings)['recall']
+
+    def track_ring_recall_differential(self, n_shares):
+        _, graph, _ = Shared(self.shares_df).coord_shares_differential(self.coordination_interval, graph_backend='sparse')
+        return ring_recovery(graph, self.rings)['recall']
+
+
+class StatisticsSuite:
+    params = [10 ** 4, 10 ** 5, 10 ** 6]
+    param_names = ['n_shares']
+    timeout = 3600
+
+    def setup(self, n_shares):
+        shares_df, _ = make_shares(n_shares)
+        self.shares_df, self.graph, _ = Shared(shares_df).coord_shares(COORDINATION_INTERVAL, engine='vectorized', graph_backend='sparse')
+
+    def time_component_summary(self, n_shares):
+        Statistics.component_summary(self.shares_df, self.graph)
+
+    def time_get_top_coord_urls(self, n_shares):
+        Statistics.get_top_coord_urls(self.shares_df, self.graph)
+
+    def peakmem_component_summary(self, n_shares):
+        Statistics.component_summary(self.shares_df, self.graph)
+
+
+def _measure(function, repeat):
+    """Best time of repeat runs and peak memory allocated by one run, in seconds and MB, and the last result.
+    """
+    results = []
+    seconds = min(timeit.repeat(lambda: results.append(function()), number=1, repeat=repeat))
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak / 2 ** 20, results[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10 ** 4, 10 ** 5], help='numbers of organic shares')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of every stage, the best time is printed')
+    args = parser.parse_args()
+
+    for n_shares in args.sizes:
+        shares_suite = SharedSuite()
+        shares_suite.setup(n_shares)
+        print(f"n_shares={n_shares} coordination_interval={shares_suite.coordination_interval}s")
+        stages = [
+            ('estimate_coord_interval', lambda: Shared(shares_suite.shares_df).estimate_coord_interval()),
+            ('estimate_coord_interval_sketch', lambda: Shared(shares_suite.shares_df).estimate_coord_interval(method='sketch')),
+            ('coord_shares', lambda: Shared(shares_suite.shares_df).coord_shares(shares_suite.coordination_interval, engine='vectorized')),
+            ('coord_shares_sparse', lambda: Shared(shares_suite.shares_df).coord_shares(shares_suite.coordination_interval, engine='vectorized', graph_backend='sparse')),
+            ('coord_shares_differential', lambda: Shared(shares_suite.shares_df).coord_shares_differential(shares_suite.coordination_interval, graph_backend='sparse')),
+        ]
+        for name, function in stages:
+            seconds, megabytes, result = _measure(function, args.repeat)
+            line = f"  {name:<32} {seconds:9.3f}s {megabytes:9.1f}MB"
+            if name.startswith('coord_shares'):
+                recovery = ring_recovery(result[1], shares_suite.rings)
+                line += f"  rings={recovery['rings']:.2f} recall={recovery['recall']:.2f} precision={recovery['precision']:.2f}"
+            print(line)
+
+        shares_df, graph, _ = result
+        for name, function in [('component_summary', lambda: Statistics.component_summary(shares_df, graph)),
+                               ('get_top_coord_urls', lambda: Statistics.get_top_coord_urls(shares_df, graph))]:
+            seconds, megabytes, _ = _measure(function, args.repeat)
+            print(f"  {name:<32} {seconds:9.3f}s {megabytes:9.1f}MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""Benchmarks of the URL cleaning of pycoornet.utils.
+
+The suites follow the asv conventions (setup and time_* methods) and can also be run as a script, from the root of
+the repository with pycoornet installed (pip install -e .) or with the sources in the path:
+
+    PYTHONPATH=src python -m benchmarks.bench_utils
+
+The equivalence corpus of the tests is rebuilt with:
+
+    PYTHONPATH=src python -m benchmarks.bench_utils --corpus tests/data/clean_urls_corpus.csv
+"""
+import sys
+import timeit
+import numpy as np
+import pandas as pd
+from pycoornet.utils import Utils, _normalize_url
+
+LEGACY_PATTERN = [
+    '\\?utm_.*',
+    'feed_id.*',
+    '&_unique_id.*',
+    '\\?#.*',
+    '\\?ref.*',
+    '\\?fbclid.*',
+    '\\?rss.*',
+    '\\?ico.*',
+    '\\?recruiter.*',
+    '\\?sr_share_.*',
+    '\\?fb_rel.*',
+    '\\?social.*',
+    '\\?intcmp_.*',
+    '\\?xrs.*',
+    '\\?CMP.*',
+    '\\?tid.*',
+    '\\?ncid.*',
+    '&utm_.*',
+    '\\?rbs&utm_hp_ref.*',
+    '/#\\..*',
+    '\\?mobile.*',
+    '&fbclid.*',
+    '/$',
+    '#.*',
+    '\\?mbid.*',
+    '\\?platform',
+    '\\?__twitter_impression',
+    '\\/amp$',
+    '\\?amp$',
+    '\\/amp=.*',
+    '\\?verso.*',
+    '\\?mc_cid.*',
+    '\\?mc_eid.*',
+    '\\?source=TDB.*',
+    '\\?spMailingID.*',
+    '\\?mcd.*',
+    '\\?cd-origin=.*'
+    ]
+
+
+def legacy_clean_urls(dataframe, url_column):
+    """Regular expression implementation of Utils.clean_urls up to version 0.6.0, with the removal of the trailing &
+    fixed. It is the reference of the benchmarks and of tests/data/clean_urls_corpus.csv.
+    """
+    dataframe[url_column] = dataframe[url_column].str.replace('|'.join(LEGACY_PATTERN), '', regex=True)
+    dataframe[url_column] = dataframe[url_column].str.replace('|'.join(LEGACY_PATTERN), '', regex=True)
+    dataframe[url_column] = dataframe[url_column].str.replace('|'.join(LEGACY_PATTERN), '', regex=True)
+
+    dataframe[url_column] = dataframe[url_column].str.replace('.*(http)', '\\1', regex=True)
+    dataframe[url_column] = dataframe[url_column].str.replace('\\/$', '', regex=True)
+    dataframe[url_column] = dataframe[url_column].str.replace('\\&$', '', regex=True)
+
+    dataframe = dataframe.loc[dataframe[url_column].str.contains('^http://127.0.0.1|^https://127.0.0.1|http://localhost|https://localhost') == False]
+    dataframe = dataframe.loc[dataframe[url_column].str.contains('http://|https://')]
+
+    dataframe = dataframe.reset_index(drop=True)
+    return dataframe
+
+
+def make_urls(n_shares, n_urls=None, seed=0):
+    """Random expanded URLs of shares, with repeated URLs and tracking parameters like the CrowdTangle ones.
+
+    Args:
+        n_shares (int): number of URLs.
+        n_urls (int, optional): number of distinct articles. Defaults to n_shares // 20.
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        pandas.Series: the URLs
+    """
+    rng = np.random.default_rng(seed)
+    n_urls = n_urls or max(1, n_shares // 20)
+    suffixes = np.array(['', '/', '?fbclid=IwAR{}', '?utm_source=facebook&utm_medium=social', '#comments',
+                         '/amp', '?id={}&utm_campaign=news', 'https://l.facebook.com/l.php?u='])
+    articles = rng.integers(0, n_urls, n_shares)
+    kinds = rng.integers(0, len(suffixes), n_shares)
+    urls = []
+    for article, kind in zip(articles, kinds):
+        url = f"https://www.site{article % 97}.com/news/{article}/story-{article * 7}.html"
+        suffix = suffixes[kind]
+        if suffix.startswith('http'):
+            url = suffix + url
+        else:
+            url = url + suffix.format(article)
+        urls.append(url)
+    return pd.Series(urls, name='expanded')
+
+
+CORPUS_SUFFIXES = ['/', '//', '#section', '/#.anchor', '?utm_source=fb&utm_medium=social', '?fbclid=IwAR0abc',
+                   '?ref=hp', '?rss=1', '?ico=1', '?recruiter=1', '?sr_share_=facebook', '?fb_rel=1', '?social=1',
+                   '?intcmp_=x', '?xrs=1', '?CMP=share', '?tid=1', '?ncid=1', '?rbs&utm_hp_ref=1', '?mobile=1',
+                   '?mbid=1', '?__twitter_impression', '?platform', '/amp', '/amp/', '?amp', '/amp=1', '?verso=true',
+                   '?mc_cid=1', '?mc_eid=2', '?source=TDB', '?spMailingID=1', '?mcd=1', '?cd-origin=x',
+                   '?id=1&feed_id=2', '?id=1&_unique_id=2', '?id=1&fbclid=2', '?id=1&utm_source=fb', '?#top']
+CORPUS_QUERY_SUFFIXES = ['&utm_source=fb', '&fbclid=IwAR0abc', '&feed_id=3', '&_unique_id=4', '#section']
+# URLs where Utils.clean_urls differs from legacy_clean_urls on purpose, with the clean_urls output
+CORPUS_CHANGES = [
+    # the parameters are removed by key, the parameters after a tracking one are kept
+    ('https://example.com/a?ref=x&id=1', 'https://example.com/a?id=1'),
+    ('https://example.com/a?utm_source=fb&id=1', 'https://example.com/a?id=1'),
+    ('https://example.com/a?id=1&fbclid=2&page=3', 'https://example.com/a?id=1&page=3'),
+    ('https://example.com/a?platform=web&id=3', 'https://example.com/a?id=3'),
+    ('https://example.com/a?id=1&REF=2', 'https://example.com/a?id=1'),
+    # the keys are matched whole, not as prefixes of longer keys
+    ('https://example.com/a?referral=1', 'https://example.com/a?referral=1'),
+    ('https://example.com/a?reference=7', 'https://example.com/a?reference=7'),
+    ('https://example.com/a?tidy=1', 'https://example.com/a?tidy=1'),
+    ('https://example.com/a?mobile_app=1', 'https://example.com/a?mobile_app=1'),
+    # the path is left as is
+    ('https://example.com/feed_id/page', 'https://example.com/feed_id/page'),
+    # the URLs rejected by urllib.parse.urlsplit are dropped
+    ('http://[::1/a', None),
+    ('https://[example.com/a?utm_source=x', None),
+    # the redirect links are cut at the last http:// or https://
+    ('https://l.facebook.com/l.php?u=https://example.com/httpdocs/a', 'https://example.com/httpdocs/a'),
+    ('https://example.com/a?u=http%3A%2F%2Fother.com', 'https://example.com/a?u=http%3A%2F%2Fother.com'),
+    # the uppercase schemes are kept in lowercase
+    ('HTTPS://EXAMPLE.COM/a', 'https://EXAMPLE.COM/a'),
+    ('Https://Example.com/a/', 'https://Example.com/a'),
+]
+
+
+def make_clean_urls_corpus(ct_shares_df, source_df, n_entities=20):
+    """Builds tests/data/clean_urls_corpus.csv from the samples: the sample URLs, the URLs with every tracking
+    suffix removed by legacy_clean_urls, and wrapped in a redirect link, with the legacy output as expected value.
+    The CORPUS_CHANGES URLs are added at the end with the output of clean_urls.
+
+    Args:
+        ct_shares_df (pandas.DataFrame): samples/ct_output.pickle
+        source_df (pandas.DataFrame): samples/sample_source_links.csv
+        n_entities (int, optional): number of post and account URLs taken from ct_shares_df. Defaults to 20.
+
+    Returns:
+        pandas.DataFrame: the columns url and expected, empty when legacy_clean_urls drops the URL
+    """
+    bases = pd.concat([source_df['clean_url'], ct_shares_df['expanded'], ct_shares_df['link'],
+                       ct_shares_df['postUrl'].drop_duplicates().head(n_entities),
+                       ct_shares_df['account_url'].drop_duplicates().head(n_entities)]).dropna().unique()
+    urls = []
+    for url in bases:
+        urls.append(url)
+        urls.extend(url + suffix for suffix in (CORPUS_QUERY_SUFFIXES if '?' in url else CORPUS_SUFFIXES))
+        urls.append('https://l.facebook.com/l.php?u=' + url)
+    urls.extend(['http://localhost/news/1', 'https://127.0.0.1:8000/news', 'ftp://files.example.com/news'])
+    urls.extend(source_df['url_rid'])
+    corpus_df = pd.DataFrame({'url': list(dict.fromkeys(urls))})
+    cleaned_df = legacy_clean_urls(corpus_df.assign(expected=corpus_df['url']), 'expected')
+    changes_df = pd.DataFrame(CORPUS_CHANGES, columns=['url', 'expected'])
+    return pd.concat([corpus_df.merge(cleaned_df, on='url', how='left'), changes_df], ignore_index=True)
+
+
+class CleanUrlsSuite:
+    params = [10 ** 4, 10 ** 5]
+    param_names = ['n_shares']
+
+    def setup(self, n_shares):
+        self.dataframe = pd.DataFrame({'expanded': make_urls(n_shares)})
+
+    def time_legacy_clean_urls(self, n_shares):
+        legacy_clean_urls(self.dataframe.copy(), 'expanded')
+
+    def time_clean_urls(self, n_shares):
+        # cold memo, as in the first call of a run
+        _normalize_url.cache_clear()
+        Utils.clean_urls(self.dataframe.copy(), 'expanded')
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == '--corpus':
+        corpus_df = make_clean_urls_corpus(pd.read_pickle('samples/ct_output.pickle'),
+                                           pd.read_csv('samples/sample_source_links.csv'))
+        corpus_df.to_csv(sys.argv[2], index=False)
+        return
+    suite = CleanUrlsSuite()
+    for n_shares in CleanUrlsSuite.params:
+        suite.setup(n_shares)
+        for name in ('time_legacy_clean_urls', 'time_clean_urls'):
+            seconds = min(timeit.repeat(lambda: getattr(suite, name)(n_shares), number=1, repeat=3))
+            print(f"{name:<24} n_shares={n_shares:<8} {seconds:.3f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -40,9 +40,13 @@ setup(
           'PyCrowdTangle>=0.5.0',
           'tqdm>=4.47.0',
           'networkx>=2.4',
+          'scipy>=1.5.0',
           'python-louvain>=0.14',
           'tldextract>=3.1.0',
-          'pyarrow>=4.0.0',
-          'ratelimiter>= 1.2.0'
+          'pyarrow>=4.0.0'
       ],
+    extras_require={
+          'fast': ['pyahocorasick>=1.4.0'],
+          'leiden': ['igraph>=0.10.0', 'leidenalg>=0.9.0'],
+      },
 )
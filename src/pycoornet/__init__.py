@@ -1,5 +1,9 @@
+from .cache import ResponseCache
 from .crowdtangle import CrowdTangle
+from .export import GraphExport
+from .profiling import Profiler
 from .shared import Shared
+from .sketch import QuantileSketch
+from .stream import SharedStream
 from .utils import Utils
 from .statistics import Statistics
-
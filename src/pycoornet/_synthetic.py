@@ -0,0 +1,127 @@
+"""Seeded synthetic CrowdTangle shares for the tests and the benchmarks, with planted coordinated rings.
+
+The organic shares follow heavy tailed distributions: the number of shares of the URLs and the activity of the
+accounts are Zipf distributed, and every share is performed an exponentially distributed delay after the URL is
+published. Every planted ring is a group of accounts that share the same URLs a few seconds from each other, so the
+detectors should find every ring as a group of connected accounts of the graph.
+"""
+import numpy as np
+import pandas as pd
+
+STATISTICS = ['likeCount', 'shareCount', 'commentCount', 'loveCount', 'wowCount', 'hahaCount', 'sadCount',
+              'angryCount', 'thankfulCount', 'careCount']
+
+
+def _zipf_weights(n, exponent):
+    weights = 1 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def make_shares(n_shares, n_urls=None, n_accounts=None, n_rings=10, ring_size=8, ring_urls=20, ring_jitter=30,
+                url_exponent=0.8, account_exponent=0.8, mean_delay=3 * 86400, span_days=90, seed=0):
+    """Generates CrowdTangle shares with the columns used by Shared and Statistics.
+
+    The string columns of the URLs and of the accounts reference one string per URL and per account, so 10^7 shares
+    take a few GB.
+
+    Args:
+        n_shares (int): number of organic shares.
+        n_urls (int, optional): number of URLs. Defaults to n_shares // 20.
+        n_accounts (int, optional): number of organic accounts. Defaults to n_shares // 50.
+        n_rings (int, optional): number of planted coordinated rings. Defaults to 10.
+        ring_size (int, optional): accounts of every ring. Defaults to 8.
+        ring_urls (int, optional): URLs shared by every ring. Defaults to 20.
+        ring_jitter (int, optional): seconds between the first and the last share of a URL by a ring. Defaults to 30.
+        url_exponent (float, optional): exponent of the Zipf distribution of the shares per URL. Defaults to 0.8.
+        account_exponent (float, optional): exponent of the Zipf distribution of the shares per account.
+            Defaults to 0.8.
+        mean_delay (int, optional): mean seconds from the publication of a URL to an organic share.
+            Defaults to 3 days.
+        span_days (int, optional): days over which the URLs are published. Defaults to 90.
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        (tuple): the shares, pandas.DataFrame sorted by date, and the account_url of the accounts of every ring.
+    """
+    rng = np.random.default_rng(seed)
+    n_urls = n_urls or max(2, n_shares // 20)
+    n_accounts = n_accounts or max(2, n_shares // 50)
+    start = pd.Timestamp('2021-01-01').value // 10 ** 9
+    published = start + rng.integers(0, span_days * 86400, n_urls)
+
+    # organic shares
+    urls = rng.choice(n_urls, n_shares, p=_zipf_weights(n_urls, url_exponent))
+    accounts = rng.choice(n_accounts, n_shares, p=_zipf_weights(n_accounts, account_exponent))
+    dates = published[urls] + rng.exponential(mean_delay, n_shares).astype('int64')
+
+    # planted rings, every account of a ring shares the ring URLs within ring_jitter seconds
+    rings = []
+    ring_url_codes, ring_account_codes, ring_dates = [], [], []
+    for ring in range(n_rings):
+        members = n_accounts + ring * ring_size + np.arange(ring_size)
+        rings.append([f"https://www.facebook.com/ring{ring}.account{member}" for member in range(ring_size)])
+        shared_urls = rng.choice(n_urls, min(ring_urls, n_urls), replace=False)
+        first_dates = published[shared_urls] + rng.integers(0, mean_delay, len(shared_urls))
+        ring_url_codes.append(np.repeat(shared_urls, ring_size))
+        ring_account_codes.append(np.tile(members, len(shared_urls)))
+        ring_dates.append(np.repeat(first_dates, ring_size) + rng.integers(0, ring_jitter + 1, len(shared_urls) * ring_size))
+    urls = np.concatenate([urls] + ring_url_codes)
+    accounts = np.concatenate([accounts] + ring_account_codes)
+    dates = np.concatenate([dates] + ring_dates)
+    order = np.argsort(dates, kind='mergesort')
+    urls, accounts, dates = urls[order], accounts[order], dates[order]
+    n = len(urls)
+
+    # one string per URL and per account
+    url_strings = np.array([f"https://news{url % 211}.example.com/article/{url}.html" for url in range(n_urls)], dtype=object)
+    account_strings = np.array([f"https://www.facebook.com/{1000000 + account}" for account in range(n_accounts)] +
+                               [account_url for ring in rings for account_url in ring], dtype=object)
+    account_names = np.array([f"Account {account}" for account in range(len(account_strings))], dtype=object)
+    account_handles = np.array([f"handle{account}" for account in range(len(account_strings))], dtype=object)
+    account_ids = 1000000 + accounts
+    ids = np.arange(n).astype(str).astype(object) + '|post'
+
+    shares_df = pd.DataFrame({
+        'platform': 'Facebook',
+        'date': pd.to_datetime(dates, unit='s'),
+        'type': 'link',
+        'subscriberCount': rng.integers(0, 100000, n),
+        'id': ids,
+        'expanded': url_strings[urls],
+        'account_id': account_ids,
+        'account_name': account_names[accounts],
+        'account_subscriberCount': (account_ids * 7919) % 100000,
+        'account_url': account_strings[accounts],
+        'account_platform': 'Facebook',
+        'account_platformId': account_ids.astype(str).astype(object),
+        'account_accountType': np.array(['facebook_page', 'facebook_group', 'facebook_profile'], dtype=object)[accounts % 3],
+        'account_verified': accounts % 7 == 0,
+        'account_handle': account_handles[accounts],
+        'account_pageAdminTopCountry': np.array(['US', 'IT', 'BR', 'IN', None], dtype=object)[accounts % 5],
+    })
+    for statistic in STATISTICS:
+        shares_df[f"statistics_actual_{statistic}"] = rng.poisson(5, n)
+    shares_df['is_orig'] = urls % 2 == 0
+    return shares_df, rings
+
+
+def ring_recovery(graph, rings):
+    """Share of the planted rings found by a detector.
+
+    Args:
+        graph (networkx.Graph): graph returned by coord_shares.
+        rings (list): account_url of the accounts of every ring returned by make_shares.
+
+    Returns:
+        dict: recall, the share of ring accounts in the graph, precision, the share of graph nodes that are ring
+        accounts, and rings, the share of rings whose accounts are all in the graph and in one component.
+    """
+    nodes = set(graph.nodes)
+    ring_accounts = {account for ring in rings for account in ring}
+    components = dict(graph.nodes(data='component'))
+    found = [all(account in nodes for account in ring) and len({components[account] for account in ring}) == 1 for ring in rings]
+    return {
+        'recall': len(ring_accounts & nodes) / len(ring_accounts) if ring_accounts else 1.0,
+        'precision': len(ring_accounts & nodes) / len(nodes) if nodes else 0.0,
+        'rings': sum(found) / len(rings) if rings else 1.0,
+    }
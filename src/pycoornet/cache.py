@@ -0,0 +1,112 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """Persistent cache of CrowdTangle API responses stored in a SQLite file.
+
+    Responses are stored as compressed JSON and keyed by a hash of the query (url, platforms, start date, end date,
+    count and page offset), so an interrupted get_shares can be run again and only the uncached URLs reach the API.
+
+    Args:
+        path (str): path of the SQLite file. Parent folders are created if needed.
+        ttl (float, optional): seconds after which a response expires. Defaults to None, responses never expire.
+        max_size (int, optional): maximum size in bytes of the stored responses. The least recently used responses
+            are removed when it is exceeded. Defaults to None, no size limit.
+    """
+
+    def __init__(self, path, ttl=None, max_size=None):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = str(path)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.__connection.execute('CREATE TABLE IF NOT EXISTS responses '
+                                  '(key TEXT PRIMARY KEY, created REAL, accessed REAL, size INTEGER, data BLOB)')
+        self.__connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self.__connection.commit()
+        self.evict()
+
+    @staticmethod
+    def key(query):
+        """Content address of a query.
+
+        Args:
+            query (dict): arguments of the links endpoint query.
+
+        Returns:
+            str: sha256 hex digest of the canonical JSON of the query.
+        """
+        canonical = json.dumps({k: list(v) if isinstance(v, tuple) else v for k, v in query.items()}, sort_keys=True, default=str)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def get(self, query):
+        """Returns the cached response of a query, or None if it is not cached or it has expired.
+        """
+        key = self.key(query)
+        now = time.time()
+        with self.__lock:
+            row = self.__connection.execute('SELECT created, data FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl is not None and now - row[0] > self.ttl:
+                self.__connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self.__connection.commit()
+                return None
+            self.__connection.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+            self.__connection.commit()
+        return json.loads(zlib.decompress(row[1]))
+
+    def set(self, query, data):
+        """Stores the response of a query.
+        """
+        blob = zlib.compress(json.dumps(data).encode('utf-8'))
+        now = time.time()
+        with self.__lock:
+            self.__connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                                      (self.key(query), now, now, len(blob), blob))
+            self.__connection.commit()
+        if self.max_size is not None:
+            self.evict()
+
+    def evict(self):
+        """Removes the expired responses and the least recently used ones over max_size.
+        """
+        with self.__lock:
+            if self.ttl is not None:
+                self.__connection.execute('DELETE FROM responses WHERE created < ?', (time.time() - self.ttl,))
+            if self.max_size is not None:
+                size = self.__connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+                if size > self.max_size:
+                    removed = 0
+                    keys = []
+                    for key, entry_size in self.__connection.execute('SELECT key, size FROM responses ORDER BY accessed'):
+                        if size - removed <= self.max_size:
+                            break
+                        keys.append((key,))
+                        removed += entry_size
+                    self.__connection.executemany('DELETE FROM responses WHERE key = ?', keys)
+                    logger.debug(f"{len(keys)} responses evicted from {self.path}")
+            self.__connection.commit()
+
+    def __len__(self):
+        with self.__lock:
+            return self.__connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def __contains__(self, query):
+        return self.get(query) is not None
+
+    def close(self):
+        """Closes the SQLite connection.
+        """
+        with self.__lock:
+            self.__connection.close()
@@ -1,13 +1,20 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
 import logging
 import numpy as np
 import pandas as pd
 from pathlib import Path
 import PyCrowdTangle as pct
 import time
-import glob
+from urllib.parse import parse_qs, urlparse
 import os
 from tqdm import tqdm
-from ratelimiter import RateLimiter
+import warnings
+from .cache import ResponseCache
+from .profiling import DISABLED, profiled
+from .ratelimit import TokenBucket
 from .utils import Utils
 
 logger = logging.getLogger(__name__)
@@ -17,19 +24,186 @@ class CrowdTangle:
     """Descripción de la clase.
 
         api_key (str): CrowdTangle API key.
+        get_links (callable, optional): function used to query the CrowdTangle links endpoint, with the same arguments
+            and return value of PyCrowdTangle.ct_get_links. It can be replaced to use another HTTP layer. Defaults to
+            PyCrowdTangle.ct_get_links.
+        profiler (Profiler, optional): profiler of the stages of get_shares. When it is enabled, the rows of the
+            timing report of every call are stored as a list of dicts in attrs['timing'] of the returned dataframe.
+            Defaults to None, no profiling.
      """
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, get_links=None, profiler=None):
         """Constructor method
         """
         if not api_key:
             raise Exception('Crowdtangle Api Token is missing')
         self.api_key = api_key
+        self.get_links = get_links or pct.ct_get_links
+        self.profiler = DISABLED if profiler is None else profiler
 
+    def __get_links(self, rate_limiter, max_retries, retry_backoff, cache, **params):
+        """Queries the links endpoint, retrying rate limited (429) and server error (5xx) responses with exponential backoff.
+
+        Args:
+            rate_limiter (TokenBucket): rate limiter shared by all the requests.
+            max_retries (int): number of retries after the first request.
+            retry_backoff (float): seconds to wait before the first retry, doubled on every retry.
+            cache (ResponseCache): cache of the successful responses, or None.
+            **params: arguments of the links endpoint query.
+
+        Returns:
+            dict: the last response of the links endpoint.
+        """
+        if cache is not None:
+            data = cache.get(params)
+            if data is not None:
+                return data
+
+        for attempt in range(max_retries + 1):
+            with rate_limiter:
+                try:
+                    data = self.get_links(api_token=self.api_key, **params)
+                    error = None
+                except Exception as e:
+                    data = None
+                    error = e
+
+            status = data.get('status') if data is not None else None
+            if error is None and status != 429 and not (isinstance(status, int) and 500 <= status < 600):
+                if cache is not None and status == 200:
+                    cache.set(params, data)
+                return data
+
+            if attempt < max_retries:
+                delay = retry_backoff * 2 ** attempt
+                logger.debug(f"retrying {params['link']} in {delay} seconds, status {status}, error {error}")
+                time.sleep(delay)
+
+        if error is not None:
+            raise error
+        return data
+
+    def __fetch_links(self, queries, fetch, workers):
+        """Queries the links endpoint for every query keeping up to workers requests in flight.
+
+        Args:
+            queries (list): arguments of the links endpoint query of every URL.
+            fetch (callable): function querying the links endpoint with the arguments of a query.
+            workers (int): number of concurrent requests.
+
+        Yields:
+            concurrent.futures.Future: the future of each response, in the order of the queries.
+        """
+        queries = iter(queries)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque(executor.submit(fetch, **query)
+                            for query in islice(queries, workers))
+            while pending:
+                query = next(queries, None)
+                if query is not None:
+                    pending.append(executor.submit(fetch, **query))
+                # not kept in a variable, the response is released once the caller is done with it
+                yield pending.popleft()
+
+    @staticmethod
+    def __flatten_post(post):
+        """Flattens a post of the links endpoint, with the expanded link, account and statistics as top level fields.
+
+        Args:
+            post (dict): post of the response.
+
+        Returns:
+            dict: the flattened record, account fields are prefixed with account_ and statistics with statistics_actual_
+            and statistics_expected_.
+        """
+        record = {k: v for k, v in post.items() if k not in ('expandedLinks', 'account', 'statistics')}
+        record['expanded'] = post['expandedLinks'][0]['expanded']
+        for k, v in post['account'].items():
+            record[f'account_{k}'] = v
+        for k, v in post['statistics']['actual'].items():
+            record[f'statistics_actual_{k}'] = v
+        for k, v in post['statistics']['expected'].items():
+            record[f'statistics_expected_{k}'] = v
+        return record
+
+    def __link_pages(self, data, query, fetch, max_pages=None, max_posts=None):
+        """Yields the posts of every page of a links endpoint query, following result.pagination.nextPage lazily.
+
+        Args:
+            data (dict): response of the first page.
+            query (dict): arguments of the links endpoint query.
+            fetch (callable): function querying the links endpoint with the arguments of a query.
+            max_pages (int, optional): maximum number of pages to read. Defaults to None, all the pages.
+            max_posts (int, optional): maximum number of posts to read. Defaults to None, all the posts.
+
+        Yields:
+            list: the posts of each page.
+        """
+        pages = 0
+        posts_count = 0
+        while True:
+            posts = data['result']['posts']
+            if max_posts is not None:
+                posts = posts[:max_posts - posts_count]
+            if not posts:
+                return
+            yield posts
+
+            pages += 1
+            posts_count += len(posts)
+            next_page = (data['result'].get('pagination') or {}).get('nextPage')
+            if not next_page or (max_pages is not None and pages >= max_pages) or (max_posts is not None and posts_count >= max_posts):
+                return
+
+            next_params = parse_qs(urlparse(next_page).query)
+            if 'offset' not in next_params:
+                logger.warning(f"Can't follow the next page of {query['link']}: {next_page}")
+                return
+            next_query = dict(query, offset=int(next_params['offset'][0]))
+            if 'count' in next_params:
+                next_query['count'] = int(next_params['count'][0])
+
+            data = fetch(**next_query)
+            if data['status'] != 200:
+                logger.warning(f"Unexpected http response code on page {pages + 1} of url {query['link']}")
+                return
+
+    def get_link_pages(self, link, platforms=('facebook', 'instagram'), start_date=None, end_date=None, nmax=1000,
+                       max_calls=2, max_pages=None, max_posts=None, max_retries=3, retry_backoff=1, cache=None):
+        """Get the posts that shared an URL from CrowdTangle, one page at a time
+
+        Args:
+            link (str): the URL to query.
+            platforms (tuple, optional): a tuple of platforms to search. Defaults to ('facebook', 'instagram').
+            start_date (datetime, optional): the earliest date of the posts. Defaults to None.
+            end_date (datetime, optional): the latest date of the posts. Defaults to None.
+            nmax (int, optional): max number of results per page. Defaults to 1000.
+            max_calls (int, optional): Max number of Api call per minute. Defaults to 2.
+            max_pages (int, optional): maximum number of pages to read. Defaults to None, all the pages.
+            max_posts (int, optional): maximum number of posts to read. Defaults to None, all the posts.
+            max_retries (int, optional): number of retries of rate limited (429) and server error (5xx) responses. Defaults to 3.
+            retry_backoff (float, optional): seconds to wait before the first retry, doubled on every retry. Defaults to 1.
+            cache (ResponseCache or str, optional): cache of the responses, or the path of its SQLite file. Defaults to None.
+
+        Yields:
+            list: the posts of each page, as returned by the https://github.com/CrowdTangle/API/wiki/Links CrowdTangle API links endpoint.
+        """
+        if isinstance(cache, (str, Path)):
+            cache = ResponseCache(cache)
+        fetch = partial(self.__get_links, TokenBucket(max_calls=max_calls, period=60), max_retries, retry_backoff, cache)
+        query = {'link': link, 'platforms': platforms, 'start_date': start_date, 'end_date': end_date,
+                 'include_history': 'true', 'sortBy': 'date', 'count': nmax}
+        data = fetch(**query)
+        if data['status'] != 200:
+            raise Exception(f"Unexpected http response code {data['status']} on url {link}")
+        yield from self.__link_pages(data, query, fetch, max_pages, max_posts)
+
+    @profiled('get_shares')
     def get_shares(self, urls, url_column='url', date_column='date', platforms=('facebook', 'instagram'),
                    nmax=1000, max_calls = 2, clean_urls=False, save_ctapi_output=False,
                    temp_saves = False, temp_number = 1000,
-                   id_column=None, remove_days=None):
+                   id_column=None, remove_days=None, workers=1, max_retries=3, retry_backoff=1,
+                   max_pages=None, max_posts=None, cache=None, is_orig_mode='substring'):
         """ Get the URLs shares from CrowdTangle from a list of URLs with publish datetime
 
         Args:
@@ -38,15 +212,31 @@ class CrowdTangle:
             date_column (str, optional): name of the column (placed inside quote marks) where the date of the URLs are stored. Defaults to 'date'.
             platforms (tuple, optional): a tuple of platforms to search. You can specify only facebook to search on Facebook, or only instagram to
                                          search on Instagram. Defaults to ('facebook', 'instagram').
-            nmax (int, optional): max number of results for query. Defaults to 100.
+            nmax (int, optional): max number of results per page of the query. Defaults to 1000.
             max_calls (int, optional): Max number of Api call per minute. It can be lowered or increased
                                         depending on the assigned API rate limit. Defaults to 2.
             clean_urls (bool, optional): clean the URLs from tracking parameters. Defaults to False.
             save_ctapi_output (bool, optional): saves the original CT API output in rawdata/ folder. Defaults to False.
-            temp_saves (bool, optional): saves the partial concatenated dataframe to create a final dataframe at the end
-            temp_number (int, optional): number of downloaded urls to be saves as temporal, temp_saves has to be set to 'True'
+            temp_saves (bool, optional): deprecated, use cache. When True and cache is None the responses are cached in
+                                         rawdata/ct_cache.sqlite
+            temp_number (int, optional): deprecated and ignored.
             id_column(str,optional): name of the column wherre the id of each URL is stored.
             remove_days(int,optional): remove shares performed more than X days from first share
+            workers (int, optional): number of concurrent requests to the CrowdTangle API. All the workers share the
+                                     max_calls per minute limit and the results keep the order of the urls. Defaults to 1.
+            max_retries (int, optional): number of retries of the requests with rate limited (429) or server error (5xx)
+                                         responses. Defaults to 3.
+            retry_backoff (float, optional): seconds to wait before the first retry, doubled on every retry. Defaults to 1.
+            max_pages (int, optional): maximum number of pages to read per URL, following the pagination of the
+                                       CrowdTangle results. Defaults to None, all the pages.
+            max_posts (int, optional): maximum number of posts to read per URL. Defaults to None, all the posts.
+            cache (ResponseCache or str, optional): persistent cache of the API responses, or the path of its SQLite file.
+                                                    Cached queries don't call the API, so an interrupted run can be
+                                                    repeated and it resumes from the first uncached URL. Defaults to None.
+            is_orig_mode (str, optional): how the is_orig field matches the expanded URLs with the original URLs.
+                                          'substring' flags the expanded URLs contained in an original URL and
+                                          'exact' the ones equal to an original URL after normalization, both
+                                          ignoring case. See Utils.match_original_urls. Defaults to 'substring'.
         Raises:
             Exception: [description]
             Exception: [description]
@@ -64,6 +254,9 @@ class CrowdTangle:
             if date_column not in urls.columns:
                 message = f"Can't find {date_column} in urls dataframe"
                 raise Exception(message)
+            if is_orig_mode not in ('substring', 'exact'):
+                message = f"Unknown is_orig_mode {is_orig_mode}, expected 'substring' or 'exact'"
+                raise Exception(message)
 
 
 
@@ -83,47 +276,45 @@ class CrowdTangle:
                 urls = Utils.clean_urls(urls, 'url')
                 logger.info("Original URLs have been cleaned")
 
-            # create empty dataframe
-            ct_shares_df = pd.DataFrame()
+            # dataframes of the shares of every url, concatenated once at the end
+            shares_frames = []
 
             if temp_saves:
-                #create dir to save temporal data
-                Path("rawdata").mkdir(parents=True, exist_ok=True)
-                # for temporal file numbering
-                num =1
-                # if temp number is bigger than the number of urls
-                if temp_number > len(urls):
-                    temp_number = len(urls)//2
-
-            #number of maximum calls to crowdtangle per minute
-            rate_limiter = RateLimiter(max_calls=max_calls, period=60)
-
-            # Progress bar tqdm
-            for i in tqdm(range(len(urls))):
-                # set date limits, endDate: one week after date_published
+                warnings.warn("temp_saves is deprecated, use cache to resume interrupted runs", DeprecationWarning)
+                if cache is None:
+                    cache = os.path.join("rawdata", "ct_cache.sqlite")
+
+            if isinstance(cache, (str, Path)):
+                cache = ResponseCache(cache)
+                logger.info(f"Caching CrowdTangle responses in {cache.path}")
+
+            #number of maximum calls to crowdtangle per minute, shared by all the workers
+            rate_limiter = TokenBucket(max_calls=max_calls, period=60)
+            fetch = partial(self.__get_links, rate_limiter, max_retries, retry_backoff, cache)
+
+            # set date limits, endDate: remove_days after date_published
+            queries = []
+            for i in range(len(urls)):
                 startDate = urls.iloc[i, :].loc['date']
-                #startDate = startDate.replace(microsecond=0)
                 if remove_days:
                     days = f"{remove_days} day"
                     endDate = startDate + pd.Timedelta(days)
                 else:
                     endDate = None
+                queries.append({'link': urls.iloc[i, :].loc['url'], 'platforms': platforms, 'start_date': startDate,
+                                'end_date': endDate, 'include_history': 'true', 'sortBy': 'date', 'count': nmax})
 
-                url = urls.iloc[i, :].loc['url']
+            with self.profiler.span('fetch', rows_in=len(queries), workers=workers) as span:
+                responses = self.__fetch_links(queries, fetch, workers)
 
-                #add ratelimit restriction
-                with rate_limiter:
+                # Progress bar tqdm
+                for i in tqdm(range(len(urls))):
+                    url = urls.iloc[i, :].loc['url']
+                    response = next(responses)
 
                     try:
-                        # pycrowdtangle get links
-                        data = pct.ct_get_links(link=url, platforms=platforms,
-                                                start_date=startDate,
-                                                end_date=endDate,
-                                                include_history='true',
-                                                sortBy='date',
-                                                count=nmax,
-                                                api_token=self.api_key
-                                                )
+                        data = response.result()
+
                         # if status is an error
                         if data['status'] != 200:
                             logger.exception(f"Unexpected http response code on url {url}")
@@ -137,67 +328,38 @@ class CrowdTangle:
                             logger.debug(f"Empty response on url: {url}")
                             continue
 
-                        # convert json response to dataframe
-                        df = pd.DataFrame(data['result']['posts'])
-
-                        #get pagination pending
-
-                        # Extract expanded info from column and convert to columns
-                        df['expanded'] = df['expandedLinks'].map(lambda x: x[0]).apply(pd.Series)['expanded']
-
-                        # Remove column
-                        df.drop(['expandedLinks'], axis=1, inplace = True)
-
-                        # Extract account info from column and convert to columns
+                        # follow the pagination of the url and flatten every page as it arrives, so only one page
+                        # of the response is held at a time
+                        url_frames = []
+                        pages = self.__link_pages(data, queries[i], fetch, max_pages, max_posts)
+                        del data, response
+                        for posts in pages:
+                            page_df = pd.DataFrame.from_records([self.__flatten_post(post) for post in posts])
+                            page_df['date'] = pd.to_datetime(page_df['date'])
+                            url_frames.append(page_df.set_index('date', drop=False))
+                            del posts, page_df
+
+                        first_share = min(page_df.index.min() for page_df in url_frames)
+                        for page_df in url_frames:
+                            # if id column is specified
+                            if id_column:
+                                page_df["id_column"] = urls.iloc[i, :].loc[id_column]
+
+                            # remove shares performed more than x days from first share
+                            if remove_days:
+                                # ex: '7 day'
+                                days = f"{remove_days} day"
+                                page_df = page_df.loc[(page_df.index <= first_share + pd.Timedelta(days))]
+
+                            shares_frames.append(page_df)
 
-                        # add prefix name to each key of the dictionary per row in 'account' column
-                        df['account'] = df['account'].apply(
-                            lambda x: {f'account_{k}': v for k, v in x.items()})
-                        # convert dictionary info in each row to columns
-                        account = df['account'].apply(pd.Series)
-
-                        df.drop(['account'], axis=1, inplace = True)
-
-                        # Expand statistics column
-                        statistics = df['statistics'].apply(pd.Series)
-                        actual = statistics['actual'].apply(lambda x: {f'statistics_actual_{k}': v for k, v in x.items()})
-                        actual = actual.apply(pd.Series)
-                        expected = statistics['expected'].apply(lambda x: {f'statistics_expected_{k}': v for k, v in x.items()})
-                        expected = expected.apply(pd.Series)
-
-                        #remove column
-                        df.drop(['statistics'], axis=1, inplace = True)
-
-                        #concat expanded account and statistics columns
-                        df_full = pd.concat([df, account, actual, expected], axis=1)
-                        df_full['date'] = pd.to_datetime(df_full['date'])
-                        df_full = df_full.set_index('date', drop=False)
-
-                        # if id column is specified
-                        if id_column:
-                            df_full["id_column"] = urls.iloc[i, :].loc[id_column]
-
-                        # remove shares performed more than x days from first share
-                        if remove_days:
-                            # ex: '7 day'
-                            days = f"{remove_days} day"
-                            df_full = df_full.loc[(df_full.index <= df_full.index.min()+ pd.Timedelta(days))]
-
-                        # concat data results in dataframe
-                        ct_shares_df = ct_shares_df.append(df_full, ignore_index=True)
-
-                        if temp_saves and (i+1) % temp_number == 0:
-                            num_str = (str(num)).zfill(4)
-                            ct_shares_df.to_feather(os.path.join("rawdata",f"temp_{num_str}.feather"))
-                            num+=1
-                            ct_shares_df = pd.DataFrame()
                         #clean variables
-                        del df
-                        del df_full
+                        del url_frames
 
                     except Exception as e:
                         logger.exception(f"error on {url}")
                         print(f"error on {url}")
+                span.set(rows_out=lambda: sum(shares_df.shape[0] for shares_df in shares_frames))
 
 
 
@@ -205,19 +367,10 @@ class CrowdTangle:
             logger.exception(f"Exception {e.__class__} occurred.")
             raise e
 
-        #concatenate files if temp_saves == True
-        if temp_saves and num > 1:
-            if len(ct_shares_df) > 0:
-                num_str = (str(num)).zfill(4)
-                ct_shares_df.to_feather(os.path.join("rawdata",f"temp_{num_str}.feather"))
-                del ct_shares_df
-            try:
-                logger.info("starting concatenation of all temp files")
-                ct_shares_df = pd.concat(map(pd.read_feather, sorted(glob.glob(os.path.join('rawdata', "*.feather")))))
-            except:
-                raise SystemExit("\n temporal ct_shares concat failed")
-
-            print("Remember to delete the temporary files in /rawdata")
+        with self.profiler.span('concat', rows_in=len(shares_frames)) as span:
+            ct_shares_df = pd.concat(shares_frames, ignore_index=True) if shares_frames else pd.DataFrame()
+            span.set(rows_out=ct_shares_df.shape[0])
+        del shares_frames
 
         if ct_shares_df.empty:
             logger.error("No ct_shares were found!")
@@ -228,22 +381,26 @@ class CrowdTangle:
             #create dir to save raw data
             Path("rawdata").mkdir(parents=True, exist_ok=True)
             # save raw dataframe
-            ct_shares_df.to_csv(os.path.join("rawdata",'ct_shares_df.csv', index=False))
+            ct_shares_df.to_csv(os.path.join("rawdata",'ct_shares_df.csv'), index=False)
 
-        # remove possible inconsistent rows with entity URL equal "https://facebook.com/null"
-        ct_shares_df = ct_shares_df[ct_shares_df['account_url'] != "https://facebook.com/null"]
+        with self.profiler.span('deduplicate', rows_in=ct_shares_df.shape[0]) as span:
+            # remove possible inconsistent rows with entity URL equal "https://facebook.com/null"
+            ct_shares_df = ct_shares_df[ct_shares_df['account_url'] != "https://facebook.com/null"]
 
-        # get rid of duplicates
-        ct_shares_df.drop_duplicates(subset= ["id", "platformId", "postUrl", "expanded"],
-                                    inplace=True, ignore_index = True)
+            # get rid of duplicates
+            ct_shares_df.drop_duplicates(subset= ["id", "platformId", "postUrl", "expanded"],
+                                        inplace=True, ignore_index = True)
+            span.set(rows_out=ct_shares_df.shape[0])
 
         # clean the expanded URLs
         if clean_urls:
+            with self.profiler.span('clean_urls', rows_in=ct_shares_df.shape[0]):
                 ct_shares_df = Utils.clean_urls(ct_shares_df, "expanded")
                 logger.info("expanded URLs have been cleaned")
 
         logger.info(f"Calculating is_orig field")
-        ct_shares_df['is_orig'] = ct_shares_df["expanded"].apply(lambda x: bool(urls['url'].str.contains(x, case=False, regex=False).sum()))
+        with self.profiler.span('is_orig', rows_in=ct_shares_df.shape[0], mode=is_orig_mode):
+            ct_shares_df['is_orig'] = Utils.match_original_urls(ct_shares_df["expanded"], urls['url'], mode=is_orig_mode)
 
         # write log
         logger.info(f"Original URLs: {len(urls)}")
@@ -0,0 +1,227 @@
+import logging
+import numbers
+from pathlib import Path
+import re
+from xml.sax.saxutils import escape, quoteattr
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# characters not allowed in XML 1.0 documents, found in some account names and handles
+_XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+
+
+def _xml_text(value):
+    """Escaped XML text of a string, without the characters not allowed in XML 1.0.
+    """
+    return escape(_XML_INVALID.sub('', value))
+
+
+def _xml_attribute(value):
+    """Quoted and escaped XML attribute value of a string, without the characters not allowed in XML 1.0.
+    """
+    return quoteattr(_XML_INVALID.sub('', value))
+
+
+class GraphExport:
+    """Exports the graphs of coordinated entities as columnar tables and XML files.
+
+    The node table has one row per account with the column node and the node attributes (account attributes,
+    component, cluster, degree, strength and timestamps), the edge table has one row per edge with the columns u, v,
+    weight and the edge timestamps. The tables can be written to Parquet, and the GraphML and GEXF writers stream the
+    tables to the file row by row, without building an XML tree. The control characters not allowed in XML 1.0 are
+    removed from the values.
+
+    The tables are built from the networkx graph returned by coord_shares, so the graph has to be kept until
+    :meth:`tables` returns. The writers also take the tables instead of the graph, so the graph can then be released
+    and the files written from the tables, or from the tables read back with :meth:`read_parquet` in another process.
+    """
+
+    @staticmethod
+    def tables(graph):
+        """Node and edge tables of a graph returned by coord_shares.
+
+        Args:
+            graph (networkx.Graph): the graph of coordinated entities.
+
+        Returns:
+            (tuple): the node table and the edge table, pandas.DataFrame. The coord_share_timestamps table stored in
+            the graph by gtimestamps='table' is kept in the edge table attrs.
+        """
+        nodes_df = pd.DataFrame.from_dict(dict(graph.nodes(data=True)), orient='index')
+        nodes_df = nodes_df.rename_axis('node').reset_index()
+        edges_df = nx.to_pandas_edgelist(graph, source='u', target='v')
+        if 'weight' not in edges_df.columns:
+            edges_df['weight'] = 1
+        if 'coord_share_timestamps' in graph.graph:
+            edges_df.attrs['coord_share_timestamps'] = graph.graph['coord_share_timestamps']
+        return nodes_df, edges_df
+
+    @staticmethod
+    def write_parquet(graph, path):
+        """Writes the node and edge tables of a graph to the Parquet files nodes.parquet and edges.parquet of a folder,
+        and the coord_share_timestamps table to timestamps.parquet when the graph has it.
+
+        Args:
+            graph (networkx.Graph or tuple): the graph or its node and edge tables returned by :meth:`tables`.
+            path (str): path of the folder, created if needed.
+        """
+        nodes_df, edges_df = GraphExport.tables(graph) if isinstance(graph, nx.Graph) else graph
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        nodes_df.to_parquet(path / 'nodes.parquet', index=False)
+        edges_df.to_parquet(path / 'edges.parquet', index=False)
+        if 'coord_share_timestamps' in edges_df.attrs:
+            edges_df.attrs['coord_share_timestamps'].to_parquet(path / 'timestamps.parquet', index=False)
+        logger.info(f"{nodes_df.shape[0]} nodes and {edges_df.shape[0]} edges written to {path}")
+
+    @staticmethod
+    def read_parquet(path):
+        """Reads the node and edge tables written by :meth:`write_parquet`.
+
+        Args:
+            path (str): path of the folder.
+
+        Returns:
+            (tuple): the node table and the edge table.
+        """
+        path = Path(path)
+        nodes_df = pd.read_parquet(path / 'nodes.parquet')
+        edges_df = pd.read_parquet(path / 'edges.parquet')
+        if (path / 'timestamps.parquet').exists():
+            edges_df.attrs['coord_share_timestamps'] = pd.read_parquet(path / 'timestamps.parquet')
+        return nodes_df, edges_df
+
+    @staticmethod
+    def __attributes(table_df, exclude):
+        """Attribute columns that can be written to XML and their type: bool, int, float or str.
+
+        List attributes as timestamp_coord_share are only kept in the Parquet tables.
+        """
+        attributes = []
+        for column in table_df.columns:
+            if column in exclude:
+                continue
+            values = table_df[column].dropna()
+            if pd.api.types.is_bool_dtype(values):
+                attributes.append((column, 'bool'))
+            elif pd.api.types.is_integer_dtype(values):
+                attributes.append((column, 'int'))
+            elif pd.api.types.is_float_dtype(values):
+                attributes.append((column, 'float'))
+            elif values.map(lambda value: isinstance(value, (list, tuple, np.ndarray))).any():
+                logger.debug(f"list attribute {column} not written")
+            else:
+                attributes.append((column, 'str'))
+        return attributes
+
+    @staticmethod
+    def __rows(table_df, columns):
+        """Values of the columns, NaN and None as None and timestamps in ISO format.
+        """
+        for row in table_df[columns].itertuples(index=False, name=None):
+            yield [None if value is None or (isinstance(value, float) and np.isnan(value)) or value is pd.NaT
+                   else value.isoformat() if isinstance(value, pd.Timestamp)
+                   else value for value in row]
+
+    @staticmethod
+    def __value(value, attribute_type):
+        if attribute_type == 'bool' or isinstance(value, (bool, np.bool_)):
+            return 'true' if value else 'false'
+        if attribute_type == 'int' and isinstance(value, numbers.Number):
+            return str(int(value))
+        return str(value)
+
+    @staticmethod
+    def write_graphml(graph, path):
+        """Streams a graph to a GraphML file.
+
+        Args:
+            graph (networkx.Graph or tuple): the graph or its node and edge tables returned by :meth:`tables`.
+            path (str): path of the GraphML file.
+        """
+        nodes_df, edges_df = GraphExport.tables(graph) if isinstance(graph, nx.Graph) else graph
+        graphml_types = {'bool': 'boolean', 'int': 'long', 'float': 'double', 'str': 'string'}
+        node_attributes = GraphExport.__attributes(nodes_df, ['node'])
+        edge_attributes = GraphExport.__attributes(edges_df, ['u', 'v'])
+
+        with open(path, 'w', encoding='utf-8') as graphml_file:
+            graphml_file.write("<?xml version='1.0' encoding='utf-8'?>\n")
+            graphml_file.write('<graphml xmlns="http://graphml.graphdrawing.org/xmlns" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+                               'xsi:schemaLocation="http://graphml.graphdrawing.org/xmlns http://graphml.graphdrawing.org/xmlns/1.0/graphml.xsd">\n')
+            for prefix, target, attributes in (('n', 'node', node_attributes), ('e', 'edge', edge_attributes)):
+                for key, (column, attribute_type) in enumerate(attributes):
+                    graphml_file.write(f'<key id="{prefix}{key}" for="{target}" attr.name={_xml_attribute(str(column))} attr.type="{graphml_types[attribute_type]}" />\n')
+            graphml_file.write('<graph edgedefault="undirected">\n')
+
+            columns = [column for column, _ in node_attributes]
+            for row in GraphExport.__rows(nodes_df, ['node'] + columns):
+                graphml_file.write(f'<node id={_xml_attribute(str(row[0]))}>')
+                for key, (value, (_, attribute_type)) in enumerate(zip(row[1:], node_attributes)):
+                    if value is not None:
+                        graphml_file.write(f'<data key="n{key}">{_xml_text(GraphExport.__value(value, attribute_type))}</data>')
+                graphml_file.write('</node>\n')
+
+            columns = [column for column, _ in edge_attributes]
+            for row in GraphExport.__rows(edges_df, ['u', 'v'] + columns):
+                graphml_file.write(f'<edge source={_xml_attribute(str(row[0]))} target={_xml_attribute(str(row[1]))}>')
+                for key, (value, (_, attribute_type)) in enumerate(zip(row[2:], edge_attributes)):
+                    if value is not None:
+                        graphml_file.write(f'<data key="e{key}">{_xml_text(GraphExport.__value(value, attribute_type))}</data>')
+                graphml_file.write('</edge>\n')
+
+            graphml_file.write('</graph>\n</graphml>\n')
+        logger.info(f"{nodes_df.shape[0]} nodes and {edges_df.shape[0]} edges written to {path}")
+
+    @staticmethod
+    def write_gexf(graph, path, label='account_name'):
+        """Streams a graph to a GEXF 1.3 file for Gephi.
+
+        Args:
+            graph (networkx.Graph or tuple): the graph or its node and edge tables returned by :meth:`tables`.
+            path (str): path of the GEXF file.
+            label (str, optional): node attribute used as node label, the node id when it is missing.
+                Defaults to 'account_name'.
+        """
+        nodes_df, edges_df = GraphExport.tables(graph) if isinstance(graph, nx.Graph) else graph
+        gexf_types = {'bool': 'boolean', 'int': 'long', 'float': 'double', 'str': 'string'}
+        node_attributes = GraphExport.__attributes(nodes_df, ['node'])
+        edge_attributes = GraphExport.__attributes(edges_df, ['u', 'v', 'weight'])
+
+        with open(path, 'w', encoding='utf-8') as gexf_file:
+            gexf_file.write("<?xml version='1.0' encoding='utf-8'?>\n")
+            gexf_file.write('<gexf xmlns="http://gexf.net/1.3" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+                            'xsi:schemaLocation="http://gexf.net/1.3 http://gexf.net/1.3/gexf.xsd" version="1.3">\n')
+            gexf_file.write('<graph defaultedgetype="undirected" mode="static">\n')
+            for target, attributes in (('node', node_attributes), ('edge', edge_attributes)):
+                gexf_file.write(f'<attributes class="{target}" mode="static">\n')
+                for key, (column, attribute_type) in enumerate(attributes):
+                    gexf_file.write(f'<attribute id="{key}" title={_xml_attribute(str(column))} type="{gexf_types[attribute_type]}" />\n')
+                gexf_file.write('</attributes>\n')
+
+            gexf_file.write('<nodes>\n')
+            columns = [column for column, _ in node_attributes]
+            label_position = columns.index(label) + 1 if label in columns else 0
+            for row in GraphExport.__rows(nodes_df, ['node'] + columns):
+                node_label = row[label_position] if row[label_position] is not None else row[0]
+                gexf_file.write(f'<node id={_xml_attribute(str(row[0]))} label={_xml_attribute(str(node_label))}><attvalues>')
+                for key, (value, (_, attribute_type)) in enumerate(zip(row[1:], node_attributes)):
+                    if value is not None:
+                        gexf_file.write(f'<attvalue for="{key}" value={_xml_attribute(GraphExport.__value(value, attribute_type))} />')
+                gexf_file.write('</attvalues></node>\n')
+            gexf_file.write('</nodes>\n')
+
+            gexf_file.write('<edges>\n')
+            columns = [column for column, _ in edge_attributes]
+            for edge_id, row in enumerate(GraphExport.__rows(edges_df, ['u', 'v', 'weight'] + columns)):
+                gexf_file.write(f'<edge id="{edge_id}" source={_xml_attribute(str(row[0]))} target={_xml_attribute(str(row[1]))} weight="{row[2]}"><attvalues>')
+                for key, (value, (_, attribute_type)) in enumerate(zip(row[3:], edge_attributes)):
+                    if value is not None:
+                        gexf_file.write(f'<attvalue for="{key}" value={_xml_attribute(GraphExport.__value(value, attribute_type))} />')
+                gexf_file.write('</attvalues></edge>\n')
+            gexf_file.write('</edges>\n')
+
+            gexf_file.write('</graph>\n</gexf>\n')
+        logger.info(f"{nodes_df.shape[0]} nodes and {edges_df.shape[0]} edges written to {path}")
@@ -0,0 +1,277 @@
+import functools
+import inspect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import networkx as nx
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+def _peak_rss():
+    """Peak resident set size of the process in bytes, 0 where the resource module is missing.
+    """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Span:
+    """A stage of a run, measured from the enter to the exit of the with block.
+
+    Args:
+        profiler (Profiler): profiler that receives the span when it ends.
+        name (str): name of the stage.
+        parent (Span): enclosing span, None for the root span of a run.
+        rows_in (int, optional): rows processed by the stage. Defaults to None.
+        **attributes: other attributes of the stage.
+    """
+
+    def __init__(self, profiler, name, parent=None, rows_in=None, **attributes):
+        self.profiler = profiler
+        self.name = name
+        self.parent = parent
+        self.span_id = os.urandom(8).hex()
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.rows_in = rows_in() if callable(rows_in) else rows_in
+        self.rows_out = None
+        self.attributes = attributes
+
+    def set(self, rows_out=None, **attributes):
+        """Sets the rows returned by the stage and other attributes.
+
+        Args:
+            rows_out (int or callable, optional): rows returned by the stage, or a function that counts them, only
+                called when the profiler is enabled. Defaults to None.
+            **attributes: other attributes of the stage.
+        """
+        if rows_out is not None:
+            self.rows_out = rows_out() if callable(rows_out) else rows_out
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.profiler._push(self)
+        self.__start = time.time()
+        self.__rss = _peak_rss()
+        self.__cpu = time.process_time()
+        self.__wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall_time = time.perf_counter() - self.__wall
+        cpu_time = time.process_time() - self.__cpu
+        self.profiler._pop(self)
+        self.profiler._record({
+            'name': self.name,
+            'span_id': self.span_id,
+            'parent_id': self.parent.span_id if self.parent is not None else None,
+            'trace_id': self.trace_id,
+            'start': self.__start,
+            'wall_time': wall_time,
+            'cpu_time': cpu_time,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'peak_rss_delta': _peak_rss() - self.__rss,
+            'error': None if exc_type is None else f"{exc_type.__name__}: {exc_value}",
+            'attributes': self.attributes,
+        })
+        return False
+
+
+class _DisabledSpan:
+    """Span of a disabled profiler, it measures nothing.
+    """
+
+    def set(self, rows_out=None, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_DISABLED_SPAN = _DisabledSpan()
+
+
+def otel_span(record):
+    """Converts a span record to a dict with the layout of the OpenTelemetry spans exported as JSON.
+
+    Args:
+        record (dict): span record passed to the sinks.
+
+    Returns:
+        dict: the span with the keys name, context, parent_id, start_time, end_time, status and attributes.
+    """
+    attributes = {f"pycoornet.{key}": record[key] for key in ('wall_time', 'cpu_time', 'rows_in', 'rows_out', 'peak_rss_delta') if record[key] is not None}
+    attributes.update(record['attributes'])
+    return {
+        'name': record['name'],
+        'context': {'trace_id': f"0x{record['trace_id']}", 'span_id': f"0x{record['span_id']}"},
+        'parent_id': f"0x{record['parent_id']}" if record['parent_id'] is not None else None,
+        'start_time': int(record['start'] * 10 ** 9),
+        'end_time': int((record['start'] + record['wall_time']) * 10 ** 9),
+        'status': {'status_code': 'OK' if record['error'] is None else 'ERROR', 'description': record['error']},
+        'attributes': attributes,
+    }
+
+
+class Profiler:
+    """Collects the wall time, CPU time, rows in and out and peak RSS increase of the stages of Shared, CrowdTangle and
+    Statistics.
+
+    Every stage is a span, and the spans of the stages called by a stage are its children. The finished spans are kept
+    to build the timing reports and every span record is passed to the sink. The CPU time is the one of the process,
+    the time of the worker processes of n_jobs is only included in the wall time of the stage that waits for them. The
+    peak RSS increase is how much the stage raised the peak resident memory of the process, 0 when the stage stays
+    below a previous peak.
+
+    A disabled profiler, the default of the classes, doesn't measure anything.
+
+    Args:
+        sink (callable or str, optional): function called with the record of every finished span, or the path of a
+            JSON lines file where the records are appended. Defaults to None, the records are only kept.
+        span_format (str, optional): 'dict' passes the span records to the sink, 'otel' the dicts with the layout of
+            the OpenTelemetry spans returned by :func:`otel_span`. Defaults to 'dict'.
+        enabled (bool, optional): measure the stages. Defaults to True.
+    """
+
+    def __init__(self, sink=None, span_format='dict', enabled=True):
+        if span_format not in ('dict', 'otel'):
+            raise Exception(f"Unknown span_format '{span_format}'. Please choose 'dict' or 'otel'")
+        self.sink = sink
+        self.span_format = span_format
+        self.enabled = enabled
+        self.records = []
+        self.__local = threading.local()
+
+    def span(self, name, rows_in=None, **attributes):
+        """Creates the span of a stage, a child of the current span of the thread.
+
+        Args:
+            name (str): name of the stage.
+            rows_in (int or callable, optional): rows processed by the stage, or a function that counts them, only
+                called when the profiler is enabled. Defaults to None.
+            **attributes: other attributes of the stage.
+
+        Returns:
+            Span: context manager that measures the stage.
+        """
+        if not self.enabled:
+            return _DISABLED_SPAN
+        stack = getattr(self.__local, 'stack', None)
+        return Span(self, name, parent=stack[-1] if stack else None, rows_in=rows_in, **attributes)
+
+    def _push(self, span):
+        if not hasattr(self.__local, 'stack'):
+            self.__local.stack = []
+        self.__local.stack.append(span)
+
+    def _pop(self, span):
+        self.__local.stack.remove(span)
+
+    def _record(self, record):
+        self.records.append(record)
+        logger.debug(f"{record['name']}: {record['wall_time']:.3f}s wall, {record['cpu_time']:.3f}s cpu, {record['rows_in']} rows in, {record['rows_out']} rows out")
+        if self.sink is None:
+            return
+        output = otel_span(record) if self.span_format == 'otel' else record
+        if callable(self.sink):
+            self.sink(output)
+        else:
+            with open(self.sink, 'a', encoding='utf-8') as sink_file:
+                sink_file.write(json.dumps(output, default=str) + '\n')
+
+    def report(self, span=None):
+        """Timing report of a span and its descendants.
+
+        Args:
+            span (Span, optional): the span. Defaults to None, all the finished spans.
+
+        Returns:
+            pandas.DataFrame: one row per span in start order with the columns name, depth, wall_time, cpu_time,
+            rows_in, rows_out, peak_rss_delta, error, attributes, span_id and parent_id.
+        """
+        columns = ['name', 'depth', 'wall_time', 'cpu_time', 'rows_in', 'rows_out', 'peak_rss_delta', 'error', 'attributes', 'span_id', 'parent_id']
+        records = self.records if span is None else [record for record in self.records if record['trace_id'] == span.trace_id]
+        parents = {record['span_id']: record['parent_id'] for record in records}
+
+        def depth(span_id):
+            parent_id = parents[span_id]
+            return 0 if parent_id not in parents else depth(parent_id) + 1
+
+        if span is not None:
+            # descendants of the span
+            descendants = {span.span_id}
+            for record in sorted(records, key=lambda record: record['start']):
+                if record['parent_id'] in descendants:
+                    descendants.add(record['span_id'])
+            records = [record for record in records if record['span_id'] in descendants]
+            parents = {span_id: parent_id if span_id != span.span_id else None for span_id, parent_id in parents.items()}
+
+        report_df = pd.DataFrame(sorted(records, key=lambda record: record['start']), columns=columns + ['start'])
+        report_df['depth'] = [depth(span_id) for span_id in report_df['span_id']]
+        return report_df[columns].astype({'rows_in': 'Int64', 'rows_out': 'Int64'})
+
+    def clear(self):
+        """Drops the finished spans.
+        """
+        self.records = []
+
+
+DISABLED = Profiler(enabled=False)
+
+
+def _attach_report(result, report_df):
+    """Stores the timing report in graph.graph['timing'] of the graphs and in attrs['timing'] of the dataframes of a
+    result, as the list of the records of its rows. The attrs are compared and copied by pandas when it builds derived
+    dataframes, so they only hold plain values, pd.DataFrame(records) rebuilds the report.
+    """
+    records = report_df.astype(object).where(report_df.notna(), None).to_dict('records')
+    for value in (result if isinstance(result, tuple) else (result,)):
+        if isinstance(value, nx.Graph):
+            value.graph['timing'] = records
+        elif isinstance(value, (pd.DataFrame, pd.Series)):
+            value.attrs['timing'] = records
+    return result
+
+
+def profiled(name):
+    """Decorator that runs a method in a span of the profiler of its instance, or a function in a span of its profiler
+    argument, and stores the records of the timing report of the span in the result. It calls the function directly when the profiler
+    is disabled.
+
+    Args:
+        name (str): name of the span.
+    """
+    def decorator(function):
+        parameters = list(inspect.signature(function).parameters)
+        position = parameters.index('profiler') if 'profiler' in parameters else None
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if position is None:
+                profiler = args[0].profiler
+            else:
+                profiler = kwargs.get('profiler', args[position] if len(args) > position else None)
+            if profiler is None or not profiler.enabled:
+                return function(*args, **kwargs)
+            with profiler.span(name) as span:
+                result = function(*args, **kwargs)
+            return _attach_report(result, profiler.report(span))
+
+        return wrapper
+
+    return decorator
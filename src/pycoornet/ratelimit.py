@@ -0,0 +1,44 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread safe token bucket rate limiter shared by the workers that call an API.
+
+    Tokens are added at a rate of max_calls per period up to capacity, and every call takes one token.
+
+    Args:
+        max_calls (int): number of calls allowed per period.
+        period (float, optional): period in seconds. Defaults to 60.
+        capacity (int, optional): maximum number of calls that can be made in a burst. Defaults to 1.
+    """
+
+    def __init__(self, max_calls, period=60, capacity=1):
+        if max_calls <= 0:
+            raise Exception('max_calls must be greater than zero')
+        self.rate = max_calls / period
+        self.capacity = capacity
+        self.__tokens = capacity
+        self.__last = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available and takes it.
+        """
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__tokens = min(self.capacity, self.__tokens + (now - self.__last) * self.rate)
+                self.__last = now
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return
+                wait = (1 - self.__tokens) / self.rate
+            time.sleep(wait)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        return False
@@ -1,14 +1,657 @@
+from concurrent.futures import ProcessPoolExecutor
 import community as community_louvain
+from itertools import repeat
 import logging
 import networkx as nx
 from networkx.algorithms import bipartite
 import numpy as np
+import os
 import pandas as pd
+import pickle
+import pyarrow as pa
+import pyarrow.dataset as ds
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
 from tqdm import tqdm
+from .profiling import DISABLED, profiled
+from .sketch import QuantileSketch
 from .utils import Utils
 
+try:
+    import igraph
+    import leidenalg
+except ImportError:
+    leidenalg = None
+
 logger = logging.getLogger(__name__)
 
+# columns read from the share stores to detect the coordinated shares and to build the graph node attributes
+_DETECTION_COLUMNS = ['id', 'date', 'expanded', 'account_url']
+_ACCOUNT_COLUMNS = ['account_name', 'account_handle', 'account_pageAdminTopCountry', 'account_platform', 'account_verified', 'account_accountType']
+_JOINED_COLUMNS = {'account_name': 'name_changed', 'account_handle': 'handle_changed', 'account_pageAdminTopCountry': 'page_admin_top_country_changed'}
+
+
+def _share_table(crowdtangle_shares_df, clean_urls=False, keep_ourl_only=False):
+    """Builds the compact share table analyzed by the detectors.
+
+    Only the columns used by the detection are kept: expanded and account_url dictionary encoded as categoricals, date
+    as datetime64 (int64 nanoseconds) and id, with the position of every share in crowdtangle_shares_df to decode the
+    outputs. The shares of the URLs with only one share are removed. The account metadata is kept apart, see
+    _account_partials.
+
+    The shares are sorted by expanded and date, keeping the input order of the shares of a URL with the same date, and
+    every share has its rank within the URL and the time elapsed from the first share of the URL.
+
+    Args:
+        crowdtangle_shares_df (pandas.DataFrame): the pandas dataframe of link posts.
+        clean_urls (bool, optional): clean the URLs from the tracking parameters. Defaults to False.
+        keep_ourl_only (bool, optional): keep only the shares matching the original URLs. Defaults to False.
+
+    Returns:
+        pandas.DataFrame: the columns id, expanded, account_url, date, position, rank and first_share_offset.
+    """
+    positions = np.arange(crowdtangle_shares_df.shape[0])
+    if keep_ourl_only:
+        positions = positions[(crowdtangle_shares_df['is_orig'] == True).to_numpy()]
+        if len(positions) < 2:
+            logger.error("Can't execute with keep_ourl_only=True. Not enough posts matching original URLs")
+            raise Exception("Can't execute with keep_ourl_only=TRUE. Not enough posts matching original URLs")
+
+    urls = crowdtangle_shares_df['expanded'].iloc[positions]
+    if clean_urls:
+        urls = Utils.normalize_urls(urls)
+    url_codes, url_categories = pd.factorize(urls.to_numpy(), sort=True)
+
+    # keep the URLs with more than one share
+    counts = np.bincount(url_codes[url_codes >= 0], minlength=len(url_categories))
+    keep = url_codes >= 0
+    keep[keep] = counts[url_codes[keep]] > 1
+    shared_urls = counts > 1
+    positions = positions[keep]
+    url_codes = (np.cumsum(shared_urls) - 1)[url_codes[keep]]
+    dates = crowdtangle_shares_df['date'].iloc[positions].astype('datetime64[ns]').to_numpy()
+
+    # stable sort by url and date
+    order = np.lexsort((dates.view('int64'), url_codes))
+    positions, url_codes, dates = positions[order], url_codes[order], dates[order]
+    starts = np.flatnonzero(np.diff(url_codes, prepend=-1))
+    sizes = np.diff(np.r_[starts, len(positions)])
+
+    return pd.DataFrame({
+        'id': crowdtangle_shares_df['id'].iloc[positions].to_numpy(),
+        'expanded': pd.Categorical.from_codes(url_codes, url_categories[shared_urls]),
+        'account_url': pd.Categorical(crowdtangle_shares_df['account_url'].iloc[positions].to_numpy()),
+        'date': dates,
+        'position': positions,
+        'rank': np.arange(len(positions)) - np.repeat(starts, sizes) + 1,
+        'first_share_offset': dates - np.repeat(dates[starts], sizes),
+    })
+
+
+def _coord_windows_loop(crowdtangle_shares_df, coordination_interval):
+    """Detects coordinated share windows processing every URL on its own.
+
+    Args:
+        crowdtangle_shares_df (pandas.DataFrame): shares of the URLs with more than one share.
+        coordination_interval (int): a threshold in seconds that defines a coordinated share.
+
+    Returns:
+        pandas.DataFrame: one row per coordinated share with the columns cut, count, account_url, share_date, url and
+        window, the number of the window of the share within its URL. The windows of a URL are in order of their
+        first share and the shares of a window in input order.
+    """
+    url_positions = sorted(crowdtangle_shares_df.groupby('expanded', observed=True).indices.items())
+    dates = crowdtangle_shares_df['date'].astype('datetime64[ns]').to_numpy()
+    accounts = crowdtangle_shares_df['account_url'].to_numpy()
+
+    data_list = []
+    urls_count = len(url_positions)
+
+    with tqdm(total=urls_count) as pbar:
+        for i, (url, positions) in enumerate(url_positions, start=1):
+            pbar.update(1)
+            logger.debug(f"processing {i} of {urls_count}, url={url}")
+            if pd.Series(accounts[positions]).nunique() < 2:
+                continue
+            date_serie = dates[positions].view('int64') // 10 ** 9
+            div = (date_serie.max() - date_serie.min()) / coordination_interval + 1
+            logger.debug(f"cutting {url} in {div} parts")
+            windows, bins = pd.cut(dates[positions], int(div), labels=False, retbins=True)
+            counts = np.bincount(windows)[windows]
+            coordinated = counts > 1
+            if not coordinated.any():
+                continue
+
+            # windows in order of their first share
+            first_positions = np.full(len(bins), len(positions))
+            np.minimum.at(first_positions, windows, np.arange(len(positions)))
+            order = np.flatnonzero(coordinated)
+            order = order[np.argsort(first_positions[windows[order]], kind='mergesort')]
+            data_list.append(pd.DataFrame({
+                'cut': bins[windows[order]],
+                'count': counts[order],
+                'account_url': accounts[positions[order]],
+                'share_date': dates[positions[order]],
+                'url': url,
+                'window': windows[order] + 1,
+            }))
+
+    if len(data_list) == 0:
+        return pd.DataFrame(columns=['cut', 'count', 'account_url', 'share_date', 'url', 'window'])
+
+    return pd.concat(data_list, ignore_index=True)
+
+def _coord_windows_vectorized(crowdtangle_shares_df, coordination_interval):
+    """Detects coordinated share windows for all the URLs at once.
+
+    The shares are sorted once by (expanded, date) and every share is assigned to its coordination
+    interval window with integer arithmetic over the whole frame. The windows reproduce the equal width
+    bins of ``pandas.cut`` used by the loop engine, so both engines return the same table.
+
+    Args:
+        crowdtangle_shares_df (pandas.DataFrame): shares of the URLs with more than one share.
+        coordination_interval (int): a threshold in seconds that defines a coordinated share.
+
+    Returns:
+        pandas.DataFrame: one row per coordinated share with the columns cut, count, account_url, share_date, url and
+        window, as _coord_windows_loop.
+    """
+    if crowdtangle_shares_df.shape[0] == 0:
+        return pd.DataFrame(columns=['cut', 'count', 'account_url', 'share_date', 'url', 'window'])
+
+    url_codes, url_uniques = pd.factorize(crowdtangle_shares_df['expanded'], sort=True)
+    account_codes = pd.factorize(crowdtangle_shares_df['account_url'])[0]
+    dates = crowdtangle_shares_df['date'].astype('datetime64[ns]').to_numpy()
+    dates_ns = dates.view('int64')
+
+    logger.debug('sorting shares by url and date')
+    order = np.lexsort((dates_ns, url_codes))
+    url_sorted = url_codes[order]
+    dates_sorted = dates_ns[order]
+    starts = np.flatnonzero(np.r_[True, url_sorted[1:] != url_sorted[:-1]])
+    ends = np.r_[starts[1:], len(order)]
+    sizes = ends - starts
+
+    # keep only URLs shared by more than one account, the missing accounts (code -1) are not counted as nunique
+    account_sorted = account_codes[order]
+    pair_order = np.lexsort((account_sorted, url_sorted))
+    pair_url = url_sorted[pair_order]
+    pair_account = account_sorted[pair_order]
+    new_pair = np.r_[True, (pair_url[1:] != pair_url[:-1]) | (pair_account[1:] != pair_account[:-1])] & (pair_account >= 0)
+    accounts_per_url = np.bincount(pair_url[new_pair], minlength=len(url_uniques))[url_sorted[starts]]
+
+    # window width as computed by pandas.cut with an integer number of bins
+    min_ns = dates_sorted[starts]
+    max_ns = dates_sorted[ends - 1]
+    bins = ((max_ns // 10 ** 9 - min_ns // 10 ** 9) / coordination_interval + 1).astype('int64')
+    mn = min_ns.astype('float64')
+    mx = max_ns.astype('float64')
+    same = mn == mx
+    mn = np.where(same, mn - np.where(mn != 0, 0.001 * np.abs(mn), 0.001), mn)
+    mx = np.where(same, mx + np.where(mx != 0, 0.001 * np.abs(mx), 0.001), mx)
+    step = (mx - mn) / bins
+    adj = np.where(same, 0, (mx - mn) * 0.001)
+
+    share_mn = np.repeat(mn, sizes)
+    share_step = np.repeat(step, sizes)
+    share_bins = np.repeat(bins, sizes)
+    x = dates_sorted.astype('float64')
+
+    def edge(k):
+        return np.where(k >= share_bins, np.repeat(mx, sizes), k * share_step + share_mn)
+
+    # first guess of the (1 based) window, then fix float rounding on the window edges
+    window = np.clip(np.ceil((x - share_mn) / share_step), 1, share_bins).astype('int64')
+    while True:
+        down = (window > 1) & (edge(window - 1) >= x)
+        up = (window < share_bins) & (edge(window) < x)
+        if not (down.any() or up.any()):
+            break
+        window = window - down + up
+
+    left = np.where(window == 1, edge(window - 1) - np.repeat(adj, sizes), edge(window - 1))
+
+    windows_df = pd.DataFrame({
+        'position': order,
+        'url_code': url_sorted,
+        'window': window,
+        'cut': left.astype('int64').view('datetime64[ns]'),
+    })
+    windows_df = windows_df[np.repeat(accounts_per_url > 1, sizes)]
+    windows_gb = windows_df.groupby(['url_code', 'window'], sort=False)['position']
+    windows_df = windows_df.assign(count=windows_gb.transform('size'), first_position=windows_gb.transform('min'))
+    windows_df = windows_df[windows_df['count'] > 1]
+    windows_df = windows_df.sort_values(['url_code', 'first_position', 'position'])
+
+    positions = windows_df['position'].to_numpy()
+    return pd.DataFrame({
+        'cut': windows_df['cut'].to_numpy(),
+        'count': windows_df['count'].to_numpy(),
+        'account_url': crowdtangle_shares_df['account_url'].iloc[positions].to_numpy(),
+        'share_date': dates[positions],
+        'url': np.asarray(url_uniques)[windows_df['url_code'].to_numpy()],
+        'window': windows_df['window'].to_numpy(),
+    })
+
+
+def _coord_windows_differential(filtered_df, coordination_interval):
+    """Detects coordinated shares from the time elapsed between consecutive shares of the same URL.
+
+    A share is coordinated when the previous or the next share of the URL was performed within the coordination
+    interval, and every run of consecutive coordinated shares of a URL is a window.
+
+    Args:
+        filtered_df (pandas.DataFrame): shares of the URLs with more than one share sorted by expanded and date.
+        coordination_interval (int): a threshold in seconds that defines a coordinated share.
+
+    Returns:
+        pandas.DataFrame: one row per coordinated share in the order of filtered_df with the columns expanded, count
+        (coordinated shares of the URL), date, account_url and window, the number of the window within its URL.
+    """
+    url_codes = pd.factorize(filtered_df['expanded'])[0]
+    dates = filtered_df['date'].astype('datetime64[ns]').to_numpy()
+
+    logger.debug('selecting valid shares')
+    same_url = np.r_[False, url_codes[1:] == url_codes[:-1]]
+    close_previous = same_url & (np.diff(dates.view('int64'), prepend=0) <= coordination_interval * 10 ** 9)
+    coordinated = close_previous | np.r_[close_previous[1:], False]
+
+    # a window starts on every coordinated share not close to the previous one
+    window_starts = np.cumsum(coordinated & ~close_previous)
+    url_starts = np.flatnonzero(~same_url)
+    windows = window_starts - np.repeat(window_starts[url_starts] - (coordinated & ~close_previous)[url_starts], np.diff(np.r_[url_starts, len(url_codes)]))
+
+    counts = np.bincount(url_codes[coordinated], minlength=url_codes.max() + 1 if len(url_codes) else 0)
+    return pd.DataFrame({
+        'expanded': np.asarray(filtered_df['expanded'], dtype=object)[coordinated],
+        'count': counts[url_codes[coordinated]],
+        'date': dates[coordinated],
+        'account_url': np.asarray(filtered_df['account_url'], dtype=object)[coordinated],
+        'window': windows[coordinated],
+    })
+
+
+def _url_share_delays(crowdtangle_shares_df, p):
+    """Computes the share delays of every URL used by the coordination interval estimation.
+
+    Args:
+        crowdtangle_shares_df (pandas.DataFrame): share table built by _share_table.
+        p (float): percentage of total shares to be reached.
+
+    Returns:
+        pandas.DataFrame: one row per URL with the columns expanded, second_share_secs (seconds from the first to the
+        second share) and p_share_secs (seconds from the first share to the first share over the p% of the shares).
+    """
+    urls = crowdtangle_shares_df['expanded'].cat.categories
+    url_codes = crowdtangle_shares_df['expanded'].cat.codes.to_numpy()
+    ranks = crowdtangle_shares_df['rank'].to_numpy()
+    secs_from_first_share = crowdtangle_shares_df['first_share_offset'].dt.total_seconds().to_numpy()
+
+    #number of distinct shares of every URL
+    distinct = ~crowdtangle_shares_df.duplicated(['expanded', 'id']).to_numpy()
+    ct_shares_count = np.bincount(url_codes[distinct], minlength=len(urls))
+
+    #seconds to the second share, the shares of a URL are sorted by date
+    second_share_secs = np.full(len(urls), np.nan)
+    second = ranks == 2
+    second_share_secs[url_codes[second]] = secs_from_first_share[second]
+
+    #seconds to reach the p% of the shares, the first share over p% of every URL
+    p_share_secs = np.full(len(urls), np.nan)
+    over = ranks / ct_shares_count[url_codes] > p
+    over_urls, first_over = np.unique(url_codes[over], return_index=True)
+    p_share_secs[over_urls] = secs_from_first_share[over][first_over]
+
+    return pd.DataFrame({'expanded': np.asarray(urls, dtype=object), 'second_share_secs': second_share_secs, 'p_share_secs': p_share_secs})
+
+
+def _coord_interval_from_delays(delays_df, q, p):
+    """Estimates the coordination interval from the share delays of the URLs.
+
+    Args:
+        delays_df (pandas.DataFrame): share delays of the URLs returned by _url_share_delays.
+        q (float): quantile of quickest URLs to be filtered.
+        p (float): percentage of total shares to be reached.
+
+    Returns:
+        (tuple): summary statistics of the quickest URLs and the coordination interval.
+    """
+    #find URLs with an unusual fast second share and keep the quickest
+    quickest_df = delays_df[delays_df['second_share_secs']<=delays_df['second_share_secs'].quantile(q)]
+    p_share_secs = quickest_df['p_share_secs'].dropna().rename('sec_from_first_share')
+
+    return _coord_interval(p_share_secs.describe(), p_share_secs.quantile(p), q, p)
+
+
+def _coord_interval_from_sketches(delays, q, p, sketch_size):
+    """Estimates the coordination interval with quantile sketches of the share delays of the URLs.
+
+    The delays are read twice, the first time to find the quantile q of the seconds to the second share and the
+    second time to sketch the seconds to reach the p% of the shares of the quickest URLs, so only the sketches are
+    kept in memory.
+
+    Args:
+        delays (callable): returns an iterator over dataframes of share delays returned by _url_share_delays.
+        q (float): quantile of quickest URLs to be filtered.
+        p (float): percentage of total shares to be reached.
+        sketch_size (int): size k of the quantile sketches.
+
+    Returns:
+        (tuple): approximate summary statistics of the quickest URLs and the coordination interval.
+    """
+    second_share_sketch = QuantileSketch(sketch_size)
+    for delays_df in delays():
+        second_share_sketch.update(delays_df['second_share_secs'])
+    second_share_secs = second_share_sketch.quantile(q)
+
+    p_share_sketch = QuantileSketch(sketch_size)
+    for delays_df in delays():
+        p_share_sketch.update(delays_df.loc[delays_df['second_share_secs']<=second_share_secs, 'p_share_secs'])
+
+    return _coord_interval(p_share_sketch.describe().rename('sec_from_first_share'), p_share_sketch.quantile(p), q, p)
+
+
+def _coord_interval(summary_secs, coordination_interval, q, p):
+    """Logs the coordination interval and sets it to 1 second when it is 0.
+    """
+    coord_interval = (None, None)
+
+    if coordination_interval == 0:
+        coordination_interval = 1
+        coord_interval = (summary_secs, coordination_interval)
+        logger.warning(f'q (quantile of quickest URLs to be filtered): {q}')
+        logger.warning(f'p (percentage of total shares to be reached): {p}')
+        logger.warning(f'coordination interval from estimate_coord_interval: {coordination_interval}')
+        logger.warning('Warning: with the specified parameters p and q the median was 0 secs. The coordination interval has been automatically set to 1 secs')
+    else:
+        coord_interval = (summary_secs, coordination_interval)
+        logger.info(f'q (quantile of quickest URLs to be filtered): {q}')
+        logger.info(f'p (percentage of total shares to be reached): {p}')
+        logger.info(f'coordination interval from estimate_coord_interval: {coordination_interval}')
+
+    return coord_interval
+
+
+def _account_partials(crowdtangle_shares_df):
+    """Computes per account aggregates of a set of shares that can be combined with the ones of other sets.
+
+    Args:
+        crowdtangle_shares_df (pandas.DataFrame): shares with the is_coordinated column and the account columns.
+
+    Returns:
+        (tuple): the counts dataframe indexed by account_url with the columns shares, coord_shares, subscriber_sum and
+        subscriber_count, and the distinct account metadata rows in order of appearance.
+    """
+    counts_df = crowdtangle_shares_df.groupby('account_url').agg(
+        shares=('account_url', 'size'),
+        coord_shares=('is_coordinated', 'sum'),
+        subscriber_sum=('account_subscriberCount', 'sum'),
+        subscriber_count=('account_subscriberCount', 'count'),
+    )
+    accounts_df = crowdtangle_shares_df[['account_url'] + _ACCOUNT_COLUMNS].astype({column: str for column in _JOINED_COLUMNS})
+    return counts_df, accounts_df.drop_duplicates()
+
+
+def _account_info(counts_df, accounts_df):
+    """Computes the node attributes of the accounts from the aggregates of _account_partials.
+
+    Names, handles and countries are joined with | when an account changed them, in order of appearance, and the
+    other attributes take the first value of the account.
+
+    Args:
+        counts_df (pandas.DataFrame): combined counts of the accounts.
+        accounts_df (pandas.DataFrame): distinct account metadata rows in order of appearance.
+
+    Returns:
+        pandas.DataFrame: the attributes indexed by account_url.
+    """
+    first_df = accounts_df.groupby('account_url').agg(
+        account_platform=('account_platform', 'first'),
+        account_verified=('account_verified', 'first'),
+        account_account_type=('account_accountType', 'first'),
+    )
+    joined = {}
+    for column, changed_column in _JOINED_COLUMNS.items():
+        unique_gb = accounts_df[['account_url', column]].drop_duplicates().groupby('account_url')[column]
+        joined[column] = unique_gb.agg('|'.join)
+        joined[changed_column] = unique_gb.size() > 1
+
+    return pd.DataFrame({
+        'shares': counts_df['shares'],
+        'coord_shares': counts_df['coord_shares'],
+        'avg_account_subscriber_count': counts_df['subscriber_sum'] / counts_df['subscriber_count'],
+        'account_platform': first_df['account_platform'],
+        'account_name': joined['account_name'],
+        'account_verified': first_df['account_verified'],
+        'account_handle': joined['account_handle'],
+        'name_changed': joined['name_changed'],
+        'handle_changed': joined['handle_changed'],
+        'page_admin_top_country_changed': joined['page_admin_top_country_changed'],
+        'account_page_admin_top_country': joined['account_pageAdminTopCountry'],
+        'account_account_type': first_df['account_account_type'],
+    }).rename_axis('account_url')
+
+
+def _parquet_partitions(path, columns):
+    """Reads a Parquet share store one partition at a time.
+
+    The partitions are the hive partitions of the dataset (url_partition=0/, url_partition=1/, ...), a dataset that is
+    not partitioned is read as a single partition.
+
+    Args:
+        path (str): path of the Parquet file or dataset directory.
+        columns (list): columns to read.
+
+    Yields:
+        pandas.DataFrame: the shares of a partition.
+    """
+    dataset = ds.dataset(path, format='parquet', partitioning='hive')
+    missing = [column for column in columns if column not in dataset.schema.names]
+    if missing:
+        raise Exception(f"Can't find the columns {missing} in {path}")
+
+    partitions = {}
+    for fragment in dataset.get_fragments():
+        partitions.setdefault(str(fragment.partition_expression), []).append(fragment)
+    logger.debug(f"reading {len(partitions)} partitions of {path}")
+    for fragments in partitions.values():
+        shares_df = pa.concat_tables([fragment.to_table(columns=columns) for fragment in fragments]).to_pandas()
+        # missing values of the text columns are read as None, use NaN as the CrowdTangle dataframes
+        object_columns = shares_df.columns[shares_df.dtypes == object]
+        shares_df[object_columns] = shares_df[object_columns].fillna(np.nan)
+        yield shares_df
+
+
+def _sweep_pairs(shares_df, intervals):
+    """Coordinated shares of a share table for several coordination intervals, with the rule of
+    _coord_windows_differential: a share is coordinated when the previous or the next share of the URL was performed
+    within the interval. The gaps between consecutive shares are computed once and thresholded for every interval.
+
+    Args:
+        shares_df (pandas.DataFrame): share table built by _share_table.
+        intervals (list): coordination intervals in seconds.
+
+    Returns:
+        list: one (coordinated shares, account-URL pairs) tuple per interval. The number of coordinated shares counts
+        the shares flagged by coord_shares_differential and the pairs dataframe has the columns account_url and url.
+    """
+    gaps = shares_df['date'].diff().dt.total_seconds().to_numpy()
+    first = shares_df['rank'].to_numpy() == 1
+    key_codes = shares_df.groupby(['expanded', 'date', 'account_url'], observed=True, sort=False).ngroup().to_numpy()
+    pair_codes = shares_df.groupby(['expanded', 'account_url'], observed=True, sort=False).ngroup().to_numpy()
+    pairs_df = shares_df[['account_url', 'expanded']].rename(columns={'expanded': 'url'})
+
+    results = []
+    for coordination_interval in intervals:
+        close_previous = ~first & (gaps <= coordination_interval)
+        coordinated = close_previous | np.r_[close_previous[1:], False]
+        # shares with the same url, date and account of a coordinated share are flagged too
+        flagged = (np.bincount(key_codes[coordinated], minlength=key_codes.max() + 1) > 0)[key_codes] if len(key_codes) else coordinated
+        _, pair_positions = np.unique(pair_codes[coordinated], return_index=True)
+        results.append((int(flagged.sum()), pairs_df[coordinated].iloc[pair_positions]))
+    return results
+
+
+def _run_partitioned(detector, shares_df, coordination_interval, url_column, n_jobs=1, executor=None):
+    """Runs a coordinated shares detector over hash partitions of the shares by URL.
+
+    Every URL is processed independently, so the shares are split by a stable hash of their 'expanded' value,
+    each partition is processed by a worker and the resulting tables are concatenated and sorted by URL.
+    The result is the same whatever the number of workers.
+
+    Args:
+        detector (callable): module level function receiving the shares and the coordination interval.
+        shares_df (pandas.DataFrame): shares to process.
+        coordination_interval (int): a threshold in seconds that defines a coordinated share.
+        url_column (str): name of the URL column of the detector output.
+        n_jobs (int, optional): number of worker processes, -1 uses all the CPUs. Defaults to 1.
+        executor (concurrent.futures.Executor, optional): executor used instead of a new process pool. Defaults to None.
+
+    Returns:
+        pandas.DataFrame: the merged detector output.
+    """
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+
+    if (executor is None and n_jobs == 1) or shares_df.shape[0] == 0:
+        return detector(shares_df, coordination_interval)
+
+    # several partitions per worker to balance URLs with a very different number of shares
+    n_partitions = n_jobs * 4
+    partition_codes = pd.util.hash_pandas_object(shares_df['expanded'], index=False).to_numpy() % n_partitions
+    partitions = [shares_df[partition_codes == code] for code in np.unique(partition_codes)]
+    logger.debug(f"processing {len(partitions)} partitions")
+
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            results = list(pool.map(detector, partitions, repeat(coordination_interval)))
+    else:
+        results = list(executor.map(detector, partitions, repeat(coordination_interval)))
+
+    merged_df = pd.concat(results, ignore_index=True)
+    return merged_df.sort_values(url_column, kind='mergesort', ignore_index=True)
+
+
+def _leiden_partition(graph, seed=None):
+    """Leiden partition of a graph with leidenalg. Without leidenalg, the Louvain communities are split in their
+    connected parts, the guarantee of the Leiden refinement that every community is connected.
+    """
+    if leidenalg is not None:
+        nodes = list(graph.nodes)
+        codes = {node: code for code, node in enumerate(nodes)}
+        ig_graph = igraph.Graph(n=len(nodes), edges=[(codes[u], codes[v]) for u, v in graph.edges()])
+        ig_graph.es['weight'] = [w for _, _, w in graph.edges(data='weight', default=1)]
+        partition = leidenalg.find_partition(ig_graph, leidenalg.ModularityVertexPartition, weights='weight', seed=seed)
+        return {nodes[code]: cluster for code, cluster in enumerate(partition.membership)}
+
+    clusters = {}
+    louvain_clusters = {}
+    for node, cluster in _louvain_partition(graph, seed=seed).items():
+        louvain_clusters.setdefault(cluster, []).append(node)
+    parts = (part for cluster_nodes in louvain_clusters.values() for part in nx.connected_components(graph.subgraph(cluster_nodes)))
+    for cluster, part in enumerate(parts):
+        clusters.update(dict.fromkeys(part, cluster))
+    return clusters
+
+
+def _louvain_partition(graph, seed=None):
+    """Louvain partition of a graph with python-louvain.
+    """
+    return community_louvain.best_partition(graph, random_state=seed)
+
+
+_CLUSTERINGS = {
+    'louvain': _louvain_partition,
+    'leiden': _leiden_partition,
+}
+
+
+def _component_clusters(edges, clustering, seed):
+    """Clusters of a connected component.
+
+    Args:
+        edges (list): (u, v, weight) edges of the component.
+        clustering (str or callable): 'louvain', 'leiden' or a function receiving a networkx graph and a seed and
+            returning a dict node -> cluster.
+        seed (int): seed of the clustering.
+
+    Returns:
+        list: the nodes of every cluster.
+    """
+    graph = nx.Graph()
+    graph.add_weighted_edges_from(edges)
+    partition = _CLUSTERINGS[clustering](graph, seed=seed) if isinstance(clustering, str) else clustering(graph, seed=seed)
+    clusters = {}
+    for node, cluster in partition.items():
+        clusters.setdefault(cluster, []).append(node)
+    return list(clusters.values())
+
+
+def _check_clustering(clustering, n_jobs=1, executor=None):
+    """Checks the clustering argument of the detectors before the detection.
+
+    Raises an exception for an unknown clustering and for a function that can't be sent to the worker processes, and
+    logs a warning when 'leiden' is requested without leidenalg.
+    """
+    if isinstance(clustering, str):
+        if clustering not in _CLUSTERINGS:
+            raise Exception(f"Unknown clustering '{clustering}'. Please choose 'louvain', 'leiden' or a function")
+        if clustering == 'leiden' and leidenalg is None:
+            logger.warning("leidenalg is not installed, the 'leiden' clusters are the Louvain communities split in their connected parts. Install leidenalg and python-igraph to run Leiden")
+        return
+
+    if (executor is None and n_jobs != 1) or isinstance(executor, ProcessPoolExecutor):
+        try:
+            pickle.dumps(clustering)
+        except Exception as e:
+            raise Exception(f"The clustering function can't be sent to the worker processes, use a module level function or n_jobs=1: {e}")
+
+
+def _communities(graph, clustering='louvain', seed=None, n_jobs=1, executor=None):
+    """Connected components and clusters of the nodes of a graph.
+
+    The components are independent, so every component is clustered on its own and the components are processed
+    in parallel. The components are numbered from 1 and the clusters from 0, by decreasing size and then by their
+    smallest node, so the labels don't depend on the order of the nodes nor on the number of workers.
+
+    Args:
+        graph (networkx.Graph): the weighted graph.
+        clustering (str or callable, optional): 'louvain', 'leiden' or a function receiving a networkx graph and a
+            seed and returning a dict node -> cluster. Defaults to 'louvain'.
+        seed (int, optional): seed of the clustering. Defaults to None.
+        n_jobs (int, optional): number of worker processes, -1 uses all the CPUs. Defaults to 1.
+        executor (concurrent.futures.Executor, optional): executor used instead of a new process pool. Defaults to None.
+
+    Returns:
+        pandas.DataFrame: one row per node with the columns node, component and cluster.
+    """
+    def order(nodes):
+        return (-len(nodes), min(str(node) for node in nodes))
+
+    components = sorted((list(nodes) for nodes in nx.connected_components(graph)), key=order)
+    # one pass over the edges, in the order of graph.subgraph for every component
+    node_components = {node: component for component, nodes in enumerate(components) for node in nodes}
+    edges = [[] for _ in components]
+    for u, v, w in graph.edges(data='weight', default=1):
+        edges[node_components[u]].append((u, v, w))
+
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+    if executor is None and n_jobs == 1:
+        clusters = [_component_clusters(component_edges, clustering, seed) for component_edges in edges]
+    elif executor is None:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            clusters = list(pool.map(_component_clusters, edges, repeat(clustering), repeat(seed), chunksize=max(1, len(edges) // (n_jobs * 4))))
+    else:
+        clusters = list(executor.map(_component_clusters, edges, repeat(clustering), repeat(seed)))
+
+    rows = []
+    cluster = 0
+    for component, component_clusters in enumerate(clusters, start=1):
+        for cluster_nodes in sorted(component_clusters, key=order):
+            rows.extend((node, component, cluster) for node in sorted(cluster_nodes, key=str))
+            cluster += 1
+    return pd.DataFrame(rows, columns=['node', 'component', 'cluster'])
 
 
 class Shared:
@@ -18,11 +661,139 @@ class Shared:
     Args:
         crowdtangle_shares_df (pandas.DataFrame): the pandas dataframe of link posts resulting from the function
                 CrowdTangle shares
+        profiler (Profiler, optional): profiler of the stages of the detection. When it is enabled, the rows of the
+                timing report of every call are stored as a list of dicts in graph.graph['timing'] and in
+                attrs['timing'] of the returned dataframes. Defaults to None, no profiling.
     """
-    def __init__(self, crowdtangle_shares_df):
+    def __init__(self, crowdtangle_shares_df, profiler=None):
         self.__crowdtangle_shares_df = crowdtangle_shares_df
+        self.profiler = DISABLED if profiler is None else profiler
+        self.__parquet_path = None
+        self.__share_tables = {}
+
+    @classmethod
+    def from_parquet(cls, path, profiler=None):
+        """Creates a detector over a Parquet share store that doesn't fit in memory.
+
+        The store is processed one partition at a time, reading only the id, date, expanded and account_url columns to
+        detect the coordinated shares, and the account columns when the graph is built, so the memory used is bounded by
+        the largest partition and the coordinated shares. Every URL must be stored in a single partition, like the
+        stores written by :meth:`write_parquet`.
+
+        With a Parquet store, the dataframe returned by :meth:`coord_shares` and :meth:`coord_shares_differential`
+        only contains the coordinated shares, and the account attributes that take the first value of an account follow
+        the order of the partitions.
+
+        Args:
+            path (str): path of the Parquet file or hive partitioned dataset directory.
+            profiler (Profiler, optional): profiler of the stages of the detection. Defaults to None, no profiling.
+
+        Returns:
+            Shared: the detector.
+        """
+        shared = cls(None, profiler=profiler)
+        shared.__parquet_path = str(path)
+        return shared
+
+    @staticmethod
+    def write_parquet(crowdtangle_shares_df, path, n_partitions=16, clean_urls=False):
+        """Writes shares to a Parquet dataset hive partitioned by a hash of the URL, the layout read by from_parquet.
+
+        Args:
+            crowdtangle_shares_df (pandas.DataFrame): the pandas dataframe of link posts resulting from the function
+                CrowdTangle shares
+            path (str): path of the dataset directory.
+            n_partitions (int, optional): number of partitions. Defaults to 16.
+            clean_urls (bool, optional): partition by the cleaned URLs, needed to run the detection with clean_urls.
+                The stored URLs are not modified. Defaults to False.
+        """
+        urls = Utils.normalize_urls(crowdtangle_shares_df['expanded']) if clean_urls else crowdtangle_shares_df['expanded']
+        partition_codes = pd.util.hash_pandas_object(urls, index=False).to_numpy() % n_partitions
+        crowdtangle_shares_df.assign(url_partition=partition_codes).to_parquet(path, partition_cols=['url_partition'], index=False)
+
+    def __share_table(self, clean_urls, keep_ourl_only):
+        """Share table of the input dataframe, built on the first call with the same clean_urls and keep_ourl_only and
+        shared by the estimator and the detectors. The returned dataframe must not be modified.
+        """
+        key = (bool(clean_urls), bool(keep_ourl_only))
+        with self.profiler.span('share_table', rows_in=self.__crowdtangle_shares_df.shape[0], reused=key in self.__share_tables) as span:
+            if key not in self.__share_tables:
+                self.__share_tables[key] = _share_table(self.__crowdtangle_shares_df, clean_urls=clean_urls, keep_ourl_only=keep_ourl_only)
+            else:
+                logger.debug('reusing the share table')
+            span.set(rows_out=self.__share_tables[key].shape[0])
+        return self.__share_tables[key]
+
+    def __parquet_shares(self, columns, clean_urls, keep_ourl_only):
+        """Reads the partitions of the Parquet store and builds their share tables.
+        """
+        if keep_ourl_only:
+            columns = columns + ['is_orig']
+        for partition_df in _parquet_partitions(self.__parquet_path, columns):
+            with self.profiler.span('share_table', rows_in=partition_df.shape[0]) as span:
+                if keep_ourl_only:
+                    partition_df = partition_df[partition_df['is_orig'] == True]
+                shares_df = _share_table(partition_df, clean_urls=clean_urls)
+                span.set(rows_out=shares_df.shape[0])
+            yield partition_df, shares_df
+
+    def __coord_shares_parquet(self, differential, coordination_interval, percentile_edge_weight, clean_urls, keep_ourl_only, gtimestamps, engine, n_jobs, executor, graph_backend, clustering, seed):
+        """Runs coord_shares or coord_shares_differential over the Parquet store.
+
+        The first pass detects the coordinated shares of every partition. The second pass reads the account columns,
+        flags the coordinated shares and aggregates the account attributes partition by partition. With n_jobs workers
+        and no executor, one process pool is shared by all the partitions.
+        """
+        if differential:
+            detector, url_column = _coord_windows_differential, 'expanded'
+        else:
+            detector, url_column = (_coord_windows_loop if engine == 'loop' else _coord_windows_vectorized), 'url'
+
+        if n_jobs is None or n_jobs < 1:
+            n_jobs = os.cpu_count() or 1
+        # one pool for all the partitions and the communities, instead of one per partition
+        if executor is None and n_jobs > 1:
+            with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+                return self.__coord_shares_parquet(differential, coordination_interval, percentile_edge_weight, clean_urls, keep_ourl_only, gtimestamps, engine, n_jobs, pool, graph_backend, clustering, seed)
+
+        windows = []
+        for _, shares_df in self.__parquet_shares(_DETECTION_COLUMNS, clean_urls, keep_ourl_only):
+            if not differential:
+                shares_df = shares_df.sort_values('position', ignore_index=True)
+            with self.profiler.span('detect', rows_in=shares_df.shape[0]) as span:
+                windows.append(_run_partitioned(detector, shares_df, coordination_interval, url_column, n_jobs=n_jobs, executor=executor))
+                span.set(rows_out=windows[-1].shape[0])
+        coordinated_shares_df = pd.concat(windows, ignore_index=True).sort_values(url_column, kind='mergesort', ignore_index=True)
+
+        if coordinated_shares_df.shape[0] == 0:
+            logger.info('there are not enough shares!')
+            return None
 
-    def estimate_coord_interval(self, q=0.1, p=0.5, clean_urls=False, keep_ourl_only=False):
+        counts, accounts, coordinated = [], [], []
+        for partition_df, shares_df in self.__parquet_shares(_DETECTION_COLUMNS + _ACCOUNT_COLUMNS + ['account_subscriberCount'], clean_urls, keep_ourl_only):
+            with self.profiler.span('flag_shares', rows_in=shares_df.shape[0]) as span:
+                shares_df = shares_df.assign(is_coordinated=self.__coordinated_flags(shares_df, coordinated_shares_df, differential))
+                shares_df = self.__decode_shares(partition_df, shares_df, clean_urls)
+                span.set(rows_out=lambda: int(shares_df['is_coordinated'].sum()))
+            with self.profiler.span('account_partials', rows_in=shares_df.shape[0]):
+                counts_df, accounts_df = _account_partials(shares_df)
+            counts.append(counts_df)
+            accounts.append(accounts_df)
+            coordinated.append(shares_df[shares_df['is_coordinated']])
+
+        with self.profiler.span('account_info', rows_in=lambda: sum(counts_df.shape[0] for counts_df in counts)) as span:
+            account_info_df = _account_info(pd.concat(counts).groupby(level=0).sum(), pd.concat(accounts).drop_duplicates())
+            span.set(rows_out=account_info_df.shape[0])
+        coordinated_df = pd.concat(coordinated, ignore_index=True)
+        if differential:
+            coordinated_shares_df = coordinated_shares_df.rename(columns={'expanded': 'url', 'date': 'share_date'})
+
+        highly_connected_graph, q = self.__buid_graph(coordinated_df, coordinated_shares_df, percentile_edge_weight=percentile_edge_weight, timestamps=gtimestamps, backend=graph_backend, account_info_df=account_info_df, clustering=clustering, seed=seed, n_jobs=n_jobs, executor=executor)
+
+        return coordinated_df, highly_connected_graph, q
+
+    @profiled('estimate_coord_interval')
+    def estimate_coord_interval(self, q=0.1, p=0.5, clean_urls=False, keep_ourl_only=False, method='exact', sketch_size=200):
         """
         Estimates a threshold in seconds that defines a coordinated link share. While it is common that multiple
         (pages/groups/account) entities share the same link, some tend to perform these actions in an unusually short period of time.
@@ -41,6 +812,13 @@ class Shared:
 
             keep_ourl_only (bool, optional): restrict the analysis to CrownTangle shares links matching the original URLs. Defaults to False.
 
+            method (str, optional): 'exact' computes the quantiles over the share delays of all the URLs, 'sketch'
+                approximates them with quantile sketches, so only the sketches are kept in memory when the shares are
+                read from a Parquet store. Defaults to 'exact'.
+
+            sketch_size (int, optional): size of the quantile sketches, the rank error of the quantiles is about
+                1.7 / sketch_size. Defaults to 200.
+
         Returns:
             (tuple): 2-element tuple containing
 
@@ -55,94 +833,117 @@ class Shared:
             logger.error('The q value must be between 0 and 1')
             raise Exception('The q value must be between 0 and 1')
 
-        crowdtangle_shares_df = self.__crowdtangle_shares_df.copy(deep=True)
+        if method not in ('exact', 'sketch'):
+            raise Exception(f"Unknown method '{method}'. Please choose 'exact' or 'sketch'")
 
-        # keep original URLs only?
-        if keep_ourl_only:
-            crowdtangle_shares_df = crowdtangle_shares_df[crowdtangle_shares_df['is_orig'] == True]
-            if crowdtangle_shares_df.shape[0] < 2:
-                logger.error("Can't execute with keep_ourl_only=True. Not enough posts matching original URLs")
-                raise Exception("Can't execute with keep_ourl_only=TRUE. Not enough posts matching original URLs")
-            else:
+        if self.__parquet_path is not None:
+            def delays():
+                return (_url_share_delays(shares_df, p) for _, shares_df in self.__parquet_shares(_DETECTION_COLUMNS, clean_urls, keep_ourl_only))
+        else:
+            crowdtangle_shares_df = self.__share_table(clean_urls, keep_ourl_only)
+            if keep_ourl_only:
                 logger.info("Coordination interval estimated on shares matching original URLs")
+            if clean_urls:
+                logger.info('Coordination interval estimated on cleaned URLs')
 
-        # clean urls?
-        if clean_urls:
-            crowdtangle_shares_df = Utils.clean_urls(crowdtangle_shares_df, 'expanded')
-            logger.info('Coordination interval estimated on cleaned URLs')
-
-
-        crowdtangle_shares_df = crowdtangle_shares_df[['id', 'date', 'expanded']]
-
-        # count the number of diferent URLs
-        urls_df = pd.DataFrame(crowdtangle_shares_df['expanded'].value_counts())
-        urls_df.reset_index(level=0, inplace=True)
-        urls_df.columns = ['URL', 'ct_shares']
-        # filter the URLS where the count is > 1
-        urls_df = urls_df[urls_df['ct_shares'] >1]
+            def delays():
+                return iter([_url_share_delays(crowdtangle_shares_df, p)])
 
-        # filter the crowdtangle_shares_df that join with urls_df
-        crowdtangle_shares_df = crowdtangle_shares_df[crowdtangle_shares_df.set_index('expanded').index.isin(urls_df.set_index('URL').index)]
+        with self.profiler.span('share_delays', method=method):
+            if method == 'sketch':
+                return _coord_interval_from_sketches(delays, q, p, sketch_size)
+            return _coord_interval_from_delays(pd.concat(delays(), ignore_index=True), q, p)
 
-        #metrics creation
-        crowdtangle_shares_df['date'] = crowdtangle_shares_df['date'].astype('datetime64[ns]')
-        ranked_shares_df = crowdtangle_shares_df[['expanded', 'date']]
-        shares_gb = crowdtangle_shares_df.groupby('expanded')
-        ranked_shares_df['ct_shares_count']=shares_gb['id'].transform('nunique')
-        ranked_shares_df['first_share_date'] = shares_gb['date'].transform('min')
-        ranked_shares_df['rank'] = shares_gb['date'].rank(ascending=True, method='first')
-        ranked_shares_df['perc_of_shares'] = ranked_shares_df['rank']/ranked_shares_df['ct_shares_count']
-        ranked_shares_df['sec_from_first_share'] = (ranked_shares_df['date'] - ranked_shares_df['first_share_date']).dt.total_seconds()
-        ranked_shares_df = ranked_shares_df.sort_values(by = 'expanded')
+    def __buid_graph(self, crowdtangle_shares_df, coordinated_shares_df, percentile_edge_weight = 90, timestamps = False, backend = 'networkx', account_info_df = None, clustering = 'louvain', seed = None, n_jobs = 1, executor = None):
+        logger.info("Bulding graph")
+        coord_df = coordinated_shares_df[['account_url', 'url', 'share_date']].reset_index(drop=True)
 
-        #find URLs with an unusual fast second share and keep the quickest
-        filtered_ranked_df = ranked_shares_df[ranked_shares_df['rank']==2].copy(deep=True)
-        filtered_ranked_df['sec_from_first_share'] = filtered_ranked_df.groupby('expanded')['sec_from_first_share'].transform('min')
-        filtered_ranked_df = filtered_ranked_df[['expanded', 'sec_from_first_share']]
-        filtered_ranked_df = filtered_ranked_df.drop_duplicates()
+        with self.profiler.span('project', rows_in=coord_df.shape[0], backend=backend) as span:
+            if backend == 'sparse':
+                highly_connected_graph, q, degree_df, strength_df = self.__project_sparse(coord_df, percentile_edge_weight)
+            else:
+                highly_connected_graph, q, degree_df, strength_df = self.__project_networkx(coord_df, percentile_edge_weight)
+            span.set(rows_out=highly_connected_graph.number_of_edges, q=float(q))
 
-        filtered_ranked_df = filtered_ranked_df[filtered_ranked_df['sec_from_first_share']<=filtered_ranked_df['sec_from_first_share'].quantile(q)]
+        #pandas helper dataframe to calcule graph node attribues
+        if account_info_df is None:
+            with self.profiler.span('account_info', rows_in=crowdtangle_shares_df.shape[0]) as span:
+                account_info_df = _account_info(*_account_partials(crowdtangle_shares_df))
+                joined_columns = {'account_name': 'account_name', 'account_handle': 'account_handle', 'account_pageAdminTopCountry': 'account_page_admin_top_country'}
+                for (column, joined_column), changed_column in zip(joined_columns.items(), ['name_changed', 'handle_changed', 'page_admin_top_country_changed']):
+                    crowdtangle_shares_df[changed_column] = crowdtangle_shares_df['account_url'].map(account_info_df[changed_column])
+                    crowdtangle_shares_df[column] = crowdtangle_shares_df['account_url'].map(account_info_df[joined_column])
+                span.set(rows_out=account_info_df.shape[0])
+
+        with self.profiler.span('node_attributes', rows_in=highly_connected_graph.number_of_nodes):
+            #boolean attributes are stored as 0/1
+            flag_columns = ['account_verified', 'name_changed', 'handle_changed', 'page_admin_top_country_changed']
+            account_info_df[flag_columns] = account_info_df[flag_columns].astype(bool).astype(int)
+
+            #update graph attributes with the rows of the graph nodes
+            node_info_df = account_info_df.loc[list(highly_connected_graph.nodes)]
+            nx.set_node_attributes(highly_connected_graph, node_info_df.to_dict('index'))
 
+        if timestamps:
+            with self.profiler.span('timestamps', rows_in=highly_connected_graph.number_of_edges):
+                logger.info("Calculating edges timestamps")
+                timestamps_df = self.__edge_timestamps(coord_df, highly_connected_graph)
+                edge_codes, edge_starts = np.unique(timestamps_df['edge'].to_numpy(), return_index=True)
+                edges = list(highly_connected_graph.edges())
+                share_dates = timestamps_df['timestamp'].to_numpy()
+                first_dates = np.minimum.reduceat(share_dates, edge_starts) if len(edge_starts) else share_dates
+                last_dates = np.maximum.reduceat(share_dates, edge_starts) if len(edge_starts) else share_dates
+
+                attributes = {}
+                for code, first_date, last_date in zip(edge_codes, first_dates, last_dates):
+                    attributes[edges[code]] = {'timestamp_first_coord_share': pd.Timestamp(first_date), 'timestamp_last_coord_share': pd.Timestamp(last_date)}
+                if timestamps == 'table':
+                    highly_connected_graph.graph['coord_share_timestamps'] = timestamps_df.drop(columns='edge')
+                else:
+                    share_dates = pd.DatetimeIndex(share_dates).astype(object).to_numpy()
+                    for code, dates in zip(edge_codes, np.split(share_dates, edge_starts[1:])):
+                        attributes[edges[code]]['timestamp_coord_share'] = dates
+                nx.set_edge_attributes(highly_connected_graph, attributes)
+
+                #first and last coordinated share of every account of the graph
+                node_dates_gb = coord_df[coord_df['account_url'].isin(list(highly_connected_graph.nodes))].groupby('account_url')['share_date']
+                node_dates_df = pd.DataFrame({'timestamp_first_coord_share': node_dates_gb.min(), 'timestamp_last_coord_share': node_dates_gb.max()})
+                nx.set_node_attributes(highly_connected_graph, node_dates_df.to_dict('index'))
+                logger.info("timestamps calculated")
+
+        #find and annotate nodes-components, and add cluster to simplyfy the analysis of large components
+        with self.profiler.span('communities', rows_in=highly_connected_graph.number_of_nodes, clustering=clustering if isinstance(clustering, str) else 'custom') as span:
+            components_df = _communities(highly_connected_graph, clustering=clustering, seed=seed, n_jobs=n_jobs, executor=executor)
+            span.set(rows_out=lambda: int(components_df['component'].max()) if components_df.shape[0] else 0)
+
+        attributes_df = components_df.merge(degree_df, on='node').merge(strength_df, on='node')
 
-        # filter the ranked_shares_df that join with filtered_ranked_df
-        ranked_shares_df = ranked_shares_df[ranked_shares_df.set_index('expanded').index.isin(filtered_ranked_df.set_index('expanded').index)]
-        #filter the results by p value
-        ranked_shares_sub_df = ranked_shares_df[ranked_shares_df['perc_of_shares']>p].copy(deep=True)
-        ranked_shares_sub_df['sec_from_first_share'] = ranked_shares_sub_df.groupby('expanded')['sec_from_first_share'].transform('min')
-        ranked_shares_sub_df = ranked_shares_sub_df[['expanded', 'sec_from_first_share']]
-        ranked_shares_sub_df = ranked_shares_sub_df.drop_duplicates()
+        #update graph attribues
+        with self.profiler.span('component_attributes', rows_in=attributes_df.shape[0]):
+            nx.set_node_attributes(highly_connected_graph, attributes_df.set_index('node').to_dict('index'))
+        logger.info("graph builded")
 
-        summary_secs = ranked_shares_sub_df['sec_from_first_share'].describe()
-        coordination_interval= ranked_shares_sub_df['sec_from_first_share'].quantile(p)
+        return highly_connected_graph, q
 
-        coord_interval = (None, None)
 
-        if coordination_interval == 0:
-            coordination_interval = 1
-            coord_interval = (summary_secs, coordination_interval)
-            logger.warning(f'q (quantile of quickest URLs to be filtered): {q}')
-            logger.warning(f'p (percentage of total shares to be reached): {p}')
-            logger.warning(f'coordination interval from estimate_coord_interval: {coordination_interval}')
-            logger.warning('Warning: with the specified parameters p and q the median was 0 secs. The coordination interval has been automatically set to 1 secs')
-        else:
-            coord_interval = (summary_secs, coordination_interval)
-            logger.info(f'q (quantile of quickest URLs to be filtered): {q}')
-            logger.info(f'p (percentage of total shares to be reached): {p}')
-            logger.info(f'coordination interval from estimate_coord_interval: {coordination_interval}')
+    def __project_networkx(self, coord_df, percentile_edge_weight):
+        """Projects the account-URL bipartite graph on the accounts with networkx and keeps the edges over the percentile.
 
-        return coord_interval
+        Args:
+            coord_df (pandas.DataFrame): coordinated shares with the columns account_url, url and share_date.
+            percentile_edge_weight (float): percentile of the edge weight distribution to keep.
 
-    def __buid_graph(self, crowdtangle_shares_df, coordinated_shares_df, percentile_edge_weight = 90, timestamps = False):
-        logger.info("Bulding graph")
-        coord_df = coordinated_shares_df[['account_url', 'url', 'share_date']].reset_index(drop=True)
+        Returns:
+            (tuple): the filtered graph, the percentile edge weight and the degree and strength dataframes.
+        """
         coord_graph = nx.from_pandas_edgelist(coord_df, 'account_url', 'url', create_using=nx.DiGraph())
 
         # Remove self loop node edges
         coord_graph.remove_edges_from(nx.selfloop_edges(coord_graph))
 
         #Bipartite graph creation
-        account_urls = list(coordinated_shares_df['account_url'].unique())
-        urls = list(coordinated_shares_df['url'].unique())
+        account_urls = list(coord_df['account_url'].unique())
+        urls = list(coord_df['url'].unique())
 
         bipartite_graph = nx.Graph()
         logger.debug('adding nodes')
@@ -156,62 +957,6 @@ class Shared:
         logger.debug('Projecting graph')
         full_graph = bipartite.weighted_projected_graph(bipartite_graph, account_urls)
 
-        #pandas helper dataframe to calcule graph node attribues
-        crowdtangle_shares_df['account_name'] = crowdtangle_shares_df['account_name'].astype(str)
-        crowdtangle_shares_df['account_handle'] = crowdtangle_shares_df['account_handle'].astype(str)
-        crowdtangle_shares_df['account_pageAdminTopCountry'] = crowdtangle_shares_df['account_pageAdminTopCountry'].astype(str)
-        crowtangle_shares_gb = crowdtangle_shares_df.groupby('account_url')
-        crowdtangle_shares_df['name_changed']=(crowtangle_shares_gb['account_name'].transform("nunique"))>1
-        crowdtangle_shares_df['handle_changed']=(crowtangle_shares_gb['account_handle'].transform("nunique"))>1
-        crowdtangle_shares_df['page_admin_top_country_changed']=(crowtangle_shares_gb['account_pageAdminTopCountry'].transform("nunique"))>1
-        crowdtangle_shares_df['account_name'] = crowtangle_shares_gb['account_name'].transform(lambda col: '|'.join(col.unique()))
-        crowdtangle_shares_df['account_handle'] = crowtangle_shares_gb['account_handle'].transform(lambda col: '|'.join(col.unique()))
-        crowdtangle_shares_df['account_pageAdminTopCountry'] = crowtangle_shares_gb['account_pageAdminTopCountry'].transform(lambda col: '|'.join(col.unique()))
-        crowdtangle_shares_df[['account_name','account_handle','account_pageAdminTopCountry','name_changed','handle_changed','page_admin_top_country_changed']]
-
-        crowtangle_shares_gb = crowdtangle_shares_df.reset_index().groupby(['account_url'])
-
-        account_info_df = crowtangle_shares_gb['index'].agg([('shares','count')])
-        account_info_df = account_info_df.merge(pd.DataFrame(crowtangle_shares_gb['is_coordinated'].apply(lambda x: (x==True).sum())).rename(columns={'is_coordinated':'coord_shares'}), left_index=True, right_index=True)
-        account_info_df = account_info_df.merge(crowtangle_shares_gb['account_subscriberCount'].agg([('avg_account_subscriber_count','mean')]), left_index=True, right_index=True)
-        account_info_df = account_info_df.merge(crowtangle_shares_gb['account_name'].agg([('account_name','first')]), left_index=True, right_index=True)
-        account_info_df = account_info_df.merge(crowtangle_shares_gb['name_changed'].agg('first'), left_index=True, right_index=True)
-        account_info_df = account_info_df.merge(crowtangle_shares_gb['handle_changed'].agg('first'), left_index=True, right_index=True)
-        account_info_df = account_info_df.merge(crowtangle_shares_gb['page_admin_top_country_changed'].agg('first'), left_index=True, right_index=True)
-        account_info_df = account_info_df.merge(crowtangle_shares_gb['account_pageAdminTopCountry'].agg([('account_page_admin_top_country','first')]), left_index=True, right_index=True)
-        account_info_df = account_info_df.merge(crowtangle_shares_gb['account_handle'].agg([('account_handle','first')]), left_index=True, right_index=True)
-        account_info_df = account_info_df.merge(crowtangle_shares_gb['account_platform'].agg([('account_platform','first')]), left_index=True, right_index=True)
-        account_info_df = account_info_df.merge(crowtangle_shares_gb['account_platformId'].agg([('account_platformId','first')]), left_index=True, right_index=True)
-        account_info_df = account_info_df.merge(crowtangle_shares_gb['account_verified'].agg([('account_verified','first')]), left_index=True, right_index=True)
-        account_info_df = account_info_df.merge(crowtangle_shares_gb['account_accountType'].agg([('account_account_type','first')]), left_index=True, right_index=True)
-        account_info_df = account_info_df.reset_index().rename(columns={'account_url':'account_url'})
-
-        #filter the dataframe with the graph nodes
-        node_info_df = account_info_df[account_info_df['account_url'].isin(list(full_graph.nodes))]
-
-        attributes= []
-        for node in full_graph.nodes():
-            records = node_info_df[node_info_df['account_url']==node]
-            attributes.append(node)
-            attributes.append({
-                    'shares': records['shares'].values[0],
-                    'coord_shares': records['coord_shares'].values[0],
-                    'avg_account_subscriber_count': records['avg_account_subscriber_count'].values[0],
-                    'account_platform': records['account_platform'].values[0],
-                    'account_name': records['account_name'].values[0],
-                    'account_verified': 1 if records['account_verified'].values[0] else 0,
-                    'account_handle': records['account_handle'].values[0],
-                    'name_changed': 1 if records['name_changed'].values[0] else 0,
-                    'handle_changed': 1 if records['handle_changed'].values[0] else 0,
-                    'page_admin_top_country_changed': 1 if records['page_admin_top_country_changed'].values[0] else 0,
-                    'account_page_admin_top_country': records['account_page_admin_top_country'].values[0],
-                    'account_account_type': records['account_account_type'].values[0]
-
-            })
-        #update graph attributes
-        it = iter(attributes)
-        nx.set_node_attributes(full_graph, dict(zip(it, it)))
-
         #set the percentile_edge_weight number of repetedly coordinated link sharing to keep
         q = np.percentile([d['weight'] for (u,v,d) in full_graph.edges(data=True)], percentile_edge_weight)
 
@@ -223,42 +968,159 @@ class Shared:
         highly_connected_graph.remove_edges_from(edges_to_remove)
         highly_connected_graph.remove_nodes_from(list(nx.isolates(highly_connected_graph)))
 
-        if timestamps:
-            logger.info("Calculating nodes timestamps")
-            vec_func = np.vectorize(lambda u,v: bipartite_graph.get_edge_data(u,v)['share_date'])
-            attributes = []
-            for (u,v) in highly_connected_graph.edges():
-                attributes.append((u,v))
-                attributes.append({"timestamp_coord_share":vec_func(np.intersect1d(list(list(bipartite_graph.neighbors(u))),list(list(bipartite_graph.neighbors(v)))),u)})
-
-            it = iter(attributes)
-            nx.set_edge_attributes(highly_connected_graph, dict(zip(it, it)))
-            logger.info("timestamps calculated")
-
-        #find and annotate nodes-components
-        connected_components=list(nx.connected_components(highly_connected_graph))
-        components_df = pd.DataFrame({"node": connected_components, "component": [*range(1,len(connected_components)+1)]})
-        components_df['node'] = components_df['node'].apply(lambda x: list(x))
-        components_df = components_df.explode('node')
-
-        #add cluster to simplyfy the analysis of large components
-        cluster_df = pd.DataFrame(community_louvain.best_partition(highly_connected_graph).items(), columns=['node', 'cluster'])
-
-         #re-calculate the degree on the graph
+        #re-calculate the degree on the graph
         degree_df = pd.DataFrame(list(highly_connected_graph.degree()), columns=['node', 'degree'])
         #sum up the edge weights of the adjacent edges for each node
         strength_df = pd.DataFrame(list(highly_connected_graph.degree(weight='weight')), columns=['node', 'strength'])
 
-        attributes_df = components_df.merge(cluster_df, on='node').merge(degree_df, on='node').merge(strength_df, on='node')
+        return highly_connected_graph, q, degree_df, strength_df
 
-        #update graph attribues
-        nx.set_node_attributes(highly_connected_graph, attributes_df.set_index('node').to_dict('index'))
-        logger.info("graph builded")
+    def __project_sparse(self, coord_df, percentile_edge_weight):
+        """Projects the account-URL bipartite graph on the accounts with sparse matrices and keeps the edges over the percentile.
 
-        return highly_connected_graph, q
+        Accounts and URLs are encoded as integer codes, the co-share weights are the upper triangle of B @ B.T where B is
+        the account x URL incidence matrix, and a networkx graph is only created for the edges that survive the percentile.
+
+        Args:
+            coord_df (pandas.DataFrame): coordinated shares with the columns account_url, url and share_date.
+            percentile_edge_weight (float): percentile of the edge weight distribution to keep.
+
+        Returns:
+            (tuple): the filtered graph, the percentile edge weight and the degree and strength dataframes.
+        """
+        account_codes, accounts = pd.factorize(coord_df['account_url'])
+        url_codes, urls = pd.factorize(coord_df['url'], sort=True)
+
+        # one entry per (account, url) pair, the last share date wins as in the bipartite graph
+        pairs_df = pd.DataFrame({'account': account_codes, 'url': url_codes, 'share_date': coord_df['share_date'].to_numpy()})
+        pairs_df = pairs_df.drop_duplicates(['account', 'url'], keep='last').sort_values(['account', 'url'])
 
+        logger.debug('Projecting graph')
+        incidence = sparse.csr_matrix((np.ones(pairs_df.shape[0], dtype='int64'), (pairs_df['account'].to_numpy(), pairs_df['url'].to_numpy())),
+                                      shape=(len(accounts), len(urls)))
+        co_shares = sparse.triu(incidence @ incidence.T, k=1).tocoo()
+
+        #set the percentile_edge_weight number of repetedly coordinated link sharing to keep
+        q = np.percentile(co_shares.data, percentile_edge_weight)
+
+        #remove where the edge weitght is less than the given percentile value
+        keep = co_shares.data >= q
+        rows, cols, weights = co_shares.row[keep], co_shares.col[keep], co_shares.data[keep]
+        edge_order = np.lexsort((cols, rows))
+        rows, cols, weights = rows[edge_order], cols[edge_order], weights[edge_order]
+        nodes = np.unique(np.concatenate([rows, cols]))
+
+        highly_connected_graph = nx.Graph()
+        highly_connected_graph.add_nodes_from(accounts[nodes], bipartite=1)
+        highly_connected_graph.add_weighted_edges_from(zip(accounts[rows], accounts[cols], weights.tolist()))
+
+        #degree and strength of the nodes of the filtered graph
+        degree = np.bincount(rows, minlength=len(accounts)) + np.bincount(cols, minlength=len(accounts))
+        strength = np.bincount(rows, weights=weights, minlength=len(accounts)) + np.bincount(cols, weights=weights, minlength=len(accounts))
+        degree_df = pd.DataFrame({'node': accounts[nodes], 'degree': degree[nodes]})
+        strength_df = pd.DataFrame({'node': accounts[nodes], 'strength': strength[nodes].astype('int64')})
+
+        return highly_connected_graph, q, degree_df, strength_df
+
+    def __edge_timestamps(self, coord_df, highly_connected_graph):
+        """Finds the timestamps of the coordinated shares behind every edge of the graph.
+
+        The (account, url) pairs are encoded as sorted integer keys, so the URLs shared by both ends of an edge are found
+        with a binary search instead of intersecting the neighbours of every edge. For each edge (u, v) and common URL,
+        the timestamp is the date u shared the URL.
+
+        Args:
+            coord_df (pandas.DataFrame): coordinated shares with the columns account_url, url and share_date.
+            highly_connected_graph (networkx.Graph): graph of coordinated accounts.
+
+        Returns:
+            pandas.DataFrame: one row per edge and common URL with the columns edge (position in graph.edges()), u, v, url and timestamp.
+        """
+        account_codes, accounts = pd.factorize(coord_df['account_url'])
+        url_codes, urls = pd.factorize(coord_df['url'], sort=True)
+
+        # one entry per (account, url) pair, the last share date wins as in the bipartite graph
+        pairs_df = pd.DataFrame({'account': account_codes, 'url': url_codes, 'share_date': coord_df['share_date'].to_numpy()})
+        pairs_df = pairs_df.drop_duplicates(['account', 'url'], keep='last').sort_values(['account', 'url'])
+        pair_urls = pairs_df['url'].to_numpy()
+        pair_dates = pd.DatetimeIndex(pairs_df['share_date']).to_numpy()
+        pair_keys = pairs_df['account'].to_numpy().astype('int64') * len(urls) + pair_urls
+        indptr = np.searchsorted(pairs_df['account'].to_numpy(), np.arange(len(accounts) + 1))
+
+        edges = list(highly_connected_graph.edges())
+        edge_u = accounts.get_indexer([u for u, v in edges])
+        edge_v = accounts.get_indexer([v for u, v in edges])
+
+        # scan the URLs of the end with fewer URLs and look them up in the other end
+        scan_u = (indptr[edge_u + 1] - indptr[edge_u]) <= (indptr[edge_v + 1] - indptr[edge_v])
+        scanned = np.where(scan_u, edge_u, edge_v)
+        other = np.where(scan_u, edge_v, edge_u)
+        counts = indptr[scanned + 1] - indptr[scanned]
+        edge_ids = np.repeat(np.arange(len(edges)), counts)
+        positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(indptr[scanned], counts)
+
+        other_keys = other[edge_ids].astype('int64') * len(urls) + pair_urls[positions]
+        other_positions = np.minimum(np.searchsorted(pair_keys, other_keys), len(pair_keys) - 1)
+        found = pair_keys[other_positions] == other_keys
+        edge_ids, positions, other_positions = edge_ids[found], positions[found], other_positions[found]
+
+        return pd.DataFrame({
+            'edge': edge_ids,
+            'u': accounts[edge_u[edge_ids]],
+            'v': accounts[edge_v[edge_ids]],
+            'url': urls[pair_urls[positions]],
+            'timestamp': np.where(scan_u[edge_ids], pair_dates[positions], pair_dates[other_positions]),
+        })
+
+    @staticmethod
+    def __coordinated_flags(shares_df, coordinated_shares_df, differential):
+        """Flags the shares of the share table found in the coordinated shares.
+
+        A share is flagged when its (url, date, account) tuple is one of the coordinated shares. The URLs and the
+        accounts of the coordinated shares are encoded with the categories of the share table, and every (url, account)
+        pair and every date is replaced by its code over both tables, so the tuples are joined as exact int64 keys with
+        a hash table.
+
+        Args:
+            shares_df (pandas.DataFrame): share table built by _share_table.
+            coordinated_shares_df (pandas.DataFrame): output of the detector.
+            differential (bool): the detector is _coord_windows_differential.
+
+        Returns:
+            numpy.ndarray: boolean array aligned with shares_df.
+        """
+        url_column, date_column = ('expanded', 'date') if differential else ('url', 'share_date')
+        accounts = shares_df['account_url'].cat.categories
+        coordinated_urls = shares_df['expanded'].cat.categories.get_indexer(coordinated_shares_df[url_column])
+        coordinated_accounts = accounts.get_indexer(coordinated_shares_df['account_url'])
+        coordinated_dates = np.asarray(coordinated_shares_df[date_column], dtype='datetime64[ns]').view('int64')
+        # the URLs out of the share table, from other partitions of a store, can't match
+        known = coordinated_urls >= 0
+
+        # the account codes are shifted by one, so the missing accounts (-1) don't collide with other pairs
+        pairs = np.concatenate([
+            shares_df['expanded'].cat.codes.to_numpy().astype('int64') * (len(accounts) + 1) + shares_df['account_url'].cat.codes.to_numpy() + 1,
+            coordinated_urls[known].astype('int64') * (len(accounts) + 1) + coordinated_accounts[known] + 1,
+        ])
+        dates = np.concatenate([shares_df['date'].to_numpy().view('int64'), coordinated_dates[known]])
+        pair_codes, pair_uniques = pd.factorize(pairs)
+        date_codes = pd.factorize(dates)[0]
+        keys = date_codes.astype('int64') * len(pair_uniques) + pair_codes
+
+        return pd.Series(keys[:shares_df.shape[0]]).isin(keys[shares_df.shape[0]:]).to_numpy()
+
+    @staticmethod
+    def __decode_shares(crowdtangle_shares_df, shares_df, clean_urls):
+        """Rows of crowdtangle_shares_df of the share table, with the cleaned URLs and the is_coordinated flags.
+        """
+        decoded_df = crowdtangle_shares_df.iloc[shares_df['position'].to_numpy()].reset_index(drop=True)
+        if clean_urls:
+            decoded_df['expanded'] = shares_df['expanded'].to_numpy()
+        decoded_df['is_coordinated'] = shares_df['is_coordinated'].to_numpy()
+        return decoded_df
 
-    def coord_shares(self, coordination_interval=None, percentile_edge_weight=90, clean_urls=False, keep_ourl_only=False, gtimestamps=False):
+    @profiled('coord_shares')
+    def coord_shares(self, coordination_interval=None, percentile_edge_weight=90, clean_urls=False, keep_ourl_only=False, gtimestamps=False, engine='loop', n_jobs=1, executor=None, graph_backend='networkx', clustering='louvain', seed=None):
         """Given a dataframe of CrowdTangle shares and a time threshold, this function detects networks of entities (pages, accounts and groups)
         that performed coordinated link sharing behavior.
 
@@ -276,8 +1138,33 @@ class Shared:
             keep_ourl_only (bool, optional): restrict the analysis to ct shares links matching the original URLs.
                 Defaults to False.
 
-            gtimestamps (bool, optional): add timestamps of the fist and last coordinated shares on each node.
-                Slow on large networks. Defaults to False.
+            gtimestamps (bool or str, optional): add timestamps of the fist and last coordinated shares on each node and edge.
+                True also adds to every edge the timestamp_coord_share array with the timestamps of its coordinated shares,
+                'table' stores them instead as a dataframe with the columns u, v, url and timestamp in
+                graph.graph['coord_share_timestamps']. Defaults to False.
+
+            engine (str, optional): detection engine. 'loop' processes every URL on its own, 'vectorized' sorts the
+                shares once and detects the coordinated windows of all the URLs at once. Both engines return the same
+                results. Defaults to 'loop'.
+
+            n_jobs (int, optional): number of worker processes. The shares are hash partitioned by URL and every
+                partition is processed by a different worker, -1 uses all the CPUs. Defaults to 1.
+
+            executor (concurrent.futures.Executor, optional): executor used to process the partitions instead of
+                a new process pool. Defaults to None.
+
+            graph_backend (str, optional): 'networkx' projects the bipartite account-URL graph with networkx, 'sparse'
+                computes the co-share weights with a sparse incidence matrix and only creates the networkx graph for the
+                edges over the percentile edge weight. Defaults to 'networkx'.
+
+            clustering (str or callable, optional): community detection algorithm of the cluster node attribute,
+                'louvain', 'leiden' (with leidenalg when installed, otherwise the Louvain communities split in their
+                connected parts and a warning is logged) or a function receiving a networkx graph and a seed and
+                returning a dict node -> cluster. Every connected component is clustered on its own, in parallel with
+                n_jobs or executor, so with worker processes the function must be picklable, a module level function
+                and not a lambda or a closure. Defaults to 'louvain'.
+
+            seed (int, optional): seed of the community detection, to get reproducible clusters. Defaults to None.
 
         Returns:
             (tuple): 3-element tuple containing
@@ -287,8 +1174,15 @@ class Shared:
                 - **q** (networkx.Graph): Percentile edge weight number of leeped repetedly coordinated link sharing.
                 - **coordination_interval** (int): coordination time in seconds
         """
+        if engine not in ('loop', 'vectorized'):
+            raise Exception(f"Unknown engine '{engine}'. Please choose 'loop' or 'vectorized'")
+
+        if graph_backend not in ('networkx', 'sparse'):
+            raise Exception(f"Unknown graph_backend '{graph_backend}'. Please choose 'networkx' or 'sparse'")
+
+        _check_clustering(clustering, n_jobs=n_jobs, executor=executor)
+
         # estimate the coordination interval if not specified by the users
-        dataframe = self.__crowdtangle_shares_df.copy(deep=True)
         if coordination_interval == None:
             coordination_interval = self.estimate_coord_interval(clean_urls=clean_urls, keep_ourl_only=keep_ourl_only)
             coordination_interval = coordination_interval[1]
@@ -296,72 +1190,41 @@ class Shared:
         if coordination_interval == 0:
             raise Exception("The coordination_interval value can't be 0. Please choose a value greater than zero or use coordination_interval=None to automatically calculate the interval")
 
-        if keep_ourl_only == True:
-            dataframe = dataframe[dataframe['is_orig'] == True]
-            if dataframe < 2:
-                raise Exception ("Can't execute with keep_ourl_only=TRUE. Not enough posts matching original URLs")
+        if self.__parquet_path is not None:
+            return self.__coord_shares_parquet(False, coordination_interval, percentile_edge_weight, clean_urls, keep_ourl_only, gtimestamps, engine, n_jobs, executor, graph_backend, clustering, seed)
 
-        if clean_urls:
-            dataframe =  Utils.clean_urls(dataframe, 'expanded')
-
-        urls_df = pd.DataFrame(dataframe['expanded'].value_counts())
-        urls_df.reset_index(level=0, inplace=True)
-        urls_df.columns = ['URL', 'ct_shares']
-        urls_df = urls_df[urls_df['ct_shares'] >1]
-        urls_df = urls_df.sort_values('URL')
-
-        crowdtangle_shares_df = dataframe[dataframe.set_index('expanded').index.isin(urls_df.set_index('URL').index)]
-
-        data_list = []
-        urls_count = urls_df.shape[0]
-        i=0
-
-        with tqdm(total=urls_df.shape[0]) as pbar:
-            for index, row in urls_df.iterrows():
-                pbar.update(1)
-                i=i+1
-                logger.debug(f"processing {i} of {urls_count}, url={row['URL']}")
-                summary_df = crowdtangle_shares_df[crowdtangle_shares_df['expanded'] == row['URL']].copy(deep=True)
-                if summary_df.groupby('account_url')['account_url'].nunique().shape[0]>1:
-                    summary_df['date'] = summary_df['date'].astype('datetime64[ns]')
-                    date_serie = summary_df['date'].astype('int64') // 10 ** 9
-                    max = date_serie.max()
-                    min = date_serie.min()
-                    div = (max-min)/coordination_interval + 1
-                    logger.debug(f"cutting row['URL'] in {div} parts")
-                    summary_df["cut"] = pd.cut(summary_df['date'],int(div)).apply(lambda x: x.left).astype('datetime64[ns]')
-                    cut_gb = summary_df.groupby('cut')
-                    summary_df.loc[:,'count'] = cut_gb['cut'].transform('count')
-                    summary_df.loc[:,'url'] = row['URL']
-                    summary_df.loc[:,'account_url'] = cut_gb['account_url'].transform(lambda x: [x.tolist()]*len(x))
-                    summary_df.loc[:,'share_date'] = cut_gb['date'].transform(lambda x: [x.tolist()]*len(x))
-                    summary_df = summary_df[['cut', 'count', 'account_url','share_date', 'url']]
-                    summary_df = summary_df[summary_df['count']>1]
-                    if summary_df.shape[0]>1:
-                        summary_df = summary_df.loc[summary_df.astype(str).drop_duplicates().index]
-                        data_list.append(summary_df)
-
-        data_df = pd.concat(data_list)
-        if data_df.shape[0] == 0:
+        # the windows engines process the shares in the input order
+        shares_df = self.__share_table(clean_urls, keep_ourl_only).sort_values('position', ignore_index=True)
+
+        detector = _coord_windows_loop if engine == 'loop' else _coord_windows_vectorized
+        with self.profiler.span('detect', rows_in=shares_df.shape[0], engine=engine, coordination_interval=coordination_interval) as span:
+            coordinated_shares_df = _run_partitioned(detector, shares_df, coordination_interval, 'url', n_jobs=n_jobs, executor=executor)
+            span.set(rows_out=coordinated_shares_df.shape[0])
+
+        if coordinated_shares_df.shape[0] == 0:
             logger.info('there are not enough shares!')
             return None
 
-        coordinated_shares_df = data_df.reset_index(drop=True).apply(pd.Series.explode).reset_index(drop=True)
+        with self.profiler.span('flag_shares', rows_in=shares_df.shape[0]) as span:
+            shares_df['is_coordinated'] = self.__coordinated_flags(shares_df, coordinated_shares_df, False)
+            crowdtangle_shares_df = self.__decode_shares(self.__crowdtangle_shares_df, shares_df, clean_urls)
+            span.set(rows_out=lambda: int(shares_df['is_coordinated'].sum()))
 
-        crowdtangle_shares_df = crowdtangle_shares_df.reset_index(drop=True)
-        crowdtangle_shares_df.loc[:,'coord_expanded']=crowdtangle_shares_df['expanded'].isin(coordinated_shares_df['url'])
-        crowdtangle_shares_df.loc[:,'coord_date']=crowdtangle_shares_df['date'].astype('datetime64[ns]').isin(coordinated_shares_df['share_date'])
-        crowdtangle_shares_df.loc[:,'coord_account_url']=crowdtangle_shares_df['account_url'].isin(coordinated_shares_df['account_url'])
+        highly_connected_graph, q =  self.__buid_graph(crowdtangle_shares_df, coordinated_shares_df, percentile_edge_weight=percentile_edge_weight, timestamps=gtimestamps, backend=graph_backend, clustering=clustering, seed=seed, n_jobs=n_jobs, executor=executor)
 
-        crowdtangle_shares_df.loc[:,'is_coordinated'] = crowdtangle_shares_df.apply(lambda x : True if (x['coord_expanded'] and x['coord_date'] and x['coord_account_url']) else False, axis=1)
-        crowdtangle_shares_df.drop(['coord_expanded','coord_date', 'coord_account_url'], inplace = True, axis=1)
+        return crowdtangle_shares_df, highly_connected_graph, q
 
-        highly_connected_graph, q =  self.__buid_graph(crowdtangle_shares_df, coordinated_shares_df, percentile_edge_weight=percentile_edge_weight, timestamps=gtimestamps)
+    @profiled('coord_shares_differential')
+    def coord_shares_differential(self, coordination_interval=None, percentile_edge_weight=90, clean_urls=False, keep_ourl_only=False, gtimestamps=False, n_jobs=1, executor=None, graph_backend='networkx', clustering='louvain', seed=None):
+        """Detects networks of entities that performed coordinated link sharing behavior, using the time elapsed between
+        consecutive shares of the same URL instead of fixed windows. The arguments and the returned tuple are the same of
+        :meth:`coord_shares`.
+        """
+        if graph_backend not in ('networkx', 'sparse'):
+            raise Exception(f"Unknown graph_backend '{graph_backend}'. Please choose 'networkx' or 'sparse'")
 
-        return crowdtangle_shares_df, highly_connected_graph, q
+        _check_clustering(clustering, n_jobs=n_jobs, executor=executor)
 
-    def coord_shares_differential(self, coordination_interval=None, percentile_edge_weight=90, clean_urls=False, keep_ourl_only=False, gtimestamps=False):
-        dataframe = self.__crowdtangle_shares_df.copy(deep=True)
         if coordination_interval == None:
             coordination_interval = self.estimate_coord_interval(clean_urls=clean_urls, keep_ourl_only=keep_ourl_only)
             coordination_interval = coordination_interval[1]
@@ -369,57 +1232,97 @@ class Shared:
         if coordination_interval == 0:
             raise Exception("The coordination_interval value can't be 0. Please choose a value greater than zero or use coordination_interval=None to automatically calculate the interval")
 
-        if keep_ourl_only == True:
-            dataframe = dataframe[dataframe['is_orig'] == True]
-            if dataframe < 2:
-                raise Exception ("Can't execute with keep_ourl_only=TRUE. Not enough posts matching original URLs")
-
-        if clean_urls:
-            logger.debug("cleaning urls")
-            dataframe =  Utils.clean_urls(dataframe, 'expanded')
-
-        dataframe = dataframe.sort_values(['expanded', 'date'])
-        counts_serie = dataframe['expanded'].value_counts()
-
-        logger.debug('selecting urls with more than 1 share')
-        urls_serie = counts_serie.where(lambda x : x>1).dropna().index.to_list()
-        filtered_df =dataframe.query("expanded in @urls_serie").copy()
-        logger.debug("features")
-        del urls_serie
-        filtered_df.loc[:,'diff']=filtered_df.groupby('expanded')['date'].diff().dt.total_seconds().fillna(0)
-        filtered_df.loc[:,'valid_delta'] = filtered_df['diff']<= coordination_interval
-        filtered_df.loc[:,'valid_before'] = filtered_df.groupby('expanded')['valid_delta'].shift(-1)
-
-        logger.debug('selecting valid shares')
-        coord_df = filtered_df.copy(deep=True)
-        coord_df = coord_df.query('valid_delta | valid_before==True')
+        if self.__parquet_path is not None:
+            return self.__coord_shares_parquet(True, coordination_interval, percentile_edge_weight, clean_urls, keep_ourl_only, gtimestamps, None, n_jobs, executor, graph_backend, clustering, seed)
 
-        logger.debug('deleting first shares that not are coordinated')
+        logger.debug("selecting urls with more than 1 share")
+        shares_df = self.__share_table(clean_urls, keep_ourl_only)
 
-        # Delete the first share of every group if this is not coordinated
-        delete_df = coord_df.reset_index().groupby('expanded').first().query("valid_before == False")
-        coord_df = coord_df.drop(delete_df['index'])
+        with self.profiler.span('detect', rows_in=shares_df.shape[0], coordination_interval=coordination_interval) as span:
+            coordinated_shares_df = _run_partitioned(_coord_windows_differential, shares_df, coordination_interval, 'expanded', n_jobs=n_jobs, executor=executor)
+            span.set(rows_out=coordinated_shares_df.shape[0])
 
-        coord_gb=coord_df.reset_index().groupby('expanded')
-
-        logger.debug('creating vectorized columns')
-        data_df = pd.DataFrame({'count':coord_gb['expanded'].count(), 'date':coord_gb['date'].apply(lambda x: x.tolist()), 'account_url': coord_gb['account_url'].apply(lambda x: x.tolist())})
-
-        if data_df.shape[0] == 0:
+        if coordinated_shares_df.shape[0] == 0:
             logger.info('there are not enough shares!')
             return None
 
-        logger.debug('exploding')
-        coordinated_shares_df = data_df.reset_index().apply(pd.Series.explode)
-        logger.debug('joining data')
-        analyzed_df = filtered_df.set_index(['expanded','date', 'account_url']).join(coordinated_shares_df.drop_duplicates().set_index(['expanded','date', 'account_url'])).reset_index()
         logger.debug('calculating coordinates')
-        analyzed_df.loc[:, 'is_coordinated'] = analyzed_df['count'].notna()
-        analyzed_df.drop(['count', 'diff', 'valid_delta', 'valid_before'], inplace = True, axis=1)
+        with self.profiler.span('flag_shares', rows_in=shares_df.shape[0]) as span:
+            shares_df = shares_df.assign(is_coordinated=self.__coordinated_flags(shares_df, coordinated_shares_df, True))
+            analyzed_df = self.__decode_shares(self.__crowdtangle_shares_df, shares_df, clean_urls)
+            keys = ['expanded', 'date', 'account_url']
+            analyzed_df = analyzed_df[keys + [column for column in analyzed_df.columns if column not in keys]]
+            span.set(rows_out=lambda: int(shares_df['is_coordinated'].sum()))
 
         logger.debug('bulding graph')
-        highly_connected_graph, q =  self.__buid_graph(analyzed_df, coordinated_shares_df.rename(columns = {'expanded':'url', 'date':'share_date'}), percentile_edge_weight=percentile_edge_weight, timestamps=gtimestamps)
+        highly_connected_graph, q =  self.__buid_graph(analyzed_df, coordinated_shares_df.rename(columns = {'expanded':'url', 'date':'share_date'}), percentile_edge_weight=percentile_edge_weight, timestamps=gtimestamps, backend=graph_backend, clustering=clustering, seed=seed, n_jobs=n_jobs, executor=executor)
 
 
         return analyzed_df, highly_connected_graph, q
 
+
+    @profiled('sweep')
+    def sweep(self, intervals, percentiles=(90,), clean_urls=False, keep_ourl_only=False):
+        """Evaluates several coordination intervals and percentile edge weights in one pass over the shares.
+
+        The coordinated shares follow the rule of :meth:`coord_shares_differential`. The shares are sorted and the time
+        elapsed between consecutive shares of every URL is computed once, the coordinated shares of every interval are
+        found by thresholding these gaps, and the co-share weights of every interval are computed once and filtered by
+        every percentile.
+
+        Args:
+            intervals (list): coordination intervals in seconds.
+            percentiles (list, optional): percentiles of the edge weight distribution to keep. Defaults to (90,).
+            clean_urls (bool, optional): clean the URLs from the tracking parameters. Defaults to False.
+            keep_ourl_only (bool, optional): restrict the analysis to ct shares links matching the original URLs.
+                Defaults to False.
+
+        Returns:
+            pandas.DataFrame: one row per interval and percentile with the columns coordination_interval,
+            percentile_edge_weight, q, coordinated_shares, nodes, edges and components, the numbers that
+            coord_shares_differential returns with the same parameters. q is NaN when there are no co-shares.
+        """
+        intervals = list(intervals)
+        percentiles = list(percentiles)
+        if any(coordination_interval is None or coordination_interval <= 0 for coordination_interval in intervals):
+            raise Exception("The coordination_interval values must be greater than zero")
+        if any(not 0 <= percentile <= 100 for percentile in percentiles):
+            raise Exception("The percentile_edge_weight values must be between 0 and 100")
+
+        if self.__parquet_path is not None:
+            tables = (shares_df for _, shares_df in self.__parquet_shares(_DETECTION_COLUMNS, clean_urls, keep_ourl_only))
+        else:
+            tables = [self.__share_table(clean_urls, keep_ourl_only)]
+
+        coordinated_shares = np.zeros(len(intervals), dtype='int64')
+        pairs = [[] for _ in intervals]
+        for shares_df in tables:
+            with self.profiler.span('sweep_pairs', rows_in=shares_df.shape[0]):
+                for i, (count, pairs_df) in enumerate(_sweep_pairs(shares_df, intervals)):
+                    coordinated_shares[i] += count
+                    pairs[i].append(pairs_df)
+
+        rows = []
+        for coordination_interval, count, interval_pairs in zip(intervals, coordinated_shares, pairs):
+            with self.profiler.span('project', rows_in=lambda: sum(pairs_df.shape[0] for pairs_df in interval_pairs), coordination_interval=coordination_interval) as span:
+                pairs_df = pd.concat(interval_pairs, ignore_index=True)
+                account_codes, accounts = pd.factorize(np.asarray(pairs_df['account_url'], dtype=object))
+                url_codes, urls = pd.factorize(np.asarray(pairs_df['url'], dtype=object))
+                incidence = sparse.csr_matrix((np.ones(len(account_codes), dtype='int64'), (account_codes, url_codes)), shape=(len(accounts), len(urls)))
+                co_shares = sparse.triu(incidence @ incidence.T, k=1).tocoo()
+                span.set(rows_out=co_shares.nnz)
+            logger.debug(f"coordination interval {coordination_interval}: {count} coordinated shares, {co_shares.nnz} co-shares")
+
+            for percentile in percentiles:
+                if co_shares.nnz == 0:
+                    rows.append((coordination_interval, percentile, np.nan, count, 0, 0, 0))
+                    continue
+                q = np.percentile(co_shares.data, percentile)
+                keep = co_shares.data >= q
+                edges = sparse.coo_matrix((co_shares.data[keep], (co_shares.row[keep], co_shares.col[keep])), shape=co_shares.shape)
+                nodes = np.unique(np.concatenate([edges.row, edges.col]))
+                # the accounts without edges are components of their own
+                components = connected_components(edges, directed=False)[0] - (len(accounts) - len(nodes))
+                rows.append((coordination_interval, percentile, q, count, len(nodes), int(keep.sum()), components))
+
+        return pd.DataFrame(rows, columns=['coordination_interval', 'percentile_edge_weight', 'q', 'coordinated_shares', 'nodes', 'edges', 'components'])
@@ -0,0 +1,156 @@
+import numpy as np
+import pandas as pd
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch (KLL) of a stream of numbers.
+
+    The values are kept in compactors of decreasing capacity, and when a compactor is full half of its sorted values
+    are promoted to the next one with twice the weight, so the memory is bounded by a few times k whatever the number
+    of values. The rank error of the quantiles is about 1.7 / k. The count, mean, standard deviation, minimum and
+    maximum are exact, and so are the quantiles while fewer than k values have been added.
+
+    Args:
+        k (int, optional): size of the largest compactor, it controls the accuracy. Defaults to 200.
+        seed (int, optional): seed of the random compactions, to get reproducible quantiles. Defaults to 0.
+    """
+
+    def __init__(self, k=200, seed=0):
+        if k < 8:
+            raise Exception('k must be at least 8')
+        self.k = k
+        self.__rng = np.random.default_rng(seed)
+        self.__levels = [np.empty(0)]
+        self.__compacted = False
+        self.__count = 0
+        self.__mean = 0.0
+        self.__m2 = 0.0
+        self.__min = np.nan
+        self.__max = np.nan
+
+    def __len__(self):
+        return self.__count
+
+    def __capacity(self, level):
+        return max(2, int(np.ceil(self.k * (2 / 3) ** (len(self.__levels) - level - 1))))
+
+    def __compress(self):
+        level = 0
+        while level < len(self.__levels):
+            values = self.__levels[level]
+            if len(values) <= self.__capacity(level):
+                level += 1
+                continue
+            if level + 1 == len(self.__levels):
+                self.__levels.append(np.empty(0))
+            values = np.sort(values)
+            # an odd value stays in the compactor, the others are halved
+            kept, values = values[len(values) - len(values) % 2:], values[:len(values) - len(values) % 2]
+            promoted = values[self.__rng.integers(2)::2]
+            self.__levels[level] = kept
+            self.__levels[level + 1] = np.concatenate([self.__levels[level + 1], promoted])
+            self.__compacted = True
+            # the capacities change when a level is added
+            level = 0
+
+    def __add_moments(self, count, mean, m2, minimum, maximum):
+        if count == 0:
+            return
+        total = self.__count + count
+        delta = mean - self.__mean
+        self.__mean += delta * count / total
+        self.__m2 += m2 + delta ** 2 * self.__count * count / total
+        self.__count = total
+        self.__min = np.fmin(self.__min, minimum)
+        self.__max = np.fmax(self.__max, maximum)
+
+    def update(self, values):
+        """Adds the values, NaN values are ignored.
+
+        Args:
+            values (array-like): numbers to add.
+        """
+        values = np.asarray(values, dtype='float64').ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        self.__add_moments(len(values), values.mean(), ((values - values.mean()) ** 2).sum(), values.min(), values.max())
+        self.__levels[0] = np.concatenate([self.__levels[0], values])
+        self.__compress()
+
+    def merge(self, other):
+        """Adds the values of another sketch.
+
+        Args:
+            other (QuantileSketch): sketch to merge, it is not modified.
+        """
+        state = other.to_dict()
+        while len(self.__levels) < len(state['levels']):
+            self.__levels.append(np.empty(0))
+        for level, values in enumerate(state['levels']):
+            self.__levels[level] = np.concatenate([self.__levels[level], np.asarray(values, dtype='float64')])
+        self.__compacted = self.__compacted or state['compacted']
+        self.__add_moments(state['count'], state['mean'], state['m2'], state['min'], state['max'])
+        self.__compress()
+
+    def quantile(self, q):
+        """Approximate quantile of the values, with the linear interpolation of pandas while the sketch is exact.
+
+        Args:
+            q (float): quantile between 0 and 1.
+
+        Returns:
+            float: the quantile, NaN if there are no values.
+        """
+        if self.__count == 0:
+            return np.nan
+        if not self.__compacted:
+            return float(np.quantile(self.__levels[0], q))
+        if q <= 0:
+            return float(self.__min)
+        if q >= 1:
+            return float(self.__max)
+        values = np.concatenate(self.__levels)
+        weights = np.concatenate([np.full(len(level_values), 2 ** level) for level, level_values in enumerate(self.__levels)])
+        order = np.argsort(values, kind='mergesort')
+        cumulative = np.cumsum(weights[order])
+        return float(values[order][min(np.searchsorted(cumulative, q * cumulative[-1]), len(values) - 1)])
+
+    def describe(self):
+        """Summary statistics of the values, like pandas.Series.describe.
+
+        Returns:
+            pandas.Series: count, mean, std, min, 25%, 50%, 75% and max.
+        """
+        std = np.sqrt(self.__m2 / (self.__count - 1)) if self.__count > 1 else np.nan
+        mean = self.__mean if self.__count > 0 else np.nan
+        return pd.Series([float(self.__count), mean, std, self.__min, self.quantile(0.25), self.quantile(0.5), self.quantile(0.75), self.__max],
+                         index=['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max'])
+
+    def to_dict(self):
+        """State of the sketch as a JSON serializable dict.
+        """
+        return {
+            'k': self.k,
+            'levels': [values.tolist() for values in self.__levels],
+            'compacted': self.__compacted,
+            'count': self.__count,
+            'mean': self.__mean,
+            'm2': self.__m2,
+            'min': None if np.isnan(self.__min) else float(self.__min),
+            'max': None if np.isnan(self.__max) else float(self.__max),
+        }
+
+    @classmethod
+    def from_dict(cls, state, seed=0):
+        """Creates a sketch from the state returned by to_dict.
+        """
+        sketch = cls(state['k'], seed=seed)
+        sketch.__levels = [np.asarray(values, dtype='float64') for values in state['levels']]
+        sketch.__compacted = state['compacted']
+        sketch.__count = state['count']
+        sketch.__mean = state['mean']
+        sketch.__m2 = state['m2']
+        sketch.__min = np.nan if state['min'] is None else state['min']
+        sketch.__max = np.nan if state['max'] is None else state['max']
+        return sketch
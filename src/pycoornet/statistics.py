@@ -1,93 +1,196 @@
+from functools import lru_cache
 import networkx as nx
 import numpy as np
 import pandas as pd
 import tldextract
 from urllib.parse import urlparse
+from .profiling import DISABLED, profiled
 
 
 class Statistics:
     @staticmethod
-    def __gini(arr, eps=1e-8):
+    def __grouped_gini(groups, counts, eps=1e-8):
+        """Gini coefficients of the counts of every group, with one sort of all the counts.
+
+        Args:
+            groups (numpy.ndarray): integer group codes.
+            counts (numpy.ndarray): counts of every value of the groups.
+
+        Returns:
+            numpy.ndarray: the Gini coefficient of every group code.
+        """
+        n_groups = groups.max() + 1
+        values = np.abs(counts).astype('float64') + eps
+        order = np.lexsort((values, groups))
+        groups, values = groups[order], values[order]
+        sizes = np.bincount(groups, minlength=n_groups)
+        index = np.arange(1, len(values) + 1) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        N = sizes[groups]
+        return np.bincount(groups, weights=(2*index - N - 1)*values, minlength=n_groups)/(sizes*np.bincount(groups, weights=values, minlength=n_groups))
 
-        # All values are treated equally, arrays must be 1d and > 0:
-        arr = np.abs(arr).flatten() + eps
-
-        # Values must be sorted:
-        arr = np.sort(arr)
-
-        # Index per array element:
-        index = np.arange(1, arr.shape[0]+1)
-
-        # Number of array elements:
-        N = arr.shape[0]
+    @staticmethod
+    @lru_cache(maxsize=2**16)
+    def __domains(url):
+        """Full and parent domain of a URL.
+        """
+        extracted = tldextract.extract(url)
+        return urlparse(url).netloc, f"{extracted.domain}.{extracted.suffix}"
 
-        # Gini coefficient:
-        return(np.sum((2*index - N - 1)*arr))/(N*np.sum(arr))
+    @staticmethod
+    def __domain_summary(ct_shares_marked_df, domain_column):
+        """Unique domains, Gini coefficient of the domain shares and top 5 domains of every component.
+        """
+        domains_df = ct_shares_marked_df.groupby(['component', domain_column], sort=False).size().reset_index(name='count')
+        # top domains by number of shares, ties in order of appearance as value_counts
+        domains_df = domains_df.sort_values(['component', 'count'], ascending=[True, False], kind='mergesort', ignore_index=True)
+        component_codes, components = pd.factorize(domains_df['component'], sort=True)
+        rank = domains_df.groupby('component', sort=False).cumcount()
+        top_df = domains_df[rank < 5]
+        return pd.DataFrame({
+            'unique': np.bincount(component_codes),
+            'gini': Statistics.__grouped_gini(component_codes, domains_df['count'].to_numpy()),
+            'top': top_df.groupby('component')[domain_column].agg(list).reindex(components).to_numpy(),
+        }, index=components)
 
     @staticmethod
-    def component_summary(crowtangle_shares_df, shares_graph):
-        ct_shares_marked_df = crowtangle_shares_df[crowtangle_shares_df['is_coordinated']].copy()
+    @profiled('component_summary')
+    def component_summary(crowtangle_shares_df, shares_graph, profiler=None):
+        """Summary of the components of the graph of coordinated entities.
+
+        Args:
+            crowtangle_shares_df (pandas.DataFrame): shares returned by coord_shares.
+            shares_graph (networkx.Graph): graph returned by coord_shares.
+            profiler (Profiler, optional): profiler of the stages, the rows of the timing report are stored as a list
+                of dicts in attrs['timing'] of the result. Defaults to None, no profiling.
+
+        Returns:
+            pandas.DataFrame: one row per component with the entities, account and domain metrics.
+        """
+        profiler = DISABLED if profiler is None else profiler
+        ct_shares_marked_df = crowtangle_shares_df.loc[crowtangle_shares_df['is_coordinated'], ['expanded', 'account_url']]
         highly_connected_coordinated_entities_df = pd.DataFrame.from_dict(dict(shares_graph.nodes(data=True)), orient='index').reset_index().rename({'index':'name'}, axis = 'columns')
 
-        ct_shares_marked_df['full_domain'] = ct_shares_marked_df['expanded'].apply(lambda x: urlparse(x).netloc)
-        ct_shares_marked_df['parent_domain'] = ct_shares_marked_df['expanded'].apply(lambda x: f"{tldextract.extract(x).domain}.{tldextract.extract(x).suffix}")
-        ct_shares_marked_df = pd.merge(ct_shares_marked_df, highly_connected_coordinated_entities_df[['name','component']], left_on='account_url', right_on='name')
-
-        highly_connected_coordinated_entities_gb = highly_connected_coordinated_entities_df.groupby('component')
-
-        summary_entities_df = highly_connected_coordinated_entities_gb.size().to_frame('entities').sort_index()
-        summary_entities_df = pd.merge(summary_entities_df, highly_connected_coordinated_entities_gb['avg_account_subscriber_count'].mean().to_frame('avg_subscriber_count'), left_index=True, right_index=True)
-        summary_entities_df = pd.merge(summary_entities_df, highly_connected_coordinated_entities_gb.apply(lambda x: (x['coord_shares']/(x['shares']+x['coord_shares'])).mean()).to_frame('coor_share_ratio_avg'), left_index=True, right_index=True)
-        summary_entities_df = pd.merge(summary_entities_df, highly_connected_coordinated_entities_gb.apply(lambda x: (x['strength']/x['degree']).mean()).to_frame('coor_score_avg'), left_index=True, right_index=True)
-        summary_entities_df = pd.merge(summary_entities_df, highly_connected_coordinated_entities_gb['account_page_admin_top_country'].agg(pd.Series.mode).to_frame('page_admin_top_country'), left_index=True, right_index=True)
-        summary_entities_df = pd.merge(summary_entities_df, highly_connected_coordinated_entities_df[highly_connected_coordinated_entities_df['account_account_type']=='facebook_page'].groupby('component').size().to_frame('facebook_page'), left_index=True, right_index=True, how='left').fillna(0)
-        summary_entities_df = pd.merge(summary_entities_df, highly_connected_coordinated_entities_df[highly_connected_coordinated_entities_df['account_account_type']=='facebook_group'].groupby('component').size().to_frame('facebook_group'), left_index=True, right_index=True, how='left').fillna(0)
-        summary_entities_df = pd.merge(summary_entities_df, highly_connected_coordinated_entities_df[highly_connected_coordinated_entities_df['account_account_type']=='facebook_profile'].groupby('component').size().to_frame('facebook_profile'), left_index=True, right_index=True, how='left').fillna(0)
-
-        ct_shares_marked_gb = ct_shares_marked_df.groupby('component')
-
-        summary_domains_df = ct_shares_marked_gb['full_domain'].nunique().to_frame('unique_full_domain')
-        summary_domains_df = pd.merge(summary_domains_df, ct_shares_marked_gb['parent_domain'].nunique().to_frame('unique_parent_domain'), left_index=True, right_index=True)
+        #domains are extracted once per URL
+        with profiler.span('domains', rows_in=ct_shares_marked_df.shape[0]) as span:
+            url_codes, urls = pd.factorize(ct_shares_marked_df['expanded'])
+            domains = np.array([Statistics.__domains(url) for url in urls], dtype=object).reshape(-1, 2)
+            ct_shares_marked_df = ct_shares_marked_df.assign(full_domain=domains[url_codes, 0], parent_domain=domains[url_codes, 1])
+            ct_shares_marked_df = pd.merge(ct_shares_marked_df, highly_connected_coordinated_entities_df[['name','component']], left_on='account_url', right_on='name')
+            span.set(rows_out=len(urls))
+
+        with profiler.span('entities', rows_in=highly_connected_coordinated_entities_df.shape[0]) as span:
+            entities_df = highly_connected_coordinated_entities_df.assign(
+                coor_share_ratio=highly_connected_coordinated_entities_df['coord_shares']/(highly_connected_coordinated_entities_df['shares']+highly_connected_coordinated_entities_df['coord_shares']),
+                coor_score=highly_connected_coordinated_entities_df['strength']/highly_connected_coordinated_entities_df['degree'])
+            summary_entities_df = entities_df.groupby('component').agg(
+                entities=('name', 'size'),
+                avg_subscriber_count=('avg_account_subscriber_count', 'mean'),
+                coor_share_ratio_avg=('coor_share_ratio', 'mean'),
+                coor_score_avg=('coor_score', 'mean'))
+
+            #most frequent countries of every component, an array when there are several
+            countries_df = entities_df.groupby(['component', 'account_page_admin_top_country']).size().reset_index(name='count')
+            countries_df = countries_df[countries_df['count'] == countries_df.groupby('component')['count'].transform('max')]
+            countries = countries_df.groupby('component')['account_page_admin_top_country'].agg(lambda x: x.iloc[0] if len(x) == 1 else x.to_numpy())
+            summary_entities_df['page_admin_top_country'] = [countries.get(component, np.array([], dtype=object)) for component in summary_entities_df.index]
+
+            account_types_df = entities_df.groupby(['component', 'account_account_type']).size().unstack()
+            for account_type in ['facebook_page', 'facebook_group', 'facebook_profile']:
+                summary_entities_df[account_type] = account_types_df[account_type].dropna().astype('int64') if account_type in account_types_df.columns else pd.Series(dtype='int64')
+            summary_entities_df = summary_entities_df.fillna(0)
+            span.set(rows_out=summary_entities_df.shape[0])
+
+        with profiler.span('domain_summary', rows_in=ct_shares_marked_df.shape[0]):
+            full_domain_df = Statistics.__domain_summary(ct_shares_marked_df, 'full_domain')
+            parent_domain_df = Statistics.__domain_summary(ct_shares_marked_df, 'parent_domain')
+        summary_domains_df = pd.DataFrame({
+            'unique_full_domain': full_domain_df['unique'],
+            'unique_parent_domain': parent_domain_df['unique'],
+            'gini_full_domain': full_domain_df['gini'],
+            'gini_parent_domain': parent_domain_df['gini'],
+            'top_full_domain': full_domain_df['top'],
+            'top_parent_domain': parent_domain_df['top'],
+        })
 
         summary_df = pd.merge(summary_entities_df, summary_domains_df, left_index=True, right_index=True)
-        summary_df = pd.merge(summary_df, ct_shares_marked_gb['full_domain'].apply(lambda x: Statistics.__gini(x.value_counts().to_list())).to_frame('gini_full_domain'), left_index=True, right_index=True)
-        summary_df = pd.merge(summary_df, ct_shares_marked_gb['parent_domain'].apply(lambda x: Statistics.__gini(x.value_counts().to_list())).to_frame('gini_parent_domain'), left_index=True, right_index=True)
-        summary_df = pd.merge(summary_df, ct_shares_marked_gb['full_domain'].apply(lambda x: x.value_counts().nlargest().index.to_list()).to_frame('top_full_domain'), left_index=True, right_index=True)
-        summary_df = pd.merge(summary_df, ct_shares_marked_gb['parent_domain'].apply(lambda x: x.value_counts().nlargest().index.to_list()).to_frame('top_parent_domain'), left_index=True, right_index=True)
 
-        return summary_df.reset_index()
+        return summary_df.rename_axis('component').reset_index()
 
     @staticmethod
-    def get_top_coord_urls(crowtangle_shares_df, shares_graph):
-        highly_connected_coordinated_entities_df = pd.DataFrame.from_dict(dict(shares_graph.nodes(data=True)), orient='index').reset_index().rename({'index':'name'}, axis = 'columns')
-
-        crowtangle_shares_gb = crowtangle_shares_df.groupby('expanded')
-
-        urls_df = crowtangle_shares_gb[['statistics_actual_likeCount','statistics_actual_shareCount','statistics_actual_commentCount','statistics_actual_loveCount','statistics_actual_wowCount','statistics_actual_hahaCount','statistics_actual_sadCount','statistics_actual_angryCount']].apply(lambda x: x.sum())
-        urls_df = pd.merge(urls_df, urls_df.sum(axis=1).to_frame('engagement'), left_index=True, right_index=True)
-
-        crowtangle_shares_filtered_df = crowtangle_shares_df[crowtangle_shares_df['is_coordinated'] & crowtangle_shares_df.set_index('account_url').index.isin(highly_connected_coordinated_entities_df.set_index('name').index)]
-
-        urls_df = urls_df[urls_df.index.isin(crowtangle_shares_filtered_df.set_index('expanded').index)]
-
-        count_df = crowtangle_shares_df.groupby('expanded')['expanded'].count().to_frame('count')
-
-        urls_df = pd.merge(urls_df, count_df, left_index=True, right_index=True)
-        urls_df = urls_df.where(urls_df['count']>0)
-        urls_df = pd.merge(urls_df, crowtangle_shares_df.groupby('expanded')['account_url'].apply(lambda x: np.unique(list(x))).to_frame('account_url'), left_index=True, right_index=True)
-        urls_df = pd.merge(urls_df, crowtangle_shares_filtered_df.groupby('expanded')['account_url'].apply(lambda x: np.unique(list(x))).to_frame('coor_account_url'), left_index=True, right_index=True)
-        urls_df = pd.merge(urls_df, crowtangle_shares_df.groupby('expanded')['account_name'].apply(lambda x: np.unique(list(x))).to_frame('account_name'), left_index=True, right_index=True)
-        urls_df = pd.merge(urls_df, crowtangle_shares_filtered_df.groupby('expanded')['account_name'].apply(lambda x: np.unique(list(x))).to_frame('coor_account_name'), left_index=True, right_index=True)
-
-        highly_connected_filtered_df = highly_connected_coordinated_entities_df[highly_connected_coordinated_entities_df['name'].isin(urls_df['coor_account_url'].explode('coor_account_url'))]
-
-        merge_df = pd.merge(urls_df[['coor_account_url']].explode('coor_account_url').reset_index(), highly_connected_filtered_df.groupby('name')['component'].apply(lambda x: np.unique(list(x))).to_frame('component').reset_index(), left_on='coor_account_url', right_on='name').drop(columns=['name','coor_account_url'])
-        merge_df = merge_df.groupby('expanded').agg(list)
-        merge_df['component'] = merge_df['component'].apply(lambda x: np.unique(x))
-        merge_df.rename(columns={'component':'components'}, inplace=True)
-
-        urls_df = pd.merge(urls_df, merge_df, left_index=True, right_index=True)
+    def __unique_values(url_codes, values, mask, urls_index):
+        """Sorted unique values of every URL, as np.unique of the values of the URL. The missing values are skipped.
+
+        Args:
+            url_codes (numpy.ndarray): URL code of every share.
+            values (pandas.Series): value of every share.
+            mask (numpy.ndarray): shares to aggregate.
+            urls_index (pandas.Index): URL codes of the result.
+
+        Returns:
+            list: the array of unique values of every URL of urls_index, empty when all its values are missing.
+        """
+        value_codes, uniques = pd.factorize(values.to_numpy()[mask], sort=True)
+        #factorize codes the missing values as -1
+        present = value_codes >= 0
+        pairs = np.unique(np.stack([url_codes[mask][present], value_codes[present]], axis=1), axis=0)
+        starts = np.flatnonzero(np.r_[True, pairs[1:, 0] != pairs[:-1, 0]]) if len(pairs) else np.array([], dtype='int64')
+        values_array = np.asarray(uniques)
+        groups = dict(zip(pairs[starts, 0], np.split(values_array[pairs[:, 1]], starts[1:])))
+        empty = values_array[:0]
+        return [groups.get(code, empty) for code in urls_index]
 
+    @staticmethod
+    @profiled('get_top_coord_urls')
+    def get_top_coord_urls(crowtangle_shares_df, shares_graph, top_n=None, profiler=None):
+        """URLs shared in a coordinated way by the entities of the graph, with their engagement and the accounts and
+        components that shared them.
+
+        Args:
+            crowtangle_shares_df (pandas.DataFrame): shares returned by coord_shares.
+            shares_graph (networkx.Graph): graph returned by coord_shares.
+            top_n (int, optional): keep only the top_n URLs by engagement, sorted by decreasing engagement.
+                Defaults to None, all the URLs sorted by URL.
+            profiler (Profiler, optional): profiler of the stages, the rows of the timing report are stored as a list
+                of dicts in attrs['timing'] of the result. Defaults to None, no profiling.
+
+        Returns:
+            pandas.DataFrame: one row per URL.
+        """
+        profiler = DISABLED if profiler is None else profiler
+        statistics_columns = ['statistics_actual_likeCount','statistics_actual_shareCount','statistics_actual_commentCount','statistics_actual_loveCount','statistics_actual_wowCount','statistics_actual_hahaCount','statistics_actual_sadCount','statistics_actual_angryCount']
+
+        url_codes, urls = pd.factorize(crowtangle_shares_df['expanded'], sort=True)
+        account_codes, accounts = pd.factorize(crowtangle_shares_df['account_url'])
+
+        #component of every account, -1 for the accounts out of the graph
+        components = pd.Series(dict(shares_graph.nodes(data='component')), dtype='float64')
+        account_components = components.reindex(accounts).fillna(-1).astype('int64').to_numpy()
+        share_components = np.where(account_codes >= 0, account_components[account_codes], -1)
+
+        shared = url_codes >= 0
+        coordinated = shared & crowtangle_shares_df['is_coordinated'].to_numpy(dtype=bool) & (share_components >= 0)
+
+        #engagement and number of shares of the coordinated URLs
+        with profiler.span('engagement', rows_in=crowtangle_shares_df.shape[0]) as span:
+            urls_df = crowtangle_shares_df.loc[shared, statistics_columns].groupby(url_codes[shared]).sum()
+            urls_df = urls_df.loc[np.unique(url_codes[coordinated])]
+            urls_df['engagement'] = urls_df.sum(axis=1)
+            urls_df['count'] = np.bincount(url_codes[shared], minlength=len(urls))[urls_df.index]
+            if top_n is not None:
+                urls_df = urls_df.nlargest(top_n, 'engagement')
+            span.set(rows_out=urls_df.shape[0])
+
+        #list aggregations of the selected URLs only
+        with profiler.span('accounts', rows_in=urls_df.shape[0]):
+            selected = np.zeros(len(urls), dtype=bool)
+            selected[urls_df.index] = True
+            selected_shares = shared & selected[np.where(shared, url_codes, 0)]
+            selected_coordinated = selected_shares & coordinated
+            urls_df['account_url'] = Statistics.__unique_values(url_codes, crowtangle_shares_df['account_url'], selected_shares, urls_df.index)
+            urls_df['coor_account_url'] = Statistics.__unique_values(url_codes, crowtangle_shares_df['account_url'], selected_coordinated, urls_df.index)
+            urls_df['account_name'] = Statistics.__unique_values(url_codes, crowtangle_shares_df['account_name'], selected_shares, urls_df.index)
+            urls_df['coor_account_name'] = Statistics.__unique_values(url_codes, crowtangle_shares_df['account_name'], selected_coordinated, urls_df.index)
+            urls_df['components'] = Statistics.__unique_values(url_codes, pd.Series(share_components), selected_coordinated, urls_df.index)
+
+        urls_df.index = pd.Index(np.asarray(urls)[urls_df.index], name='expanded')
         return urls_df.reset_index()
-
-
@@ -0,0 +1,203 @@
+import json
+import logging
+import networkx as nx
+import numpy as np
+import pandas as pd
+from .utils import Utils
+
+logger = logging.getLogger(__name__)
+
+
+class SharedStream:
+    """Incremental Coordinated Link Sharing Behavior (CLSB) detector over batches of shares in time order.
+
+    A share is coordinated when the previous or the next share of the same URL was performed within the coordination
+    interval, the rule of :meth:`Shared.coord_shares_differential`, and the consecutive coordinated shares of a URL
+    form a group. Only the last share of every URL and the accounts of its open group are kept between batches, and
+    they are dropped once the stream is more than coordination_interval seconds ahead of the share, so the window state
+    is bounded by the interval.
+
+    The co-share weights of the account pairs are updated in place with the new coordinated shares: the weight of a
+    pair is the number of groups both accounts are in, the shares without account are not paired. It differs from the
+    weights of coord_shares_differential, which pair all the accounts with coordinated shares of a URL, when a URL has
+    several groups, shared again more than coordination_interval seconds after its previous share: two accounts only
+    in different groups of the URL are not paired, and two accounts in several groups of the URL are counted once per
+    group. The weights table is the result of the detector and it grows with the account pairs, not with the shares.
+
+    The state is made of plain lists and dicts and can be saved and loaded to checkpoint a long running worker.
+
+    Args:
+        coordination_interval (int): a threshold in seconds that defines a coordinated share.
+        clean_urls (bool, optional): clean the URLs from the tracking parameters. Defaults to False.
+    """
+
+    def __init__(self, coordination_interval, clean_urls=False):
+        if coordination_interval is None or coordination_interval <= 0:
+            raise Exception("The coordination_interval value must be greater than zero")
+        self.coordination_interval = coordination_interval
+        self.clean_urls = clean_urls
+        # last share of the active URLs: url -> [date (ns), account_url, id, group or -1 if not coordinated]
+        self.__last_shares = {}
+        # accounts of the open groups and co-share weights of the account pairs
+        self.__group_accounts = {}
+        self.__weights = {}
+        self.__watermark = None
+        self.__next_group = 0
+
+    def update(self, shares_df):
+        """Processes a batch of shares.
+
+        The batch dates can't be older than the most recent share of the previous batches.
+
+        Args:
+            shares_df (pandas.DataFrame): shares with at least the columns id, date, expanded and account_url.
+
+        Returns:
+            pandas.DataFrame: the shares found coordinated with this batch, with the columns id, expanded, date,
+            account_url and group. It can include shares of previous batches, coordinated with a share of this batch.
+            The shares of a group are the consecutive coordinated shares of a URL.
+        """
+        batch_df = shares_df[['id', 'expanded', 'date', 'account_url']].copy()
+        if self.clean_urls:
+            batch_df['expanded'] = Utils.normalize_urls(batch_df['expanded'])
+            batch_df = batch_df[batch_df['expanded'].notna()]
+        batch_df['date'] = batch_df['date'].astype('datetime64[ns]').to_numpy().view('int64')
+
+        if batch_df.shape[0] == 0:
+            return self.__shares_frame(batch_df.assign(group=pd.Series(dtype='int64')))
+
+        if self.__watermark is not None and batch_df['date'].min() < self.__watermark:
+            raise Exception("The shares must be processed in time order, the batch has shares older than the previous batches")
+
+        # the last share of the active URLs goes before the shares of the batch
+        batch_urls = set(batch_df['expanded'])
+        previous = [[url, *share] for url, share in self.__last_shares.items() if url in batch_urls]
+        previous_df = pd.DataFrame(previous, columns=['expanded', 'date', 'account_url', 'id', 'group'])
+        batch_df['group'] = -1
+        shares_df = pd.concat([previous_df.assign(previous=True), batch_df.assign(previous=False)], ignore_index=True)
+        shares_df = shares_df.sort_values(['expanded', 'date'], kind='mergesort', ignore_index=True)
+
+        urls = shares_df['expanded'].to_numpy()
+        dates = shares_df['date'].to_numpy().astype('int64')
+        same_url = np.r_[False, urls[1:] == urls[:-1]]
+        close_previous = same_url & (np.r_[0, np.diff(dates)] <= self.coordination_interval * 10 ** 9)
+        close_next = np.r_[close_previous[1:], False]
+        coordinated = close_previous | close_next
+
+        # a new group starts on every coordinated share not close to the previous one
+        groups = shares_df['group'].to_numpy().astype('int64')
+        starts = coordinated & ~close_previous & (groups < 0)
+        groups[starts] = self.__next_group + np.arange(starts.sum())
+        self.__next_group += int(starts.sum())
+        groups = pd.Series(np.where(coordinated & (groups < 0) & close_previous, np.nan, groups)).ffill().to_numpy()
+        groups = np.where(coordinated, groups, -1).astype('int64')
+
+        emitted = coordinated & ~(shares_df['previous'].to_numpy() & (shares_df['group'].to_numpy() >= 0))
+        shares_df['group'] = groups
+        new_df = shares_df[emitted]
+
+        # keep the last share of every URL
+        last_df = shares_df.drop_duplicates('expanded', keep='last')
+        for url, date, account_url, share_id, group in zip(last_df['expanded'], last_df['date'], last_df['account_url'], last_df['id'], last_df['group']):
+            self.__last_shares[url] = [int(date), account_url, share_id.item() if isinstance(share_id, np.generic) else share_id, int(group)]
+
+        for group, account_url in zip(new_df['group'], new_df['account_url']):
+            if pd.isna(account_url):
+                continue
+            accounts = self.__group_accounts.setdefault(int(group), set())
+            if account_url in accounts:
+                continue
+            for other in accounts:
+                pair = (account_url, other) if account_url < other else (other, account_url)
+                self.__weights[pair] = self.__weights.get(pair, 0) + 1
+            accounts.add(account_url)
+
+        # only the group of the last share of an active URL can grow
+        self.__watermark = int(dates.max()) if self.__watermark is None else max(self.__watermark, int(dates.max()))
+        horizon = self.__watermark - self.coordination_interval * 10 ** 9
+        self.__last_shares = {url: share for url, share in self.__last_shares.items() if share[0] >= horizon}
+        open_groups = {share[3] for share in self.__last_shares.values() if share[3] >= 0}
+        self.__group_accounts = {group: accounts for group, accounts in self.__group_accounts.items() if group in open_groups}
+
+        logger.debug(f"{new_df.shape[0]} new coordinated shares, {len(self.__last_shares)} active URLs")
+        return self.__shares_frame(new_df)
+
+    @staticmethod
+    def __shares_frame(shares_df):
+        return pd.DataFrame({
+            'id': shares_df['id'].to_numpy(),
+            'expanded': shares_df['expanded'].to_numpy(),
+            'date': shares_df['date'].to_numpy().astype('int64').view('datetime64[ns]'),
+            'account_url': shares_df['account_url'].to_numpy(),
+            'group': shares_df['group'].to_numpy().astype('int64'),
+        })
+
+    @property
+    def active_urls(self):
+        """int: number of URLs whose last share can still be coordinated with a future share.
+        """
+        return len(self.__last_shares)
+
+    def weights(self):
+        """Co-share weights of the account pairs, the number of groups of coordinated shares both accounts are in. See
+        the class description for the differences with the weights of coord_shares_differential.
+
+        Returns:
+            pandas.DataFrame: one row per account pair with the columns account_url_a, account_url_b and weight.
+        """
+        return pd.DataFrame([(a, b, w) for (a, b), w in self.__weights.items()],
+                            columns=['account_url_a', 'account_url_b', 'weight'])
+
+    def graph(self, percentile_edge_weight=90):
+        """Graph of the account pairs with a co-share weight over the percentile of the weights.
+
+        Args:
+            percentile_edge_weight (float, optional): percentile of the edge weight distribution to keep. Defaults to 90.
+
+        Returns:
+            (tuple): the networkx.Graph and the percentile edge weight, None if there are no weights yet.
+        """
+        if len(self.__weights) == 0:
+            return nx.Graph(), None
+        q = np.percentile(list(self.__weights.values()), percentile_edge_weight)
+        graph = nx.Graph()
+        graph.add_weighted_edges_from((a, b, w) for (a, b), w in self.__weights.items() if w >= q)
+        return graph, q
+
+    def to_dict(self):
+        """State of the detector as a JSON serializable dict.
+        """
+        return {
+            'coordination_interval': self.coordination_interval,
+            'clean_urls': self.clean_urls,
+            'watermark': self.__watermark,
+            'next_group': self.__next_group,
+            'last_shares': self.__last_shares,
+            'group_accounts': [[group, sorted(accounts)] for group, accounts in self.__group_accounts.items()],
+            'weights': [[a, b, w] for (a, b), w in self.__weights.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        """Creates a detector from the state returned by to_dict.
+        """
+        stream = cls(state['coordination_interval'], clean_urls=state['clean_urls'])
+        stream.__watermark = state['watermark']
+        stream.__next_group = state['next_group']
+        stream.__last_shares = {url: list(share) for url, share in state['last_shares'].items()}
+        stream.__group_accounts = {group: set(accounts) for group, accounts in state['group_accounts']}
+        stream.__weights = {(a, b): w for a, b, w in state['weights']}
+        return stream
+
+    def save(self, path):
+        """Saves the state of the detector in a JSON file.
+        """
+        with open(path, 'w') as state_file:
+            json.dump(self.to_dict(), state_file)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a detector saved with save.
+        """
+        with open(path) as state_file:
+            return cls.from_dict(json.load(state_file))
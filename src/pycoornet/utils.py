@@ -1,12 +1,190 @@
-import re
+from collections import deque
+from functools import lru_cache
 import numpy as np
-from urllib.parse import urljoin, urlparse
+import pandas as pd
+from urllib.parse import urlsplit, urlunsplit
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# query parameters removed by clean_urls, matched by key or by key prefix
+_TRACKING_KEYS = frozenset([
+    'fbclid', 'feed_id', '_unique_id', 'ref', 'ref_src', 'ref_url', 'referrer', 'rss', 'ico', 'recruiter', 'fb_rel',
+    'social', 'xrs', 'cmp', 'tid', 'ncid', 'rbs', 'mobile', 'mbid', 'platform', '__twitter_impression', 'amp', 'verso',
+    'mc_cid', 'mc_eid', 'spmailingid', 'mcd', 'cd-origin'])
+_TRACKING_PREFIXES = ('utm_', 'sr_share_', 'intcmp_')
+_TRACKING_PAIRS = frozenset([('source', 'TDB')])
+
+
+def _is_tracking(parameter):
+    key, _, value = parameter.partition('=')
+    key = key.lower()
+    return key in _TRACKING_KEYS or key.startswith(_TRACKING_PREFIXES) or (key, value) in _TRACKING_PAIRS
+
+
+def _strip_tracking(url):
+    """Removes the tracking parameters and the fragment of a URL, and the trailing slashes and /amp suffix of its path.
+    """
+    parts = urlsplit(url)
+    query = '&'.join(parameter for parameter in parts.query.split('&') if parameter and not _is_tracking(parameter))
+    path = parts.path.split('/amp=', 1)[0]
+    if not query:
+        stripped = None
+        while stripped != path:
+            stripped = path
+            path = path.rstrip('/')
+            if path.endswith('/amp'):
+                path = path[:-4]
+    return urlunsplit((parts.scheme, parts.netloc, path, query, ''))
+
+
+@lru_cache(maxsize=2 ** 18)
+def _normalize_url(url):
+    try:
+        url = _strip_tracking(url)
+        # keep the last URL of the string, which is the target of redirect links
+        start = max(url.rfind('http://'), url.rfind('https://'))
+        if start < 0:
+            return None
+        if start > 0:
+            url = _strip_tracking(url[start:])
+        parts = urlsplit(url)
+        parts.hostname
+    except ValueError:
+        return None
+    if parts.scheme not in ('http', 'https') or parts.hostname in ('localhost', '127.0.0.1'):
+        return None
+    return url
+
+
+def _substring_matches(patterns, texts):
+    """Finds which patterns are a substring of at least one text with an Aho-Corasick automaton.
+
+    pyahocorasick is used when it is installed, otherwise the automaton is built in pure Python.
+
+    Args:
+        patterns (list): list of unique non empty strings to search.
+        texts (list): list of strings where the patterns are searched.
+
+    Returns:
+        numpy.ndarray: boolean array, True for the patterns found in any text.
+    """
+    found = np.zeros(len(patterns), dtype=bool)
+    if not patterns or not texts:
+        return found
+
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for index, pattern in enumerate(patterns):
+            automaton.add_word(pattern, index)
+        automaton.make_automaton()
+        for text in texts:
+            for _, index in automaton.iter(text):
+                found[index] = True
+        return found
+
+    # goto function as one dict per state, output holds the pattern ending in each state
+    goto = [{}]
+    output = [-1]
+    for index, pattern in enumerate(patterns):
+        state = 0
+        for char in pattern:
+            next_state = goto[state].get(char)
+            if next_state is None:
+                next_state = len(goto)
+                goto[state][char] = next_state
+                goto.append({})
+                output.append(-1)
+            state = next_state
+        output[state] = index
+
+    # failure links in breadth first order, dict_link points to the nearest suffix state that ends a pattern
+    fail = [0] * len(goto)
+    dict_link = [-1] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for char, next_state in goto[state].items():
+            queue.append(next_state)
+            if state:
+                suffix = fail[state]
+                while suffix and char not in goto[suffix]:
+                    suffix = fail[suffix]
+                fail[next_state] = goto[suffix].get(char, 0)
+            suffix = fail[next_state]
+            dict_link[next_state] = suffix if output[suffix] >= 0 else dict_link[suffix]
+
+    visited = np.zeros(len(goto), dtype=bool)
+    for text in texts:
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            match = state
+            # the outputs reachable from a visited state were already marked
+            while match > 0 and not visited[match]:
+                visited[match] = True
+                if output[match] >= 0:
+                    found[output[match]] = True
+                match = dict_link[match]
+    return found
+
 
 class Utils:
+    @staticmethod
+    def normalize_url(url):
+        """Normalize a URL removing its tracking parameters
+
+        The query parameters are kept or removed by their key (utm_*, fbclid, mc_cid, ...) and the fragment, the
+        trailing slashes and the /amp suffix are removed. When the URL wraps another one, like a redirect link, the
+        wrapped URL is returned. The results are memoized, so repeated URLs are parsed only once.
+
+        Args:
+            url (str): the URL
+
+        Returns:
+            str: the normalized URL, or None if it isn't an http or https URL or it points to localhost
+        """
+        if not isinstance(url, str):
+            return None
+        return _normalize_url(url)
+
+    @staticmethod
+    def normalize_urls(urls):
+        """Normalize a series of URLs with Utils.normalize_url, parsing each distinct URL once
+
+        Args:
+            urls (pandas.Series): the URLs
+
+        Returns:
+            pandas.Series: the normalized URLs with the index of urls, None for the discarded ones
+        """
+        codes, uniques = pd.factorize(urls)
+        normalized = np.array([Utils.normalize_url(url) for url in uniques] + [None], dtype=object)
+        return pd.Series(normalized[codes], index=urls.index, name=urls.name)
+
     @staticmethod
     def clean_urls(dataframe, url_column):
         """Clean the URLs
 
+        The URLs are normalized with Utils.normalize_url and the rows of the discarded URLs are removed. Compared to
+        the regular expressions used up to version 0.6.0:
+
+        - the tracking parameters are removed by key, the other parameters are kept wherever they are, so
+          ?ref=x&id=1 becomes ?id=1 instead of losing the whole query.
+        - the keys are matched whole and ignoring case, so ?referral=1 or ?mobile_app=1 are kept and ?REF=2 is
+          removed.
+        - only the query, the fragment and the end of the path are cleaned, so feed_id in the path is kept.
+        - the malformed URLs rejected by urllib.parse.urlsplit, like an unclosed IPv6 bracket, are removed.
+        - a wrapped redirect URL is cut at the last http:// or https://, not at the last http of the string, so
+          https://l.facebook.com/l.php?u=https://example.com/httpdocs/a becomes https://example.com/httpdocs/a instead
+          of being removed.
+        - the schemes are matched ignoring case and written in lowercase, so HTTPS://EXAMPLE.COM/a becomes
+          https://EXAMPLE.COM/a instead of being removed.
+
         Args:
             dataframe (pandas.DataFrame): the pandas dataframe of link posts
             url_column (str): the name of the dataframe column with the urls
@@ -14,66 +192,49 @@ class Utils:
         Returns:
             pandas.DataFrame: the dateframe with the cleaned urls
         """
-        pattern = [
-            '\\?utm_.*',
-            'feed_id.*',
-            '&_unique_id.*',
-            '\\?#.*',
-            '\\?ref.*',
-            '\\?fbclid.*',
-            '\\?rss.*',
-            '\\?ico.*',
-            '\\?recruiter.*',
-            '\\?sr_share_.*',
-            '\\?fb_rel.*',
-            '\\?social.*',
-            '\\?intcmp_.*',
-            '\\?xrs.*',
-            '\\?CMP.*',
-            '\\?tid.*',
-            '\\?ncid.*',
-            '&utm_.*',
-            '\\?rbs&utm_hp_ref.*',
-            '/#\\..*',
-            '\\?mobile.*',
-            '&fbclid.*',
-            '/$',
-            '#.*',
-            '\\?mbid.*',
-            '\\?platform',
-            '\\?__twitter_impression',
-            '\\/amp$',
-            '\\?amp$',
-            '\\/amp=.*',
-            '\\?verso.*',
-            '\\?mc_cid.*',
-            '\\?mc_eid.*',
-            '\\?source=TDB.*',
-            '\\?spMailingID.*',
-            '\\?mcd.*',
-            '\\?cd-origin=.*'
-            ]
-
-        dataframe[url_column] = dataframe[url_column].str.replace('|'.join(pattern), '', regex=True)
-        dataframe[url_column] = dataframe[url_column].str.replace('|'.join(pattern), '', regex=True)
-        dataframe[url_column] = dataframe[url_column].str.replace('|'.join(pattern), '', regex=True)
-
-        dataframe[url_column] = dataframe[url_column].str.replace('.*(http)', '\\1', regex=True)
-        dataframe[url_column] = dataframe[url_column].str.replace('\\/$', '', regex=True)
-        dataframe[url_column] = dataframe[url_column].str.replace('\\&$'.join(pattern), '', regex=True)
-
-         #Remove the URL query parameters and set NaN to protocols that aren't http or https
-        dataframe = dataframe.loc[dataframe[url_column].str.contains('^http://127.0.0.1|^https://127.0.0.1|http://localhost|https://localhost') == False]
-        dataframe = dataframe.loc[dataframe[url_column].str.contains('http://|https://')]
+        #Remove the URL tracking parameters and the rows with protocols that aren't http or https
+        dataframe[url_column] = Utils.normalize_urls(dataframe[url_column])
+        dataframe = dataframe.loc[dataframe[url_column].notna()]
 
         dataframe=dataframe.reset_index(drop=True)
         return dataframe
 
+    @staticmethod
+    def match_original_urls(urls, original_urls, mode='substring'):
+        """Flags the URLs that match one of the original URLs, ignoring case.
 
+        Every distinct URL is checked once and the result is mapped back to the series.
 
+        Args:
+            urls (pandas.Series): the URLs to flag, like the expanded URLs of the CrowdTangle shares.
+            original_urls (pandas.Series): the original URLs.
+            mode (str, optional): 'substring' flags the URLs contained in any original URL, searching all of them at
+                                  once with an Aho-Corasick automaton. 'exact' flags the URLs equal to an original URL
+                                  once both are normalized (surrounding spaces and trailing slashes removed) with a
+                                  hash set lookup. Defaults to 'substring'.
 
-
-
-
-
+        Returns:
+            pandas.Series: boolean series with the index of urls.
+        """
+        if mode not in ('substring', 'exact'):
+            raise Exception(f"Unknown mode {mode}, expected 'substring' or 'exact'")
+
+        unique_urls = pd.Series(urls.dropna().unique(), dtype=object)
+        if mode == 'exact':
+            def normalize(values):
+                return values.astype(str).str.strip().str.rstrip('/').str.upper()
+            originals = set(normalize(original_urls.dropna()))
+            flags = normalize(unique_urls).isin(originals).to_numpy()
+        else:
+            # same comparison of str.contains(case=False, regex=False), each upper cased pattern is searched once
+            texts = [url.upper() for url in original_urls.dropna()]
+            codes, patterns = pd.factorize(unique_urls.str.upper())
+            matches = np.zeros(len(patterns), dtype=bool)
+            empty = patterns == ''
+            matches[empty] = len(texts) > 0
+            non_empty = np.flatnonzero(~empty)
+            matches[non_empty] = _substring_matches(list(patterns[non_empty]), texts)
+            flags = matches[codes]
+
+        return urls.map(dict(zip(unique_urls, flags))).fillna(False).astype(bool)
 
@@ -1,3 +1,4 @@
+import json
 import pytest
 
 def pytest_addoption(parser):
@@ -9,3 +10,83 @@ def crowd_token(request):
     if crowd_token_value is None:
         pytest.skip()
     return crowd_token_value
+
+
+class CrowdTangleStub:
+    """Local HTTP server answering the CrowdTangle links endpoint with generated posts.
+
+    Every link gets `posts` posts. Links containing 'retry' answer 429 to their first request and
+    links containing 'error' always answer 500.
+    """
+
+    def __init__(self, posts=3):
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.posts = posts
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                from urllib.parse import parse_qs, urlparse
+                params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                stub.requests.append(params)
+                status, payload = stub.response(params)
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def post(self, link, number):
+        account = number % 2
+        return {
+            'id': f'{link}|{number}', 'platformId': f'{number}', 'platform': 'Facebook',
+            'date': f'2021-01-01 00:{number // 60:02d}:{number % 60:02d}', 'postUrl': f'{link}/post/{number}', 'type': 'link',
+            'expandedLinks': [{'original': link, 'expanded': link}],
+            'account': {'id': account, 'name': f'account {account}', 'handle': f'account{account}', 'subscriberCount': 10,
+                        'url': f'https://www.facebook.com/{account}', 'platform': 'Facebook', 'platformId': f'{account}',
+                        'accountType': 'facebook_page', 'pageAdminTopCountry': 'CO', 'verified': False},
+            'statistics': {'actual': {'likeCount': number, 'shareCount': 0}, 'expected': {'likeCount': 1, 'shareCount': 0}},
+        }
+
+    def response(self, params):
+        link = params['link']
+        if 'error' in link:
+            return 500, {'status': 500, 'code': 500, 'message': 'server error'}
+        if 'retry' in link and sum(1 for request in self.requests if request['link'] == link) == 1:
+            return 429, {'status': 429, 'code': 429, 'message': 'rate limited'}
+        offset = int(params.get('offset', 0))
+        count = int(params.get('count', 100))
+        numbers = range(offset, min(offset + count, self.posts))
+        pagination = {}
+        if offset + count < self.posts:
+            pagination['nextPage'] = f"{self.base_url}/links?link={link}&count={count}&offset={offset + count}"
+        return 200, {'status': 200, 'result': {'posts': [self.post(link, n) for n in numbers], 'pagination': pagination}}
+
+    def get_links(self, link, platforms='facebook', count=100, start_date=None, end_date=None, include_history=None,
+                  include_summary='false', offset=0, sortBy='date', api_token=None):
+        import requests
+        params = {'link': link, 'count': count, 'token': api_token, 'platforms': platforms, 'offset': offset, 'sortBy': sortBy}
+        return requests.get(f'{self.base_url}/links', params=params).json()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def crowdtangle_stub():
+    stub = CrowdTangleStub()
+    yield stub
+    stub.close()
@@ -1,7 +1,22 @@
+import gc
+import networkx as nx
+import json
+import numpy as np
 import pandas as pd
+from pycoornet._synthetic import make_shares, ring_recovery
+from pycoornet.cache import ResponseCache
 from pycoornet.crowdtangle import CrowdTangle
-from pycoornet.shared import Shared
+from pycoornet.export import GraphExport
+from pycoornet.profiling import Profiler
+import pycoornet.shared as shared_module
+from pycoornet.shared import Shared, _communities, _component_clusters, _coord_windows_loop, _coord_windows_vectorized, _share_table
+from pycoornet.sketch import QuantileSketch
+from pycoornet.statistics import Statistics
+from pycoornet.stream import SharedStream
+from pycoornet.utils import Utils
 import pytest
+from urllib.parse import urlparse
+import weakref
 
 
 @pytest.fixture
@@ -42,3 +57,495 @@ def test_estimate_coord_interval(sample_ct_df):
     else:
         assert False
 
+
+def test_coord_shares_vectorized_engine(sample_ct_df):
+    loop_df, loop_graph, loop_q = Shared(sample_ct_df).coord_shares(clean_urls=True)
+    vectorized_df, vectorized_graph, vectorized_q = Shared(sample_ct_df).coord_shares(clean_urls=True, engine='vectorized')
+    assert loop_df['is_coordinated'].equals(vectorized_df['is_coordinated'])
+    assert sorted(loop_graph.edges(data='weight')) == sorted(vectorized_graph.edges(data='weight'))
+    assert loop_q == vectorized_q
+
+def test_coord_windows_missing_accounts():
+    # u1 has one account and a share without account, u2 two accounts and a share without account
+    rows = [('u1', 'A', 0), ('u1', None, 5), ('u1', 'A', 8), ('u2', 'A', 0), ('u2', None, 3), ('u2', 'B', 6)]
+    shares_df = pd.DataFrame({'expanded': [url for url, _, _ in rows], 'account_url': [account for _, account, _ in rows],
+                              'date': [pd.Timestamp('2021-01-01') + pd.Timedelta(seconds=seconds) for _, _, seconds in rows]})
+    loop_df = _coord_windows_loop(shares_df, 60)
+    vectorized_df = _coord_windows_vectorized(shares_df, 60)
+    assert loop_df['url'].unique().tolist() == ['u2']
+    pd.testing.assert_frame_equal(vectorized_df, loop_df, check_dtype=False)
+
+def test_coord_shares_n_jobs(sample_ct_df):
+    single_df, single_graph, single_q = Shared(sample_ct_df).coord_shares(clean_urls=True, engine='vectorized')
+    parallel_df, parallel_graph, parallel_q = Shared(sample_ct_df).coord_shares(clean_urls=True, engine='vectorized', n_jobs=2)
+    assert single_df.equals(parallel_df)
+    assert sorted(single_graph.edges(data='weight')) == sorted(parallel_graph.edges(data='weight'))
+
+    single_df, _, _ = Shared(sample_ct_df).coord_shares_differential(clean_urls=True)
+    parallel_df, _, _ = Shared(sample_ct_df).coord_shares_differential(clean_urls=True, n_jobs=2)
+    assert single_df.equals(parallel_df)
+
+def test_coord_shares_sparse_graph_backend(sample_ct_df):
+    _, networkx_graph, networkx_q = Shared(sample_ct_df).coord_shares(clean_urls=True, engine='vectorized')
+    _, sparse_graph, sparse_q = Shared(sample_ct_df).coord_shares(clean_urls=True, engine='vectorized', graph_backend='sparse')
+    assert networkx_q == sparse_q
+    assert {frozenset((u, v)): w for u, v, w in networkx_graph.edges(data='weight')} == {frozenset((u, v)): w for u, v, w in sparse_graph.edges(data='weight')}
+    assert dict(networkx_graph.nodes(data='strength')) == dict(sparse_graph.nodes(data='strength'))
+    assert dict(networkx_graph.nodes(data='component')) == dict(sparse_graph.nodes(data='component'))
+
+def test_coord_shares_node_attributes(sample_ct_df):
+    _, highly_connected_graph, _ = Shared(sample_ct_df).coord_shares(clean_urls=True, engine='vectorized')
+    node, attributes = next(iter(highly_connected_graph.nodes(data=True)))
+    assert list(attributes) == ['bipartite', 'shares', 'coord_shares', 'avg_account_subscriber_count', 'account_platform',
+                                'account_name', 'account_verified', 'account_handle', 'name_changed', 'handle_changed',
+                                'page_admin_top_country_changed', 'account_page_admin_top_country', 'account_account_type',
+                                'component', 'cluster', 'degree', 'strength']
+    assert attributes['shares'] == (sample_ct_df['account_url'] == node).sum()
+
+def test_coord_shares_timestamps(sample_ct_df):
+    _, highly_connected_graph, _ = Shared(sample_ct_df).coord_shares(clean_urls=True, engine='vectorized', gtimestamps=True)
+    for u, v, attributes in highly_connected_graph.edges(data=True):
+        assert len(attributes['timestamp_coord_share']) == attributes['weight']
+        assert attributes['timestamp_first_coord_share'] == min(attributes['timestamp_coord_share'])
+        assert attributes['timestamp_last_coord_share'] == max(attributes['timestamp_coord_share'])
+
+    _, table_graph, _ = Shared(sample_ct_df).coord_shares(clean_urls=True, engine='vectorized', gtimestamps='table', graph_backend='sparse')
+    timestamps_df = table_graph.graph['coord_share_timestamps']
+    assert list(timestamps_df.columns) == ['u', 'v', 'url', 'timestamp']
+    assert timestamps_df.shape[0] == sum(w for _, _, w in table_graph.edges(data='weight'))
+
+def test_crowdtangle_concurrent_workers(crowdtangle_stub):
+    urls_df = pd.DataFrame({'url': [f'https://example.com/{name}' for name in ['a', 'retry', 'b', 'error', 'c']],
+                            'date': '2021-01-01'})
+    crowd_tangle = CrowdTangle('token', get_links=crowdtangle_stub.get_links)
+    shares_df = crowd_tangle.get_shares(urls=urls_df, workers=3, max_calls=6000, max_retries=2, retry_backoff=0.01)
+    assert list(shares_df['expanded'].unique()) == ['https://example.com/a', 'https://example.com/retry',
+                                                    'https://example.com/b', 'https://example.com/c']
+    links = [request['link'] for request in crowdtangle_stub.requests]
+    assert links.count('https://example.com/retry') == 2
+    assert links.count('https://example.com/error') == 3
+
+def test_crowdtangle_pagination(crowdtangle_stub):
+    crowdtangle_stub.posts = 7
+    urls_df = pd.DataFrame({'url': ['https://example.com/a', 'https://example.com/b'], 'date': '2021-01-01'})
+    crowd_tangle = CrowdTangle('token', get_links=crowdtangle_stub.get_links)
+
+    shares_df = crowd_tangle.get_shares(urls=urls_df, nmax=3, max_calls=6000)
+    assert shares_df.groupby('expanded').size().to_list() == [7, 7]
+
+    shares_df = crowd_tangle.get_shares(urls=urls_df, nmax=3, max_calls=6000, max_pages=2)
+    assert shares_df.groupby('expanded').size().to_list() == [6, 6]
+
+    pages = list(crowd_tangle.get_link_pages('https://example.com/a', nmax=3, max_calls=6000, max_posts=5))
+    assert [len(posts) for posts in pages] == [3, 2]
+
+def test_crowdtangle_pages_released(crowdtangle_stub):
+    class Page(dict):
+        pass
+
+    # raw responses alive when every page is requested
+    responses = []
+    alive = []
+    def get_links(**params):
+        gc.collect()
+        alive.append(sum(response() is not None for response in responses))
+        page = Page(crowdtangle_stub.get_links(**params))
+        responses.append(weakref.ref(page))
+        return page
+
+    crowdtangle_stub.posts = 10
+    crowd_tangle = CrowdTangle('token', get_links=get_links)
+    shares_df = crowd_tangle.get_shares(urls=pd.DataFrame({'url': ['https://example.com/a'], 'date': '2021-01-01'}), nmax=2, max_calls=6000)
+    assert shares_df.shape[0] == 10
+    assert alive == [0, 1, 1, 1, 1]
+
+def test_crowdtangle_response_cache(crowdtangle_stub, tmp_path):
+    urls_df = pd.DataFrame({'url': ['https://example.com/a', 'https://example.com/b'], 'date': '2021-01-01'})
+    crowd_tangle = CrowdTangle('token', get_links=crowdtangle_stub.get_links)
+    cache = ResponseCache(tmp_path / 'ct_cache.sqlite')
+
+    cold_df = crowd_tangle.get_shares(urls=urls_df.iloc[:1], max_calls=6000, cache=cache)
+    assert len(crowdtangle_stub.requests) == 1
+
+    # resume with one more url: only the uncached one reaches the api
+    shares_df = crowd_tangle.get_shares(urls=urls_df, max_calls=6000, cache=cache)
+    assert [request['link'] for request in crowdtangle_stub.requests] == ['https://example.com/a', 'https://example.com/b']
+    assert shares_df[shares_df['expanded'] == 'https://example.com/a'].reset_index(drop=True).equals(cold_df)
+
+    crowd_tangle.get_shares(urls=urls_df, max_calls=6000, cache=tmp_path / 'ct_cache.sqlite')
+    assert len(crowdtangle_stub.requests) == 2
+
+    small_cache = ResponseCache(tmp_path / 'small_cache.sqlite', max_size=1)
+    small_cache.set({'link': 'a'}, {'status': 200})
+    assert len(small_cache) == 0
+    expired_cache = ResponseCache(tmp_path / 'expired_cache.sqlite', ttl=-1)
+    expired_cache.set({'link': 'a'}, {'status': 200})
+    assert expired_cache.get({'link': 'a'}) is None
+
+def test_match_original_urls(sample_ct_df, sample_source_df):
+    expanded = sample_ct_df['expanded']
+    original_urls = sample_source_df['clean_url']
+    expected = expanded.apply(lambda x: bool(original_urls.str.contains(x, case=False, regex=False).sum()))
+    assert Utils.match_original_urls(expanded, original_urls).equals(expected)
+
+    urls = pd.Series(['HTTPS://example.com/a/', 'example.com', 'https://example.com/b', None])
+    original_urls = pd.Series(['https://example.com/a', 'https://Example.com/c'])
+    assert Utils.match_original_urls(urls, original_urls).to_list() == [False, True, False, False]
+    assert Utils.match_original_urls(urls, original_urls, mode='exact').to_list() == [True, False, False, False]
+
+def test_clean_urls_corpus():
+    corpus_df = pd.read_csv('tests/data/clean_urls_corpus.csv', dtype=str, keep_default_na=False)
+    expected = corpus_df['expected'].where(corpus_df['expected'] != '', None)
+    assert Utils.normalize_urls(corpus_df['url']).equals(expected.rename('url'))
+
+    cleaned_df = Utils.clean_urls(corpus_df.copy(), 'url')
+    assert cleaned_df['url'].to_list() == expected.dropna().to_list()
+
+    # parameters are removed by key, the rest of the query is kept
+    assert Utils.normalize_url('https://example.com/a/?utm_source=fb&id=1&fbclid=2#top') == 'https://example.com/a/?id=1'
+
+def test_shared_stream(sample_ct_df, tmp_path):
+    analyzed_df, _, _ = Shared(sample_ct_df).coord_shares_differential(coordination_interval=600, clean_urls=True)
+    coordinated_df = analyzed_df[analyzed_df['is_coordinated']]
+
+    shares_df = sample_ct_df.assign(date=pd.to_datetime(sample_ct_df['date'])).sort_values('date', kind='mergesort')
+    stream = SharedStream(600, clean_urls=True)
+    batches = []
+    for batch_df in (shares_df.iloc[:150], shares_df.iloc[150:400], shares_df.iloc[400:]):
+        batches.append(stream.update(batch_df))
+        # checkpoint and restart between batches
+        stream.save(tmp_path / 'stream.json')
+        stream = SharedStream.load(tmp_path / 'stream.json')
+    stream_df = pd.concat(batches)
+
+    assert set(zip(stream_df['expanded'], stream_df['account_url'], stream_df['date'])) == \
+        set(zip(coordinated_df['expanded'], coordinated_df['account_url'], coordinated_df['date']))
+
+    # the weights count the groups of consecutive coordinated shares of a URL both accounts are in
+    coordinated_df = coordinated_df.sort_values(['expanded', 'date'], kind='mergesort')
+    new_group = (coordinated_df['expanded'] != coordinated_df['expanded'].shift()) | (coordinated_df['date'].diff() > pd.Timedelta(seconds=600))
+    group_accounts = coordinated_df.groupby(new_group.cumsum().to_numpy())['account_url'].agg(lambda accounts: sorted(set(accounts)))
+    weights = {}
+    for accounts in group_accounts:
+        for i, a in enumerate(accounts):
+            for b in accounts[i + 1:]:
+                weights[frozenset((a, b))] = weights.get(frozenset((a, b)), 0) + 1
+    assert {frozenset((a, b)): w for a, b, w in stream.weights().itertuples(index=False)} == weights
+    stream_graph, stream_q = stream.graph(percentile_edge_weight=90)
+    assert stream_q == np.percentile(list(weights.values()), 90)
+
+    with pytest.raises(Exception):
+        stream.update(shares_df.iloc[:1])
+
+def test_shared_stream_group_weights(sample_ct_df):
+    # u1 has two bursts a day apart, u2 one burst, and a share of u3 has no account
+    rows = [('u1', 'A', 0), ('u1', 'B', 10), ('u1', 'C', 86400), ('u1', 'D', 86410), ('u2', 'A', 50), ('u2', 'C', 60), ('u3', None, 100), ('u3', 'B', 105)]
+    shares_df = sample_ct_df.iloc[:len(rows)].copy()
+    shares_df['id'] = range(len(rows))
+    shares_df['expanded'] = [f'https://example.com/{url}' for url, _, _ in rows]
+    shares_df['account_url'] = [account for _, account, _ in rows]
+    shares_df['date'] = [pd.Timestamp('2021-01-01') + pd.Timedelta(seconds=seconds) for _, _, seconds in rows]
+
+    stream = SharedStream(60)
+    assert stream.update(shares_df).shape[0] == len(rows)
+    assert {frozenset((a, b)): w for a, b, w in stream.weights().itertuples(index=False)} == \
+        {frozenset('AB'): 1, frozenset('CD'): 1, frozenset('AC'): 1}
+
+    # coord_shares_differential pairs all the accounts of u1, whatever their burst
+    _, graph, _ = Shared(shares_df[shares_df['account_url'].notna()]).coord_shares_differential(60, percentile_edge_weight=0)
+    assert {frozenset((u, v)): w for u, v, w in graph.edges(data='weight')} == \
+        {frozenset('AB'): 1, frozenset('AC'): 2, frozenset('AD'): 1, frozenset('BC'): 1, frozenset('BD'): 1, frozenset('CD'): 1}
+
+def test_shared_stream_bounded_state():
+    # a long stream of URLs shared by 3 accounts of a pool of 10 within a minute, one URL every 10 minutes
+    accounts = [f'https://facebook.com/{i}' for i in range(10)]
+    stream = SharedStream(60)
+    state_sizes = []
+    for batch in range(20):
+        rows = []
+        for url in range(batch * 50, (batch + 1) * 50):
+            for k in range(3):
+                rows.append({'id': url * 3 + k, 'expanded': f'https://example.com/{url}', 'account_url': accounts[(url + k * 3) % 10],
+                             'date': pd.Timestamp('2021-01-01') + pd.Timedelta(minutes=10 * url, seconds=10 * k)})
+        assert stream.update(pd.DataFrame(rows)).shape[0] == 150
+        state = stream.to_dict()
+        state_sizes.append((len(state['last_shares']), len(state['group_accounts']), len(state['weights'])))
+
+    assert state_sizes[-1] == state_sizes[1]
+    assert state_sizes[-1][0] <= 1 and state_sizes[-1][1] <= 1
+    assert stream.weights()['weight'].sum() == 1000 * 3
+
+def test_coord_shares_parquet(sample_ct_df, tmp_path):
+    Shared.write_parquet(sample_ct_df, tmp_path / 'shares', n_partitions=4, clean_urls=True)
+    shared = Shared.from_parquet(tmp_path / 'shares')
+    assert shared.estimate_coord_interval(clean_urls=True)[1] == Shared(sample_ct_df).estimate_coord_interval(clean_urls=True)[1]
+
+    memory_df, memory_graph, memory_q = Shared(sample_ct_df).coord_shares(clean_urls=True, engine='vectorized')
+    parquet_df, parquet_graph, parquet_q = shared.coord_shares(clean_urls=True, engine='vectorized')
+    assert parquet_q == memory_q
+    assert sorted(parquet_df['id']) == sorted(memory_df.loc[memory_df['is_coordinated'], 'id'])
+    assert sorted(parquet_graph.edges(data='weight')) == sorted(memory_graph.edges(data='weight'))
+    assert dict(parquet_graph.nodes(data='shares')) == dict(memory_graph.nodes(data='shares'))
+
+def test_coord_shares_parquet_pool(sample_ct_df, tmp_path, monkeypatch):
+    Shared.write_parquet(sample_ct_df, tmp_path / 'shares', n_partitions=4, clean_urls=True)
+    pools = []
+
+    class CountingPool(shared_module.ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            pools.append(self)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(shared_module, 'ProcessPoolExecutor', CountingPool)
+    parquet_df, _, _ = Shared.from_parquet(tmp_path / 'shares').coord_shares(clean_urls=True, engine='vectorized', n_jobs=2)
+    memory_df, _, _ = Shared(sample_ct_df).coord_shares(clean_urls=True, engine='vectorized')
+    assert len(pools) == 1
+    assert sorted(parquet_df['id']) == sorted(memory_df.loc[memory_df['is_coordinated'], 'id'])
+
+def test_share_table(sample_ct_df):
+    shares_df = _share_table(sample_ct_df, clean_urls=True)
+    assert shares_df['expanded'].dtype == 'category' and shares_df['account_url'].dtype == 'category'
+    assert shares_df['expanded'].value_counts().min() > 1
+    decoded_df = sample_ct_df.iloc[shares_df['position']]
+    assert (decoded_df['account_url'].to_numpy() == shares_df['account_url'].to_numpy()).all()
+    assert (Utils.normalize_urls(decoded_df['expanded']).to_numpy() == shares_df['expanded'].to_numpy()).all()
+    assert (shares_df.groupby('expanded', observed=True)['date'].rank(method='first') == shares_df['rank']).all()
+    assert (shares_df['first_share_offset'] == shares_df['date'] - shares_df.groupby('expanded', observed=True)['date'].transform('min')).all()
+
+    with pytest.raises(Exception):
+        _share_table(sample_ct_df.assign(is_orig=False), keep_ourl_only=True)
+
+def test_share_table_reused(sample_ct_df, monkeypatch):
+    calls = []
+    normalize_urls = Utils.normalize_urls
+    monkeypatch.setattr(Utils, 'normalize_urls', lambda urls: calls.append(len(urls)) or normalize_urls(urls))
+
+    shared = Shared(sample_ct_df)
+    coordinated_df, _, _ = shared.coord_shares(clean_urls=True, engine='vectorized')
+    differential_df, _, _ = shared.coord_shares_differential(clean_urls=True)
+    assert len(calls) == 1
+
+    # the cached table isn't modified by the detectors
+    assert coordinated_df.equals(shared.coord_shares(clean_urls=True, engine='vectorized')[0])
+    assert len(calls) == 1
+
+def test_sweep(sample_ct_df, tmp_path):
+    shared = Shared(sample_ct_df)
+    sweep_df = shared.sweep([60, 600], [50, 90], clean_urls=True)
+    assert sweep_df.shape[0] == 4
+
+    for row in sweep_df.itertuples():
+        analyzed_df, highly_connected_graph, q = shared.coord_shares_differential(coordination_interval=row.coordination_interval, percentile_edge_weight=row.percentile_edge_weight, clean_urls=True)
+        assert row.q == q
+        assert row.coordinated_shares == analyzed_df['is_coordinated'].sum()
+        assert (row.nodes, row.edges) == (highly_connected_graph.number_of_nodes(), highly_connected_graph.number_of_edges())
+        assert row.components == nx.number_connected_components(highly_connected_graph)
+
+    Shared.write_parquet(sample_ct_df, tmp_path / 'shares', n_partitions=4, clean_urls=True)
+    pd.testing.assert_frame_equal(Shared.from_parquet(tmp_path / 'shares').sweep([60, 600], [50, 90], clean_urls=True), sweep_df)
+
+    with pytest.raises(Exception):
+        shared.sweep([0, 600])
+
+def test_quantile_sketch():
+    values = np.random.default_rng(0).exponential(100, 100000)
+    sketch = QuantileSketch(k=200)
+    for chunk in np.array_split(values, 20):
+        sketch.update(chunk)
+    for q in (0.1, 0.5, 0.9):
+        assert abs((values <= sketch.quantile(q)).mean() - q) < 0.02
+    assert sketch.describe()['count'] == len(values)
+    assert sketch.describe()['max'] == values.max()
+
+    # exact while no value has been compacted, and mergeable
+    small, other = QuantileSketch(k=200), QuantileSketch(k=200)
+    small.update(values[:100])
+    other.update(values[100:150])
+    small.merge(other)
+    assert small.quantile(0.3) == pd.Series(values[:150]).quantile(0.3)
+    assert QuantileSketch.from_dict(sketch.to_dict()).quantile(0.5) == sketch.quantile(0.5)
+
+def test_estimate_coord_interval_sketch(sample_ct_df):
+    shared = Shared(sample_ct_df)
+    summary, coordination_interval = shared.estimate_coord_interval(clean_urls=True)
+    sketch_summary, sketch_coordination_interval = shared.estimate_coord_interval(clean_urls=True, method='sketch')
+    assert sketch_coordination_interval == coordination_interval
+    assert sketch_summary['count'] == summary['count']
+
+    with pytest.raises(Exception):
+        shared.estimate_coord_interval(method='tdigest')
+
+def test_communities():
+    graph = nx.Graph()
+    for offset, size in ((0, 12), (100, 30), (200, 3)):
+        graph.add_weighted_edges_from((f"a{offset + i}", f"a{offset + j}", 1 + (i + j) % 3) for i in range(size) for j in range(i + 1, size) if (i * j) % 4 != 1)
+
+    communities_df = _communities(graph, seed=1)
+    # components and clusters are labelled by decreasing size
+    assert communities_df.groupby('component')['node'].size().to_list() == [30, 12, 3]
+    assert communities_df['cluster'].is_monotonic_increasing
+    assert (communities_df.groupby('cluster')['component'].nunique() == 1).all()
+    pd.testing.assert_frame_equal(_communities(graph, seed=1, n_jobs=2), communities_df)
+
+    leiden_df = _communities(graph, clustering='leiden', seed=1)
+    for _, cluster_nodes in leiden_df.groupby('cluster')['node']:
+        assert nx.is_connected(graph.subgraph(cluster_nodes))
+
+    single_df = _communities(graph, clustering=lambda component, seed=None: dict.fromkeys(component, 0))
+    assert (single_df['cluster'] == single_df['component'] - 1).all()
+
+def test_communities_edge_order():
+    shares_df, _ = make_shares(5000, n_rings=3, seed=1)
+    _, graph, _ = Shared(shares_df).coord_shares(60, percentile_edge_weight=50, engine='vectorized', graph_backend='sparse', seed=1)
+    communities_df = _communities(graph, seed=1)
+    assert communities_df['component'].nunique() > 1
+
+    # every component is clustered with its edges in the order of graph.subgraph, so the seeded labels don't change
+    for component, component_df in communities_df.groupby('component'):
+        clusters = _component_clusters(list(graph.subgraph(component_df['node']).edges(data='weight', default=1)), 'louvain', 1)
+        assert sorted(sorted(nodes) for nodes in clusters) == sorted(sorted(nodes) for nodes in component_df.groupby('cluster')['node'].agg(list))
+
+def test_clustering_checks(sample_ct_df, monkeypatch, caplog):
+    with pytest.raises(Exception, match='worker processes'):
+        Shared(sample_ct_df).coord_shares(clean_urls=True, engine='vectorized', n_jobs=2, clustering=lambda component, seed=None: dict.fromkeys(component, 0))
+
+    monkeypatch.setattr(shared_module, 'leidenalg', None)
+    Shared(sample_ct_df).coord_shares(clean_urls=True, engine='vectorized', clustering='leiden', seed=1)
+    assert any('leidenalg is not installed' in record.message for record in caplog.records if record.levelname == 'WARNING')
+
+def test_graph_export(sample_ct_df, tmp_path):
+    _, highly_connected_graph, _ = Shared(sample_ct_df).coord_shares(clean_urls=True, engine='vectorized', gtimestamps=True, seed=1)
+
+    GraphExport.write_parquet(highly_connected_graph, tmp_path / 'graph')
+    nodes_df, edges_df = GraphExport.read_parquet(tmp_path / 'graph')
+    assert nodes_df.shape[0] == highly_connected_graph.number_of_nodes()
+    assert sorted(zip(edges_df['u'], edges_df['v'], edges_df['weight'])) == sorted(highly_connected_graph.edges(data='weight'))
+    assert len(edges_df['timestamp_coord_share'].iloc[0]) > 0
+
+    GraphExport.write_graphml((nodes_df, edges_df), tmp_path / 'graph.graphml')
+    graphml_graph = nx.read_graphml(tmp_path / 'graph.graphml')
+    assert dict(graphml_graph.nodes(data='component')) == dict(highly_connected_graph.nodes(data='component'))
+    assert {frozenset((u, v)): w for u, v, w in graphml_graph.edges(data='weight')} == \
+        {frozenset((u, v)): w for u, v, w in highly_connected_graph.edges(data='weight')}
+
+    GraphExport.write_gexf(highly_connected_graph, tmp_path / 'graph.gexf')
+    gexf_graph = nx.read_gexf(tmp_path / 'graph.gexf')
+    assert dict(gexf_graph.nodes(data='label')) == dict(highly_connected_graph.nodes(data='account_name'))
+    assert gexf_graph.number_of_edges() == highly_connected_graph.number_of_edges()
+
+    # control characters of the account names are not allowed in XML 1.0
+    node = next(iter(highly_connected_graph.nodes))
+    highly_connected_graph.nodes[node]['account_name'] = 'bad\x01name\x1f'
+    GraphExport.write_graphml(highly_connected_graph, tmp_path / 'control.graphml')
+    assert nx.read_graphml(tmp_path / 'control.graphml').nodes[node]['account_name'] == 'badname'
+    GraphExport.write_gexf(highly_connected_graph, tmp_path / 'control.gexf')
+    assert nx.read_gexf(tmp_path / 'control.gexf').nodes[node]['label'] == 'badname'
+
+def test_component_summary(sample_ct_df):
+    crowdtangle_shares_df, highly_connected_graph, _ = Shared(sample_ct_df).coord_shares(clean_urls=True, engine='vectorized', seed=1)
+    summary_df = Statistics.component_summary(crowdtangle_shares_df, highly_connected_graph)
+
+    components = pd.Series(dict(highly_connected_graph.nodes(data='component')))
+    assert summary_df.set_index('component')['entities'].to_dict() == components.value_counts().to_dict()
+    assert summary_df['gini_full_domain'].between(0, 1).all()
+
+    coordinated_df = crowdtangle_shares_df[crowdtangle_shares_df['is_coordinated'] & crowdtangle_shares_df['account_url'].isin(components.index)]
+    full_domains = coordinated_df['expanded'].map(lambda url: urlparse(url).netloc)
+    assert summary_df['unique_full_domain'].sum() == full_domains.nunique()
+    assert summary_df['top_full_domain'].iloc[0][0] == full_domains.value_counts().index[0]
+
+def test_get_top_coord_urls(sample_ct_df):
+    crowdtangle_shares_df, highly_connected_graph, _ = Shared(sample_ct_df).coord_shares(clean_urls=True, engine='vectorized', seed=1)
+    urls_df = Statistics.get_top_coord_urls(crowdtangle_shares_df, highly_connected_graph)
+
+    coordinated_df = crowdtangle_shares_df[crowdtangle_shares_df['is_coordinated'] & crowdtangle_shares_df['account_url'].isin(list(highly_connected_graph.nodes))]
+    assert urls_df['expanded'].to_list() == sorted(coordinated_df['expanded'].unique())
+    assert urls_df['count'].dtype == 'int64'
+    url = urls_df['expanded'].iloc[0]
+    assert list(urls_df['coor_account_url'].iloc[0]) == sorted(coordinated_df.loc[coordinated_df['expanded'] == url, 'account_url'].unique())
+    assert urls_df['count'].iloc[0] == (crowdtangle_shares_df['expanded'] == url).sum()
+
+    top_df = Statistics.get_top_coord_urls(crowdtangle_shares_df, highly_connected_graph, top_n=1)
+    assert top_df['expanded'].to_list() == [urls_df.loc[urls_df['engagement'].idxmax(), 'expanded']]
+
+def test_get_top_coord_urls_missing_names(sample_ct_df):
+    crowdtangle_shares_df, highly_connected_graph, _ = Shared(sample_ct_df).coord_shares(clean_urls=True, engine='vectorized', seed=1)
+    urls_df = Statistics.get_top_coord_urls(crowdtangle_shares_df, highly_connected_graph)
+    url = urls_df['expanded'].iloc[0]
+    url_shares = crowdtangle_shares_df['expanded'] == url
+
+    missing_df = crowdtangle_shares_df.copy()
+    missing_df['account_name'] = missing_df['account_name'].astype(object)
+    missing_df.loc[url_shares.to_numpy() & (missing_df['account_url'] == missing_df.loc[url_shares, 'account_url'].iloc[0]).to_numpy(), 'account_name'] = None
+    missing_urls_df = Statistics.get_top_coord_urls(missing_df, highly_connected_graph)
+
+    names = missing_df.loc[url_shares, 'account_name'].dropna()
+    assert list(missing_urls_df['account_name'].iloc[0]) == sorted(names.unique())
+    assert missing_urls_df['expanded'].to_list() == urls_df['expanded'].to_list()
+
+    missing_df['account_name'] = None
+    assert all(len(names) == 0 for names in Statistics.get_top_coord_urls(missing_df, highly_connected_graph)['coor_account_name'])
+
+
+def test_planted_rings():
+    shares_df, rings = make_shares(5000, n_rings=3, seed=1)
+    assert shares_df['date'].is_monotonic_increasing
+    assert len(rings) == 3 and len(set(rings[0]) & set(shares_df['account_url'])) == len(rings[0])
+
+    # the windows can split the shares of a ring, so not every ring edge has the largest weight
+    _, graph, _ = Shared(shares_df).coord_shares(60, percentile_edge_weight=50, engine='vectorized', graph_backend='sparse')
+    assert ring_recovery(graph, rings)['rings'] == 1.0
+    _, graph, _ = Shared(shares_df).coord_shares_differential(60, percentile_edge_weight=50)
+    assert ring_recovery(graph, rings)['rings'] == 1.0
+
+
+def test_profiler(sample_ct_df, crowdtangle_stub, tmp_path):
+    records = []
+    profiler = Profiler(sink=records.append)
+    crowdtangle_shares_df, highly_connected_graph, _ = Shared(sample_ct_df, profiler=profiler).coord_shares(clean_urls=True, engine='vectorized')
+    timing_df = pd.DataFrame(highly_connected_graph.graph['timing'])
+    assert timing_df['name'].iloc[0] == 'coord_shares' and timing_df['depth'].iloc[0] == 0
+    assert {'estimate_coord_interval', 'share_table', 'detect', 'flag_shares', 'project', 'communities'} <= set(timing_df['name'])
+    detect = timing_df[timing_df['name'] == 'detect'].iloc[0]
+    assert detect['depth'] == 1 and detect['rows_out'] > 0 and detect['wall_time'] >= 0
+    assert crowdtangle_shares_df.attrs['timing'] == highly_connected_graph.graph['timing']
+    assert [record['span_id'] for record in records] == [record['span_id'] for record in profiler.records]
+
+    summary_df = Statistics.component_summary(crowdtangle_shares_df, highly_connected_graph, profiler=profiler)
+    assert [record['name'] for record in summary_df.attrs['timing']] == ['component_summary', 'domains', 'entities', 'domain_summary']
+
+    # the attrs of profiled results hold plain values, pandas compares them when it combines dataframes
+    summary_df = Statistics.component_summary(crowdtangle_shares_df, highly_connected_graph, profiler=profiler)
+    assert pd.concat([summary_df, summary_df]).shape[0] == 2 * summary_df.shape[0]
+    json.dumps(summary_df.attrs['timing'], default=str)
+
+    sink_path = tmp_path / 'spans.jsonl'
+    crowdtangle_stub.posts = 3
+    crowd_tangle = CrowdTangle('token', get_links=crowdtangle_stub.get_links, profiler=Profiler(sink=str(sink_path), span_format='otel'))
+    shares_df = crowd_tangle.get_shares(urls=pd.DataFrame({'url': ['https://example.com/a'], 'date': '2021-01-01'}), max_calls=6000)
+    spans = [json.loads(line) for line in sink_path.read_text().splitlines()]
+    assert spans[-1]['name'] == 'get_shares' and spans[-1]['parent_id'] is None
+    assert spans[0]['name'] == 'fetch' and spans[0]['parent_id'] == spans[-1]['context']['span_id']
+    assert spans[0]['attributes']['pycoornet.rows_out'] == 3
+    assert shares_df.attrs['timing'][0]['name'] == 'get_shares'
+
+    # a disabled profiler doesn't measure anything
+    _, highly_connected_graph, _ = Shared(sample_ct_df).coord_shares(clean_urls=True, engine='vectorized')
+    assert 'timing' not in highly_connected_graph.graph
+
+
+def test_coord_shares_exact_flags():
+    shares_df, _ = make_shares(20000, seed=3)
+    crowdtangle_shares_df, _, _ = Shared(shares_df).coord_shares(60, engine='vectorized', graph_backend='sparse')
+
+    shares_table_df = _share_table(shares_df).sort_values('position', ignore_index=True)
+    coordinated_shares_df = _coord_windows_vectorized(shares_table_df, 60)
+    coordinated = set(zip(coordinated_shares_df['url'], coordinated_shares_df['share_date'], coordinated_shares_df['account_url']))
+    expected = [share in coordinated for share in zip(crowdtangle_shares_df['expanded'], crowdtangle_shares_df['date'], crowdtangle_shares_df['account_url'])]
+    assert crowdtangle_shares_df['is_coordinated'].to_list() == expected
+
+    # url, date and account found in the coordinated shares, but not in the same share
+    separate = (crowdtangle_shares_df['expanded'].isin(coordinated_shares_df['url'])
+                & crowdtangle_shares_df['date'].isin(coordinated_shares_df['share_date'])
+                & crowdtangle_shares_df['account_url'].isin(coordinated_shares_df['account_url']))
+    assert (separate & ~crowdtangle_shares_df['is_coordinated']).any()